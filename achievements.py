@@ -13,8 +13,10 @@ logger = logging.getLogger(__name__)
 class AchievementSystem:
     """Система управления достижениями"""
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, leaderboard=None):
         self.db = db_connection
+        # Таблица лидеров в памяти API (leaderboard.Leaderboard), если есть
+        self.leaderboard = leaderboard
         
     async def check_achievements(self, user_id: int, action: str, **kwargs) -> List[Dict]:
         """
@@ -127,11 +129,15 @@ class AchievementSystem:
         """Проверить условие достижения рейтинга"""
         required_rating = condition["value"]
         
-        result = await self.db.fetchval(
-            "SELECT rating FROM ratings WHERE user_id = $1",
-            user_id
-        )
-        current_rating = result or 0
+        # Таблица лидеров учитывает и еще не записанные приращения (write-behind)
+        if self.leaderboard is not None and self.leaderboard.is_loaded:
+            current_rating = self.leaderboard.rating(user_id)
+        else:
+            result = await self.db.fetchval(
+                "SELECT rating FROM ratings WHERE user_id = $1",
+                user_id
+            )
+            current_rating = result or 0
         
         print(f"🔍 Проверка рейтинга: пользователь {user_id}, текущий рейтинг: {current_rating}, требуется: {required_rating}, результат: {current_rating >= required_rating}")
         
@@ -173,7 +179,7 @@ class AchievementSystem:
         
         # Получаем количество жалоб
         complaints = await self.db.fetchval(
-            "SELECT COUNT(*) FROM complaints WHERE original_user_id = $1",
+            "SELECT complaints_count FROM users WHERE user_id = $1",
             user_id
         ) or 0
         
@@ -183,6 +189,9 @@ class AchievementSystem:
         """Проверить условие позиции в топе"""
         required_position = condition["position"]
         
+        if self.leaderboard is not None and self.leaderboard.is_loaded:
+            return self.leaderboard.rank(user_id) <= required_position
+        
         # Получаем позицию пользователя в рейтинге
         result = await self.db.fetchval("""
             SELECT COUNT(*) + 1
@@ -1,7 +1,6 @@
 import os
 import asyncio
 import logging
-import aiohttp
 import asyncpg
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
@@ -9,6 +8,8 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from backend_client import BackendClient
+from webhook_server import WebhookServer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +20,11 @@ ADMIN_BOT_TOKEN = os.getenv("ADMIN_BOT_TOKEN")
 
 BACKEND_URL = os.getenv("BACKEND_URL")
 
+# Получение обновлений: polling или webhook; у админ-бота свой путь и порт
+ADMIN_BOT_UPDATE_MODE = os.getenv("ADMIN_BOT_UPDATE_MODE", "polling").lower()
+ADMIN_WEBHOOK_PATH = os.getenv("ADMIN_WEBHOOK_PATH", "/telegram/admin-webhook")
+ADMIN_WEBHOOK_PORT = int(os.getenv("ADMIN_WEBHOOK_PORT", "8081"))
+
 if not ADMIN_BOT_TOKEN:
     logger.error("ADMIN_BOT_TOKEN not set!")
     exit(1)
@@ -43,6 +49,7 @@ logger.info(f"📊 Database: {DB_HOST}:{DB_PORT}/{DB_NAME}")
 
 bot = Bot(token=ADMIN_BOT_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
+backend = BackendClient(BACKEND_URL)
 
 class AdminStates(StatesGroup):
     waiting_nickname = State()
@@ -85,17 +92,7 @@ def get_unblock_keyboard(user_id: int):
 
 async def api_request(endpoint: str, data: dict):
     """HTTP запрос к API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{BACKEND_URL}/{endpoint}", json=data) as response:
-                if response.status != 200:
-                    logger.error(f"API returned status {response.status} for {endpoint}")
-                    return {"status": "error", "message": f"HTTP {response.status}"}
-                result = await response.json()
-                return result
-    except Exception as e:
-        logger.error(f"API error for {endpoint}: {e}")
-        return {"status": "error", "message": str(e)}
+    return await backend.request(endpoint, data)
 
 @dp.message(Command("start"))
 async def start(message: types.Message, state: FSMContext):
@@ -157,7 +154,7 @@ async def handle_nickname_search(message: types.Message, state: FSMContext):
         
         # Ищем пользователя по никнейму
         user = await conn.fetchrow(
-            "SELECT user_id, nickname, is_blocked, created_at FROM users WHERE nickname ILIKE $1", 
+            "SELECT user_id, nickname, is_blocked, created_at, complaints_count FROM users WHERE nickname ILIKE $1", 
             f"%{nickname}%"
         )
         
@@ -170,8 +167,9 @@ async def handle_nickname_search(message: types.Message, state: FSMContext):
         user_nickname = user['nickname']
         is_blocked = user['is_blocked']
         created_at = user['created_at']
+        complaints_count = user['complaints_count']
         
-        # Получаем жалобы на пользователя
+        # Получаем последние жалобы на пользователя
         complaints = await conn.fetch("""
             SELECT id, message_id, complainer_user_id, text, file_id, message_type, complaint_date,
                    u.nickname as complainer_nickname
@@ -179,11 +177,9 @@ async def handle_nickname_search(message: types.Message, state: FSMContext):
             LEFT JOIN users u ON c.complainer_user_id = u.user_id
             WHERE c.original_user_id = $1
             ORDER BY c.complaint_date DESC
+            LIMIT 5
         """, user_info_id)
         
-        # Получаем количество жалоб
-        complaints_count = len(complaints)
-        
         await conn.close()
         
         # Формируем информацию о пользователе
@@ -254,7 +250,7 @@ async def handle_unblock(callback: types.CallbackQuery, state: FSMContext):
         
         # Получаем информацию о пользователе
         user = await conn.fetchrow(
-            "SELECT nickname, is_blocked FROM users WHERE user_id = $1", 
+            "SELECT nickname, is_blocked, complaints_count FROM users WHERE user_id = $1", 
             user_id_to_unblock
         )
         
@@ -270,23 +266,21 @@ async def handle_unblock(callback: types.CallbackQuery, state: FSMContext):
             await conn.close()
             return
         
-        # Получаем количество жалоб ДО удаления
-        complaints_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM complaints WHERE original_user_id = $1", 
-            user_id_to_unblock
-        ) or 0
+        # Количество жалоб ДО удаления
+        complaints_count = user['complaints_count']
         
-        # Разблокируем пользователя и обнуляем жалобы
-        await conn.execute(
-            "UPDATE users SET is_blocked = FALSE WHERE user_id = $1", 
-            user_id_to_unblock
-        )
-        
-        # Удаляем все жалобы на этого пользователя
-        await conn.execute(
-            "DELETE FROM complaints WHERE original_user_id = $1", 
-            user_id_to_unblock
-        )
+        async with conn.transaction():
+            # Разблокируем пользователя и обнуляем счетчик жалоб
+            await conn.execute(
+                "UPDATE users SET is_blocked = FALSE, complaints_count = 0 WHERE user_id = $1", 
+                user_id_to_unblock
+            )
+            
+            # Удаляем все жалобы на этого пользователя
+            await conn.execute(
+                "DELETE FROM complaints WHERE original_user_id = $1", 
+                user_id_to_unblock
+            )
         
         await conn.close()
         
@@ -478,7 +472,15 @@ async def unknown(message: types.Message, state: FSMContext):
 async def main():
     """Запуск админ-бота"""
     logger.info("Starting admin bot...")
-    await dp.start_polling(bot, skip_updates=True)
+    await backend.start()
+    try:
+        if ADMIN_BOT_UPDATE_MODE == "webhook":
+            await WebhookServer(dp, bot, path=ADMIN_WEBHOOK_PATH, port=ADMIN_WEBHOOK_PORT).run()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await backend.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
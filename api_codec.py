@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Формат тел запросов и ответов API: JSON (по умолчанию) или msgpack
+
+Клиент, отправивший Content-Type: application/msgpack, получает тело
+запроса разобранным так же, как JSON; ответ кодируется в msgpack, если
+клиент указал его в Accept. msgpack - необязательная зависимость: без
+нее API и клиент работают только с JSON.
+"""
+
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def pack(data: Any) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def unpack(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return pack(content)
+
+
+class MsgpackRoute(APIRoute):
+    """Маршрут FastAPI, понимающий msgpack в запросе и отдающий его по Accept"""
+
+    def get_route_handler(self) -> Callable:
+        json_handler = super().get_route_handler()
+        if msgpack is None:
+            return json_handler
+
+        # Тот же обработчик, но ответ сериализуется в msgpack вместо JSON
+        default_response_class = self.response_class
+        self.response_class = MsgpackResponse
+        try:
+            msgpack_handler = super().get_route_handler()
+        finally:
+            self.response_class = default_response_class
+
+        async def route_handler(request: Request) -> Response:
+            if request.headers.get("content-type", "").startswith(MSGPACK_MEDIA_TYPE):
+                request = await _as_json_request(request)
+            if MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+                return await msgpack_handler(request)
+            return await json_handler(request)
+
+        return route_handler
+
+
+async def _as_json_request(request: Request) -> Request:
+    """Запрос с телом msgpack, который FastAPI разбирает как уже декодированный JSON"""
+    body = await request.body()
+    scope = dict(request.scope)
+    scope["headers"] = [
+        (name, value) for name, value in request.scope["headers"] if name != b"content-type"
+    ] + [(b"content-type", JSON_MEDIA_TYPE.encode())]
+    decoded = Request(scope, request.receive)
+    decoded._body = body
+    if body:
+        decoded._json = unpack(body)
+    return decoded
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Клиент ботов к API (main.py)
+
+Одна сессия aiohttp на процесс: соединения с API переиспользуются (keep-alive),
+у каждого запроса явный таймаут, задержки считаются отдельно по эндпоинтам.
+
+BACKEND_TRANSPORT=inprocess - бот не ходит в API по HTTP, а импортирует
+main.py и вызывает те же обработчики напрямую, со своим пулом соединений.
+Подходит, когда бот и API на одном хосте; кэши API (профили, таблица
+лидеров) тогда живут в процессе бота, поэтому изменения данных должны идти
+через бота, а не через отдельно запущенный API.
+
+Если API на том же хосте, но в отдельном процессе: BACKEND_UDS - путь к
+Unix-сокету API (вместо TCP), BACKEND_CODEC=msgpack - тела в msgpack
+вместо JSON (см. api_codec.py).
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Optional
+
+import aiohttp
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgpack = None
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Максимум одновременных соединений с API
+BACKEND_POOL_LIMIT = int(os.getenv("BACKEND_POOL_LIMIT", "100"))
+# Сколько держать простаивающее соединение открытым (секунды)
+BACKEND_KEEPALIVE_TIMEOUT = float(os.getenv("BACKEND_KEEPALIVE_TIMEOUT", "30"))
+# Кэш DNS (секунды)
+BACKEND_DNS_CACHE_TTL = int(os.getenv("BACKEND_DNS_CACHE_TTL", "300"))
+# Таймауты запроса целиком и установки соединения (секунды)
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "10"))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3"))
+# Транспорт: http - запросы к BACKEND_URL, inprocess - прямой вызов обработчиков
+BACKEND_TRANSPORT = os.getenv("BACKEND_TRANSPORT", "http").lower()
+# Unix-сокет API (API_UDS в main.py); BACKEND_URL тогда задает только пути
+BACKEND_UDS = os.getenv("BACKEND_UDS")
+# Формат тел запросов: json или msgpack
+BACKEND_CODEC = os.getenv("BACKEND_CODEC", "json").lower()
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def parse_ndjson_status(record: dict) -> bool:
+    """
+    Строка потока NDJSON: False - запись данных, True - последняя строка {"status": "ok"}
+
+    {"status": "error"} выбрасывается исключением: начатый поток нельзя
+    вернуть словарем с ошибкой, как в request().
+    """
+    status = record.get("status")
+    if status is None:
+        return False
+    if status != "ok":
+        raise RuntimeError(record.get("message", "stream error"))
+    return True
+
+
+class BackendClient:
+    """Долгоживущий клиент API со статистикой по эндпоинтам"""
+
+    def __init__(self, base_url: str,
+                 limit: int = BACKEND_POOL_LIMIT,
+                 keepalive_timeout: float = BACKEND_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl: int = BACKEND_DNS_CACHE_TTL,
+                 timeout: float = BACKEND_TIMEOUT,
+                 connect_timeout: float = BACKEND_CONNECT_TIMEOUT,
+                 uds: Optional[str] = BACKEND_UDS,
+                 codec: str = BACKEND_CODEC):
+        self.uds = uds
+        self.base_url = (base_url or ("http://localhost" if uds else "")).rstrip("/")
+        if codec == "msgpack" and msgpack is None:
+            logger.warning("⚠️ BACKEND_CODEC=msgpack, but msgpack is not installed, using json")
+            codec = "json"
+        self.codec = codec
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Статистика
+        self.latency: Dict[str, LatencyStats] = {}
+        self.errors: Dict[str, int] = {}
+        self.timeouts = 0
+        self.connections_opened = 0
+
+    @property
+    def is_started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self):
+        """Создать сессию (при старте бота; иначе - при первом запросе)"""
+        if self.is_started:
+            return
+        if self.uds:
+            connector = aiohttp.UnixConnector(
+                path=self.uds,
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection_created)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[trace]
+        )
+        logger.info(f"🔗 Backend client started: {self.uds or self.base_url} ({self.codec}), limit={self.limit}, "
+                    f"keepalive={self.keepalive_timeout}s, timeout={self.timeout.total}s")
+
+    async def close(self):
+        """Закрыть сессию и все соединения"""
+        if self._session is None:
+            return
+        await self._session.close()
+        self._session = None
+        logger.info(f"🔒 Backend client closed: {self.stats()}")
+
+    async def _on_connection_created(self, session, context, params):
+        self.connections_opened += 1
+
+    async def request(self, endpoint: str, data: dict, timeout: Optional[float] = None) -> dict:
+        """
+        POST к эндпоинту API
+
+        Ошибки не выбрасываются: возвращается {"status": "error", "message": ...},
+        как и раньше в api_request ботов.
+        """
+        if not self.is_started:
+            await self.start()
+
+        started = time.perf_counter()
+        try:
+            return await self._send(endpoint, data, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._count_error(endpoint)
+            logger.error(f"API timeout for {endpoint}")
+            return {"status": "error", "message": "timeout"}
+        except Exception as e:
+            self._count_error(endpoint)
+            logger.error(f"API error for {endpoint}: {e}")
+            return {"status": "error", "message": str(e)}
+        finally:
+            stats = self.latency.get(endpoint)
+            if stats is None:
+                stats = self.latency[endpoint] = LatencyStats()
+            stats.observe(time.perf_counter() - started)
+
+    async def stream(self, endpoint: str, data: dict) -> AsyncIterator[dict]:
+        """
+        POST к эндпоинту, отвечающему потоком NDJSON: записи отдаются по мере чтения
+
+        Таймаут - на каждое чтение, а не на весь поток. Ошибки выбрасываются;
+        поток без последней строки со статусом считается оборванным.
+        """
+        if not self.is_started:
+            await self.start()
+
+        started = time.perf_counter()
+        try:
+            async for record in self._stream(endpoint, data):
+                yield record
+        except Exception:
+            self._count_error(endpoint)
+            raise
+        finally:
+            stats = self.latency.get(endpoint)
+            if stats is None:
+                stats = self.latency[endpoint] = LatencyStats()
+            stats.observe(time.perf_counter() - started)
+
+    async def _stream(self, endpoint: str, data: dict) -> AsyncIterator[dict]:
+        kwargs = self._body(data)
+        kwargs["timeout"] = aiohttp.ClientTimeout(
+            total=None, sock_read=self.timeout.total, connect=self.timeout.connect
+        )
+        async with self._session.post(f"{self.base_url}/{endpoint}", **kwargs) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if parse_ndjson_status(record):
+                    return
+                yield record
+        raise RuntimeError("stream ended without status line")
+
+    def _body(self, data: dict) -> dict:
+        if self.codec == "msgpack":
+            return {
+                "data": msgpack.packb(data, use_bin_type=True),
+                "headers": {"Content-Type": MSGPACK_MEDIA_TYPE, "Accept": MSGPACK_MEDIA_TYPE},
+            }
+        return {"json": data}
+
+    async def _send(self, endpoint: str, data: dict, timeout: Optional[float]) -> dict:
+        kwargs = self._body(data)
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, connect=self.timeout.connect)
+
+        async with self._session.post(f"{self.base_url}/{endpoint}", **kwargs) as response:
+            if response.status != 200:
+                logger.error(f"API returned status {response.status} for {endpoint}")
+                self._count_error(endpoint)
+                return {"status": "error", "message": f"HTTP {response.status}"}
+            # API без msgpack отвечает JSON - принимаем оба формата
+            if response.content_type == MSGPACK_MEDIA_TYPE:
+                return msgpack.unpackb(await response.read(), raw=False)
+            return await response.json()
+
+    def _count_error(self, endpoint: str):
+        self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def stats(self) -> Dict:
+        return {
+            "connections_opened": self.connections_opened,
+            "timeouts": self.timeouts,
+            "endpoints": {
+                endpoint: {**stats.snapshot(), "errors": self.errors.get(endpoint, 0)}
+                for endpoint, stats in sorted(self.latency.items())
+            },
+        }
+
+
+class InProcessBackend(BackendClient):
+    """
+    Прямой вызов обработчиков main.py в процессе бота
+
+    Запускает и останавливает ресурсы API (пул, миграции, уведомления базы,
+    данные в памяти) так же, как uvicorn. Ответ приводится к виду JSON,
+    поэтому код бота работает без изменений.
+
+    Кэш профилей живет в процессе бота. Блокировки и напоминания, измененные
+    другими процессами (админ-бот, планировщик со своим API), сбрасывают его
+    через уведомления базы; прочие поля профиля (ник, рейтинг, жалобы), записанные
+    в обход этого процесса, обновятся только по PROFILE_CACHE_TTL.
+    """
+
+    def __init__(self, timeout: float = BACKEND_TIMEOUT):
+        super().__init__("inprocess", timeout=timeout)
+        self._api = None
+        self._encode = None
+        self._lifespan = None
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def is_started(self) -> bool:
+        return self._lifespan is not None
+
+    async def start(self):
+        async with self._start_lock:
+            if self.is_started:
+                return
+            # Импорт здесь: в режиме http боту не нужны зависимости API
+            import main
+            from fastapi.encoders import jsonable_encoder
+            self._api = main
+            self._encode = jsonable_encoder
+            lifespan = main.lifespan(main.app)
+            await lifespan.__aenter__()
+            self._lifespan = lifespan
+        logger.info(f"🔗 Backend client started: in-process, timeout={self.timeout.total}s")
+
+    async def close(self):
+        if self._lifespan is None:
+            return
+        lifespan, self._lifespan = self._lifespan, None
+        await lifespan.__aexit__(None, None, None)
+        logger.info(f"🔒 Backend client closed: {self.stats()}")
+
+    async def _send(self, endpoint: str, data: dict, timeout: Optional[float]) -> dict:
+        result = await asyncio.wait_for(
+            self._api.call_endpoint(endpoint, data),
+            timeout=timeout if timeout is not None else self.timeout.total
+        )
+        return self._encode(result)
+
+    async def _stream(self, endpoint: str, data: dict) -> AsyncIterator[dict]:
+        response = await self._api.call_endpoint(endpoint, data)
+        if isinstance(response, dict):
+            # Ошибка проверки тела или неизвестный эндпоинт
+            raise RuntimeError(response.get("message", "stream error"))
+        async for chunk in response.body_iterator:
+            for line in (chunk.decode() if isinstance(chunk, bytes) else chunk).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if parse_ndjson_status(record):
+                    return
+                yield record
+        raise RuntimeError("stream ended without status line")
+
+
+def create_backend_client(base_url: str) -> BackendClient:
+    """Клиент API по настройке BACKEND_TRANSPORT"""
+    if BACKEND_TRANSPORT == "inprocess":
+        return InProcessBackend()
+    if BACKEND_TRANSPORT != "http":
+        logger.warning(f"⚠️ Unknown BACKEND_TRANSPORT={BACKEND_TRANSPORT}, using http")
+    return BackendClient(base_url)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк запросов бота к API: JSON/TCP, msgpack/TCP, JSON/UDS, msgpack/UDS
+
+  python bench_api_codec.py
+  python bench_api_codec.py --requests 5000
+
+Данные создаются во временной схеме базы из переменных DB_*. API (uvicorn)
+слушает TCP-порт и Unix-сокет в этом же процессе; замеряются /profile
+(ответ из кэша - почти чистый транспорт) и /get_help_request (запрос к базе).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+import asyncpg
+import msgpack
+import uvicorn
+from fastapi.encoders import jsonable_encoder
+
+import main
+from backend_client import BackendClient
+from db_pool import DatabasePool
+from metrics import LatencyStats
+from migrations import run_migrations
+
+API_PORT = 18093
+USERS = 1000
+
+
+async def prepare(conn):
+    await run_migrations(conn)
+    await conn.execute(
+        "INSERT INTO users (user_id, nickname) SELECT g, 'user' || g FROM generate_series(1, $1) g", USERS
+    )
+    await conn.execute(
+        "INSERT INTO ratings (user_id, rating) SELECT g, (random() * 100)::int FROM generate_series(1, $1) g", USERS
+    )
+    await conn.execute("""
+        INSERT INTO messages (user_id, text, type)
+        SELECT 1 + g % $1, repeat('поддержка ', 10), 'request'
+        FROM generate_series(1, $1 * 5) g
+    """, USERS)
+    await conn.execute("ANALYZE")
+
+
+async def start_server(**kwargs):
+    config = uvicorn.Config(main.app, lifespan="off", log_level="warning", **kwargs)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def measure(client: BackendClient, endpoint: str, payloads) -> LatencyStats:
+    await client.start()
+    stats = LatencyStats(window=len(payloads))
+    try:
+        for payload in payloads[:100]:
+            await client.request(endpoint, payload)
+        for payload in payloads:
+            started = time.perf_counter()
+            result = await client.request(endpoint, payload)
+            stats.observe(time.perf_counter() - started)
+        assert result.get("status") != "error", result
+    finally:
+        await client.close()
+    return stats
+
+
+async def run(args):
+    schema = f"bench_codec_{os.getpid()}"
+    settings = dict(main.db_pool.connect_kwargs)
+    admin = await asyncpg.connect(**settings)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    settings["server_settings"] = {"search_path": schema}
+    socket_path = os.path.join(tempfile.mkdtemp(), "api.sock")
+
+    try:
+        conn = await asyncpg.connect(**settings)
+        await prepare(conn)
+        await conn.close()
+
+        main.DB_RUN_MIGRATIONS = False
+        main.db_pool = DatabasePool(**settings)
+        async with main.lifespan(main.app):
+            servers = [
+                await start_server(host="127.0.0.1", port=API_PORT),
+                await start_server(uds=socket_path),
+            ]
+            try:
+                workloads = {
+                    "profile": [{"user_id": 1 + i % USERS} for i in range(args.requests)],
+                    "get_help_request": [
+                        {"user_id": 1 + i % USERS, "last_seen_id": i % (USERS * 5)} for i in range(args.requests)
+                    ],
+                }
+                for endpoint, payloads in workloads.items():
+                    sample = await main.call_endpoint(endpoint, payloads[0])
+                    print(f"/{endpoint}: response json={len(json.dumps(jsonable_encoder(sample), ensure_ascii=False).encode())}B "
+                          f"msgpack={len(msgpack.packb(jsonable_encoder(sample)))}B")
+                    for label, client in (
+                        ("json/tcp", BackendClient(f"http://127.0.0.1:{API_PORT}", uds=None, codec="json")),
+                        ("msgpack/tcp", BackendClient(f"http://127.0.0.1:{API_PORT}", uds=None, codec="msgpack")),
+                        ("json/uds", BackendClient(None, uds=socket_path, codec="json")),
+                        ("msgpack/uds", BackendClient(None, uds=socket_path, codec="msgpack")),
+                    ):
+                        snapshot = (await measure(client, endpoint, payloads)).snapshot()
+                        print(f"  {label:<12} p50={snapshot['p50_ms']:7.3f}ms p99={snapshot['p99_ms']:7.3f}ms "
+                              f"avg={snapshot['avg_ms']:7.3f}ms")
+            finally:
+                for server, task in servers:
+                    server.should_exit = True
+                    await task
+    finally:
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Микробенчмарк транспорта и формата API")
+    parser.add_argument("--requests", type=int, default=3000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main.logging.disable(main.logging.WARNING)
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
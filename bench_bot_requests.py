@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Замер запросов к API на одно обновление бота
+
+  python bench_bot_requests.py
+  python bench_bot_requests.py --users 200 --updates 5000
+
+Бот получает синтетические обновления (кнопки меню, /help, inline-кнопки)
+через dp.feed_update. API и Telegram подменены локальными aiohttp-серверами,
+считаются только запросы к API. Сравниваются кэш блокировок выключенный
+(как раньше: /profile перед каждым обработчиком) и включенный.
+"""
+
+import os
+import sys
+import random
+import asyncio
+import argparse
+import itertools
+
+from aiohttp import web
+
+# Бот читает настройки при импорте
+os.environ.setdefault("BOT_TOKEN", "42:bench")
+os.environ["BACKEND_URL"] = "http://127.0.0.1:18081"
+TELEGRAM_URL = "http://127.0.0.1:18082"
+
+from aiogram import Bot, types  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from block_cache import BlockStatusCache  # noqa: E402
+
+# Каждый 50-й пользователь заблокирован
+BLOCKED_EVERY = 50
+ACTIONS = ["👤 Профиль", "🏆 Топлист", "/help", "help_menu"]
+
+
+async def backend_handler(request: web.Request) -> web.Response:
+    endpoint = request.match_info["endpoint"]
+    data = await request.json()
+    user_id = data.get("user_id", 0)
+    if endpoint == "profile":
+        return web.json_response({
+            "status": "ok", "user_id": user_id, "nickname": f"user{user_id}",
+            "rating": 5, "complaints_count": 0, "reminders_enabled": True,
+            "is_blocked": user_id % BLOCKED_EVERY == 0,
+        })
+    if endpoint == "toplist":
+        return web.json_response({"status": "ok", "toplist": [], "user_position": 1, "user_rating": 5})
+    return web.json_response({"status": "ok"})
+
+
+async def telegram_handler(request: web.Request) -> web.Response:
+    if request.match_info["method"].lower() == "answercallbackquery":
+        return web.json_response({"ok": True, "result": True})
+    return web.json_response({"ok": True, "result": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ok"
+    }})
+
+
+def make_update(update_id: int, user_id: int, action: str) -> types.Update:
+    user = {"id": user_id, "is_bot": False, "first_name": "u"}
+    message = {"message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"}, "from": user}
+    if action.startswith("/") or not action.isascii():
+        message["text"] = action
+        return types.Update.model_validate({"update_id": update_id, "message": message})
+    return types.Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "1", "data": action,
+        "message": {**message, "from": {"id": 42, "is_bot": True, "first_name": "bot"}, "text": "x"},
+    }})
+
+
+async def measure(tg_bot: Bot, updates, cache: BlockStatusCache):
+    bot_module.block_cache = cache
+    gatekeeper = bot_module.gatekeeper
+    gatekeeper.updates = gatekeeper.backend_requests = gatekeeper.blocked_updates = 0
+    for update in updates:
+        await bot_module.dp.feed_update(tg_bot, update)
+    return gatekeeper.stats()
+
+
+async def start_server(handler, route, port):
+    app = web.Application()
+    app.router.add_post(route, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run(args):
+    backend = await start_server(backend_handler, "/{endpoint}", 18081)
+    telegram = await start_server(telegram_handler, "/bot{token}/{method}", 18082)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_URL))
+    tg_bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+
+    rng = random.Random(1)
+    counter = itertools.count(1)
+    updates = [
+        make_update(next(counter), rng.randint(1, args.users), rng.choice(ACTIONS))
+        for _ in range(args.updates)
+    ]
+
+    try:
+        before = await measure(tg_bot, updates, BlockStatusCache(ttl=0, blocked_ttl=0))
+        after = await measure(tg_bot, updates, BlockStatusCache())
+    finally:
+        await bot_module.backend.close()
+        await session.close()
+        await backend.cleanup()
+        await telegram.cleanup()
+
+    print(f"users={args.users} updates={args.updates}")
+    for label, stats in (("cache off (as before)", before), ("cache on", after)):
+        print(f"{label:<22} backend requests/update={stats['backend_requests_per_update']:.3f} "
+              f"(total={stats['backend_requests']}, blocked updates={stats['blocked_updates']})")
+    print(f"block cache hit ratio: {after['block_cache']['hit_ratio']:.2%}, "
+          f"backend connections opened: {after['backend']['connections_opened']}")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Запросы к API на одно обновление бота")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=2000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    bot_module.logging.disable(bot_module.logging.WARNING)
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
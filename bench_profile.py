@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк /profile: прежние отдельные запросы против одного запроса с кэшем
+
+  python bench_profile.py
+  python bench_profile.py --users 20000 --requests 50000 --write-share 0.05
+
+Данные создаются во временной схеме базы из переменных DB_*. Пользователи
+выбираются по закону Ципфа (активные пользователи обращаются чаще), часть
+обращений - записи (/increment_rating), которые сбрасывают кэш.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import bisect
+
+import asyncpg
+
+import main
+from db_pool import DatabasePool
+from metrics import LatencyStats
+from migrations import run_migrations
+
+
+async def profile_before(conn, user_id):
+    """Профиль так, как он читался раньше: users, ratings и COUNT(*) по complaints"""
+    user = await conn.fetchrow(
+        "SELECT user_id, nickname, is_blocked, reminders_enabled FROM users WHERE user_id = $1", user_id
+    )
+    rating = await conn.fetchval("SELECT rating FROM ratings WHERE user_id = $1", user_id) or 0
+    complaints = await conn.fetchval("SELECT COUNT(*) FROM complaints WHERE original_user_id = $1", user_id)
+    return user, rating, complaints
+
+
+def zipf_sampler(rng, count, s=1.1):
+    weights = [1 / (rank ** s) for rank in range(1, count + 1)]
+    total = sum(weights)
+    cumulative, acc = [], 0.0
+    for weight in weights:
+        acc += weight / total
+        cumulative.append(acc)
+    return lambda: min(bisect.bisect_left(cumulative, rng.random()), count - 1) + 1
+
+
+def report(label, stats):
+    snapshot = stats.snapshot()
+    print(f"{label:<28} p50={snapshot['p50_ms']:8.3f}ms p99={snapshot['p99_ms']:8.3f}ms "
+          f"avg={snapshot['avg_ms']:8.3f}ms")
+
+
+async def run(args):
+    schema = f"bench_profile_{os.getpid()}"
+    settings = dict(main.db_pool.connect_kwargs)
+    admin = await asyncpg.connect(**settings)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    settings["server_settings"] = {"search_path": schema}
+
+    try:
+        conn = await asyncpg.connect(**settings)
+        await run_migrations(conn)
+        await conn.execute(
+            "INSERT INTO users (user_id, nickname) SELECT g, 'user' || g FROM generate_series(1, $1) g",
+            args.users
+        )
+        await conn.execute(
+            "INSERT INTO ratings (user_id, rating) SELECT g, (random() * 100)::int FROM generate_series(1, $1) g",
+            args.users
+        )
+        await conn.execute("""
+            INSERT INTO complaints (original_user_id, complainer_user_id, text)
+            SELECT 1 + (random() * ($1 - 1))::int, 1, 'x' FROM generate_series(1, $1 / 5)
+        """, args.users)
+        await conn.execute("ANALYZE")
+
+        rng = random.Random(1)
+        next_user = zipf_sampler(rng, args.users)
+        workload = [(next_user(), rng.random() < args.write_share) for _ in range(args.requests)]
+
+        await conn.close()
+
+        main.DB_RUN_MIGRATIONS = False
+        main.db_pool = DatabasePool(**settings)
+        async with main.lifespan(main.app):
+            # Оба варианта берут соединение из одного и того же пула
+            before = LatencyStats(window=args.requests)
+            for user_id, _ in workload:
+                started = time.perf_counter()
+                async with main.db_pool.acquire() as pooled:
+                    await profile_before(pooled, user_id)
+                before.observe(time.perf_counter() - started)
+
+            after = LatencyStats(window=args.requests)
+            for user_id, is_write in workload:
+                if is_write:
+                    await main.increment_rating(main.UserProfile(user_id=user_id))
+                started = time.perf_counter()
+                await main.get_profile(main.UserProfile(user_id=user_id))
+                after.observe(time.perf_counter() - started)
+            cache_stats = main.profile_cache.stats()
+
+        print(f"users={args.users} requests={args.requests} write_share={args.write_share}")
+        report("before (3 queries, no cache)", before)
+        report("after (1 query + cache)", after)
+        print(f"cache hit ratio: {cache_stats['hit_ratio']:.2%} "
+              f"(hits={cache_stats['hits']}, misses={cache_stats['misses']}, "
+              f"invalidations={cache_stats['invalidations']})")
+    finally:
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк /profile")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--write-share", type=float, default=0.05)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
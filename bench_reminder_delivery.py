@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность рассылки напоминаний против локального поддельного Bot API
+
+  python bench_reminder_delivery.py
+  python bench_reminder_delivery.py --users 2000 --rate 100 --latency-ms 50
+
+API бэкенда и Telegram подменены aiohttp-серверами с задержкой ответа.
+Сравнивается последовательная рассылка (concurrency=1, как раньше, но без
+пауз 1-3 с) и параллельная; при правильной работе время параллельной
+рассылки близко к users / rate.
+"""
+
+import sys
+import asyncio
+import argparse
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from backend_client import BackendClient
+from reminder_scheduler import ReminderScheduler
+from telegram_sender import TelegramSender, install_sender, PRIORITY_BACKGROUND
+
+TELEGRAM_PORT = 18097
+BACKEND_PORT = 18098
+
+
+async def start_fakes(latency: float):
+    sent = []
+
+    async def telegram(request: web.Request) -> web.Response:
+        params = dict(await request.post())
+        await asyncio.sleep(latency)
+        sent.append(int(params["chat_id"]))
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(sent), "date": 0, "chat": {"id": int(params["chat_id"]), "type": "private"},
+            "text": params.get("text", "")}})
+
+    async def backend(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.json_response({"status": "ok", "messages": [
+            {"for_user_id": user["user_id"], "message": {
+                "id": user["last_seen_id"] + 1, "text": "Всё будет хорошо", "file_id": None,
+                "message_type": "text", "nickname": "bench", "user_id": 1}}
+            for user in (await request.json())["users"]
+        ]})
+
+    runners = []
+    for port, route, handler in ((TELEGRAM_PORT, "/bot{token}/{method}", telegram),
+                                 (BACKEND_PORT, "/get_reminder_messages", backend)):
+        app = web.Application()
+        app.router.add_post(route, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+    return runners, sent
+
+
+async def measure(concurrency: int, args) -> dict:
+    runners, sent = await start_fakes(args.latency_ms / 1000)
+    bot = Bot(token="42:bench",
+              session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{TELEGRAM_PORT}")))
+    sender = install_sender(bot, TelegramSender(rate=args.rate, burst=5), priority=PRIORITY_BACKGROUND)
+    backend = BackendClient(f"http://127.0.0.1:{BACKEND_PORT}")
+    await backend.start()
+    try:
+        scheduler = ReminderScheduler(bot, backend, concurrency=concurrency)
+        result = await scheduler.deliver(list(range(1, args.users + 1)))
+        assert len(set(sent)) == result["sent"]
+        result["send_p99_ms"] = sender.stats()["send_latency"]["p99_ms"]
+        return result
+    finally:
+        await sender.close()
+        await backend.close()
+        await bot.session.close()
+        for runner in runners:
+            await runner.cleanup()
+
+
+async def run(args):
+    print(f"users={args.users} telegram rate limit={args.rate}/s latency={args.latency_ms}ms per call")
+    ok = True
+    for concurrency in (1, args.concurrency):
+        result = await measure(concurrency, args)
+        print(f"concurrency={concurrency:<4} sent={result['sent']}/{result['total']} "
+              f"time={result['duration_s']:7.2f}s throughput={result['per_second']:7.1f}/s "
+              f"send p99={result['send_p99_ms']:.1f}ms")
+        ok = ok and result["failed"] == 0
+    print(f"rate-limit bound: {args.users / args.rate:.2f}s; "
+          f"old loop with 1-3s pauses: ~{args.users * (2 + 2 * args.latency_ms / 1000) / 3600:.1f}h")
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пропускная способность рассылки напоминаний")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import logging
+    # reminder_scheduler включает INFO при импорте - лог каждой отправки не нужен
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
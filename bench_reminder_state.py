@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Память на одного пользователя: dict + dict против упакованного ReminderState
+
+  python bench_reminder_state.py
+  python bench_reminder_state.py --users 1000000
+"""
+
+import sys
+import random
+import argparse
+import tracemalloc
+
+from reminder_state import ReminderState
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del data
+    return used
+
+
+def run(args):
+    rng = random.Random(1)
+    # id Telegram большие и разреженные, курсоры - id сообщений
+    user_ids = sorted(rng.sample(range(10**8, 8 * 10**9), args.users))
+    last_seen = [rng.randrange(1, 2**31) for _ in user_ids]
+    # Время последней отправки (Unix-секунды) у каждого третьего
+    last_sent_at = [1_790_000_000 + i if i % 3 == 0 else None for i in range(len(user_ids))]
+
+    def build_dicts():
+        return dict(zip(user_ids, last_seen)), {u: ts for u, ts in zip(user_ids, last_sent_at) if ts}
+
+    def build_packed():
+        state = ReminderState()
+        state.load(user_ids, last_seen, last_sent_at)
+        return state
+
+    print(f"users={args.users}, sent={sum(1 for ts in last_sent_at if ts)}")
+    for label, build in (("dict + dict", build_dicts), ("ReminderState", build_packed)):
+        used = measure(build)
+        print(f"{label:<14} {used / 2**20:8.2f} MiB  {used / args.users:7.1f} bytes/user")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Память состояния планировщика напоминаний")
+    parser.add_argument("--users", type=int, default=200_000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(parse_args()) else 1)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность рассылки напоминаний одним и несколькими процессами
+
+  python bench_reminder_workers.py
+  python bench_reminder_workers.py --users 2000 --workers 4 --rate 100 --latency-ms 50
+
+Процессы планировщика (REMINDER_PARTITIONED, см. reminder_leases.py) делят
+пользователей арендой корзин и отрабатывают один раунд. API бэкенда и
+Telegram подменены aiohttp-серверами с задержкой ответа; аренда в поддельном
+API делится поровну между зарегистрированными процессами. У каждого процесса
+своя доля лимита Telegram (--rate), поэтому при правильной работе время
+раунда N процессов близко к users / (N * rate), а повторных отправок нет.
+"""
+
+import sys
+import time
+import json
+import asyncio
+import argparse
+import datetime
+import multiprocessing
+from collections import Counter
+
+from aiohttp import web
+
+BACKEND_PORT = 18099
+BUCKETS = 64
+LEASE_TTL = 0.6
+DAY = datetime.date(2026, 10, 18)
+
+
+def worker(worker_id: str, rate: float, commands, results):
+    asyncio.run(run_worker(worker_id, rate, commands, results))
+
+
+async def run_worker(worker_id: str, rate: float, commands, results):
+    """Процесс планировщика: по команде отрабатывает раунд в заданный момент"""
+    import logging
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from backend_client import BackendClient
+    from reminder_leases import LeaseManager
+    from reminder_scheduler import ReminderScheduler
+    from telegram_sender import TelegramSender, install_sender, PRIORITY_BACKGROUND
+    # reminder_scheduler включает INFO при импорте - лог каждой отправки не нужен
+    logging.getLogger().setLevel(logging.WARNING)
+
+    url = f"http://127.0.0.1:{BACKEND_PORT}"
+    bot = Bot(token="42:bench", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    sender = install_sender(bot, TelegramSender(rate=rate, burst=5), priority=PRIORITY_BACKGROUND)
+    backend = BackendClient(f"{url}/api")
+    await backend.start()
+    partition = LeaseManager(backend, worker_id=worker_id, bucket_count=BUCKETS, ttl=LEASE_TTL)
+    scheduler = ReminderScheduler(bot, backend, partition=partition)
+    await partition.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            now = await loop.run_in_executor(None, commands.get)
+            if now is None:
+                break
+            started = time.perf_counter()
+            await scheduler.tick(now=now)
+            results.put((worker_id, len(partition.buckets), time.perf_counter() - started))
+    finally:
+        await partition.close()
+        await sender.close()
+        await backend.close()
+        await bot.session.close()
+
+
+async def start_fakes(users: int, latency: float):
+    """Поддельные Telegram и API планировщика; аренда - поровну между известными процессами"""
+    sent = []
+    workers = set()
+
+    async def telegram(request: web.Request) -> web.Response:
+        params = dict(await request.post())
+        await asyncio.sleep(latency)
+        sent.append(int(params["chat_id"]))
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(sent), "date": 0, "chat": {"id": int(params["chat_id"]), "type": "private"},
+            "text": params.get("text", "")}})
+
+    async def backend(request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        data = await request.json()
+        if endpoint == "claim_reminder_leases":
+            workers.add(data["worker_id"])
+            index = sorted(workers).index(data["worker_id"])
+            buckets = [b for b in range(BUCKETS) if b % len(workers) == index]
+            return web.json_response({"status": "ok", "buckets": buckets, "workers": len(workers)})
+        if endpoint == "release_reminder_leases":
+            workers.discard(data["worker_id"])
+            return web.json_response({"status": "ok", "released": 0})
+        if endpoint == "get_reminder_state":
+            return web.json_response({"status": "ok", "user_ids": [], "last_seen_ids": [], "last_sent_at": []})
+        if endpoint == "stream_users_with_reminders":
+            owned = set(data["buckets"])
+            lines = [json.dumps({"user_id": u, "utc_offset_minutes": 180})
+                     for u in range(1, users + 1) if u % data["bucket_count"] in owned]
+            lines.append(json.dumps({"status": "ok", "count": len(lines)}))
+            return web.Response(text="\n".join(lines) + "\n", content_type="application/x-ndjson")
+        if endpoint == "get_reminder_messages":
+            await asyncio.sleep(latency)
+            return web.json_response({"status": "ok", "messages": [
+                {"for_user_id": user["user_id"], "message": {
+                    "id": user["last_seen_id"] + 1, "text": "Всё будет хорошо", "file_id": None,
+                    "message_type": "text", "nickname": "bench", "user_id": 1}}
+                for user in data["users"]
+            ]})
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", telegram)
+    app.router.add_post("/api/{endpoint}", backend)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", BACKEND_PORT).start()
+    return runner, sent, workers
+
+
+async def measure(count: int, args) -> dict:
+    runner, sent, workers = await start_fakes(args.users, args.latency_ms / 1000)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for n in range(count):
+        commands, results = context.Queue(), context.Queue()
+        process = context.Process(target=worker, args=(f"w{n}", args.rate, commands, results))
+        process.start()
+        processes.append((process, commands, results))
+    loop = asyncio.get_running_loop()
+    try:
+        # Все процессы зарегистрировались и продлили аренду с окончательным делением
+        while len(workers) < count:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(LEASE_TTL)
+
+        # Конец московского окна: слоты всех пользователей уже наступили
+        midnight = datetime.datetime(DAY.year, DAY.month, DAY.day, tzinfo=datetime.timezone.utc).timestamp()
+        now = midnight - 180 * 60 + 20 * 3600 - 1
+        started = time.perf_counter()
+        for _, commands, _ in processes:
+            commands.put(now)
+        rounds = [await loop.run_in_executor(None, results.get, True, 600) for _, _, results in processes]
+        duration = time.perf_counter() - started
+    finally:
+        for _, commands, _ in processes:
+            commands.put(None)
+        for process, _, _ in processes:
+            await loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+        await runner.cleanup()
+
+    counts = Counter(sent)
+    return {
+        "workers": count,
+        "sent": len(counts),
+        "duplicates": sum(n - 1 for n in counts.values()),
+        "buckets": sorted(buckets for _, buckets, _ in rounds),
+        "duration_s": round(duration, 2),
+        "per_second": round(len(sent) / duration, 1),
+    }
+
+
+async def run(args):
+    print(f"users={args.users} telegram rate limit={args.rate}/s per worker latency={args.latency_ms}ms per call")
+    ok = True
+    baseline = None
+    for count in (1, args.workers):
+        result = await measure(count, args)
+        baseline = baseline or result["per_second"]
+        print(f"workers={count:<3} sent={result['sent']}/{args.users} duplicates={result['duplicates']} "
+              f"buckets={result['buckets']} time={result['duration_s']:6.2f}s "
+              f"throughput={result['per_second']:7.1f}/s speedup={result['per_second'] / baseline:.2f}x")
+        ok = ok and result["sent"] == args.users and result["duplicates"] == 0
+    print(f"rate-limit bound: {args.users / args.rate:.2f}s for 1 worker, "
+          f"{args.users / (args.rate * args.workers):.2f}s for {args.workers}")
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пропускная способность рассылки несколькими процессами")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
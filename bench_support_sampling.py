@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк случайного выбора сообщения поддержки
+
+  python bench_support_sampling.py                  - только пул в памяти, 10k..10M
+  python bench_support_sampling.py --db             - плюс сравнение с ORDER BY RANDOM() в базе
+  python bench_support_sampling.py --db --sizes 10000,100000,1000000
+
+В режиме --db данные создаются во временной схеме базы из переменных DB_*.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+import asyncpg
+
+from support_sampler import SupportSampler
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+# Доля авторов в блоке и число авторов в синтетическом пуле
+BLOCKED_SHARE = 0.05
+AUTHORS = 50_000
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def report(label, size, samples):
+    print(f"{label:<22} {size:>11,} "
+          f"p50={percentile(samples, 0.5) * 1e6:9.1f}us "
+          f"p99={percentile(samples, 0.99) * 1e6:9.1f}us "
+          f"avg={statistics.mean(samples) * 1e6:9.1f}us")
+
+
+def bench_memory(size, iterations=20_000):
+    rng = random.Random(size)
+    sampler = SupportSampler(rng=rng)
+    for message_id in range(1, size + 1):
+        sampler.add(message_id, rng.randrange(AUTHORS))
+    for user_id in range(int(AUTHORS * BLOCKED_SHARE)):
+        sampler.set_blocked(user_id, True)
+
+    samples = []
+    for _ in range(iterations):
+        caller = rng.randrange(AUTHORS)
+        start = time.perf_counter()
+        sampler.sample(exclude_user_id=caller)
+        samples.append(time.perf_counter() - start)
+    report("sampler (memory)", size, samples)
+
+
+async def bench_db(size, iterations):
+    # Отложенный импорт: main создает пул и логирует конфигурацию
+    import main
+
+    schema = f"bench_{os.getpid()}"
+    conn = await asyncpg.connect(**main.db_pool.connect_kwargs)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}")
+        await conn.execute(f"SET search_path = {schema}")
+        await conn.execute("""
+            CREATE TABLE users (user_id BIGINT PRIMARY KEY, nickname TEXT, is_blocked BOOLEAN NOT NULL DEFAULT FALSE);
+            CREATE TABLE messages (id SERIAL PRIMARY KEY, user_id BIGINT, text TEXT, type VARCHAR(20) NOT NULL);
+        """)
+        await conn.execute(
+            "INSERT INTO users SELECT g, 'u' || g, g < $2 FROM generate_series(0, $1 - 1) g",
+            AUTHORS, int(AUTHORS * BLOCKED_SHARE)
+        )
+        await conn.execute(
+            "INSERT INTO messages (user_id, text, type) "
+            "SELECT (random() * ($2 - 1))::int, 'support ' || g, 'support' FROM generate_series(1, $1) g",
+            size, AUTHORS
+        )
+        await conn.execute("CREATE INDEX ON messages(type); ANALYZE")
+
+        main.support_sampler = SupportSampler()
+        await main.support_sampler.load(conn)
+
+        rng = random.Random(size)
+        for label, pick in (
+            ("ORDER BY RANDOM()", lambda caller: conn.fetchrow("""
+                SELECT m.text, u.nickname FROM messages m JOIN users u ON m.user_id = u.user_id
+                WHERE m.type = 'support' AND m.user_id != $1 AND u.is_blocked = FALSE
+                ORDER BY RANDOM() LIMIT 1
+            """, caller)),
+            ("sampler + PK lookup", lambda caller: main.pick_support_message(conn, caller)),
+        ):
+            samples = []
+            for _ in range(iterations):
+                caller = rng.randrange(AUTHORS)
+                start = time.perf_counter()
+                await pick(caller)
+                samples.append(time.perf_counter() - start)
+            report(label, size, samples)
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк выбора сообщения поддержки")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--db", action="store_true", help="сравнить с ORDER BY RANDOM() в базе")
+    parser.add_argument("--db-iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    for size in sizes:
+        bench_memory(size)
+        if args.db:
+            asyncio.run(bench_db(size, args.db_iterations))
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
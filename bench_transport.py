@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк транспорта бот -> API: HTTP против прямого вызова в процессе
+
+  python bench_transport.py
+  python bench_transport.py --users 2000 --updates 3000
+
+Данные создаются во временной схеме базы из переменных DB_*. Бот получает
+синтетические обновления (профиль, топлист, поддержка, запросы помощи) через
+dp.feed_update, Telegram подменен локальным aiohttp-сервером. В режиме http
+API запущен uvicorn в этом же процессе, в режиме inprocess бот вызывает
+обработчики main.py напрямую (BACKEND_TRANSPORT=inprocess).
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+import asyncpg
+import uvicorn
+from aiohttp import web
+
+API_PORT = 18091
+TELEGRAM_PORT = 18092
+
+# Бот читает настройки при импорте
+os.environ.setdefault("BOT_TOKEN", "42:bench")
+os.environ["BACKEND_URL"] = f"http://127.0.0.1:{API_PORT}"
+os.environ["BACKEND_TRANSPORT"] = "http"
+
+from aiogram import Bot, types  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+import main  # noqa: E402
+from backend_client import BackendClient, InProcessBackend  # noqa: E402
+from block_cache import BlockStatusCache  # noqa: E402
+from db_pool import DatabasePool  # noqa: E402
+from metrics import LatencyStats  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+ACTIONS = ["👤 Профиль", "🏆 Топлист", "🔥 Получить поддержку", "🤝 Помочь кому-нибудь"]
+
+
+async def telegram_handler(request: web.Request) -> web.Response:
+    if request.match_info["method"].lower() == "answercallbackquery":
+        return web.json_response({"ok": True, "result": True})
+    return web.json_response({"ok": True, "result": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ok"
+    }})
+
+
+def make_update(update_id: int, user_id: int, text: str) -> types.Update:
+    user = {"id": user_id, "is_bot": False, "first_name": "u"}
+    return types.Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"}, "from": user,
+    }})
+
+
+async def prepare(conn, users: int):
+    await run_migrations(conn)
+    await conn.execute(
+        "INSERT INTO users (user_id, nickname) SELECT g, 'user' || g FROM generate_series(1, $1) g", users
+    )
+    await conn.execute(
+        "INSERT INTO ratings (user_id, rating) SELECT g, (random() * 100)::int FROM generate_series(1, $1) g", users
+    )
+    await conn.execute("""
+        INSERT INTO messages (user_id, text, type)
+        SELECT 1 + g % $1, 'message ' || g, CASE WHEN g % 4 = 0 THEN 'request' ELSE 'support' END
+        FROM generate_series(1, $1 * 5) g
+    """, users)
+    await conn.execute("ANALYZE")
+
+
+async def measure(tg_bot: Bot, backend: BackendClient, updates) -> LatencyStats:
+    bot_module.backend = backend
+    bot_module.block_cache = BlockStatusCache()
+    bot_module.dp.fsm.storage.storage.clear()
+    await backend.start()
+
+    stats = LatencyStats(window=len(updates))
+    try:
+        for update in updates:
+            started = time.perf_counter()
+            await bot_module.dp.feed_update(tg_bot, update)
+            stats.observe(time.perf_counter() - started)
+    finally:
+        await backend.close()
+    return stats
+
+
+def report(label: str, stats: LatencyStats, backend: BackendClient):
+    snapshot = stats.snapshot()
+    calls = sum(endpoint["count"] for endpoint in backend.stats()["endpoints"].values())
+    print(f"{label:<10} update p50={snapshot['p50_ms']:7.3f}ms p99={snapshot['p99_ms']:7.3f}ms "
+          f"avg={snapshot['avg_ms']:7.3f}ms  api calls={calls}")
+
+
+async def run(args):
+    schema = f"bench_transport_{os.getpid()}"
+    settings = dict(main.db_pool.connect_kwargs)
+    admin = await asyncpg.connect(**settings)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    settings["server_settings"] = {"search_path": schema}
+
+    telegram = web.AppRunner(web.Application())
+    telegram.app.router.add_post("/bot{token}/{method}", telegram_handler)
+    await telegram.setup()
+    await web.TCPSite(telegram, "127.0.0.1", TELEGRAM_PORT).start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{TELEGRAM_PORT}"))
+    tg_bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+
+    try:
+        conn = await asyncpg.connect(**settings)
+        await prepare(conn, args.users)
+        await conn.close()
+
+        main.DB_RUN_MIGRATIONS = False
+        main.db_pool = DatabasePool(**settings)
+
+        rng = random.Random(1)
+        updates = [
+            make_update(i, rng.randint(1, args.users), rng.choice(ACTIONS))
+            for i in range(1, args.updates + 1)
+        ]
+
+        # HTTP: uvicorn в этом же процессе, ресурсы API поднимает его lifespan
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=API_PORT, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        http_backend = BackendClient(os.environ["BACKEND_URL"])
+        try:
+            http_stats = await measure(tg_bot, http_backend, updates)
+        finally:
+            server.should_exit = True
+            await server_task
+
+        inprocess_backend = InProcessBackend()
+        inprocess_stats = await measure(tg_bot, inprocess_backend, updates)
+
+        print(f"users={args.users} updates={args.updates}")
+        report("http", http_stats, http_backend)
+        report("inprocess", inprocess_stats, inprocess_backend)
+    finally:
+        await session.close()
+        await telegram.cleanup()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк транспорта бот -> API")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=2000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    bot_module.logging.disable(bot_module.logging.WARNING)
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
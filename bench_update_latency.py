@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Задержка от появления обновления в Telegram до вызова обработчика: polling против webhook
+
+  python bench_update_latency.py
+  python bench_update_latency.py --updates 500 --rtt-ms 60 --interval-ms 20
+
+Telegram подменен локальным aiohttp-сервером. Сетевая задержка до Telegram
+имитируется: каждый запрос бота и каждая доставка webhook идут rtt/2 в одну
+сторону. Обновления появляются с экспоненциальными интервалами.
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from metrics import LatencyStats
+from webhook_server import WebhookServer, SECRET_HEADER
+from update_scheduler import UpdateScheduler, SchedulingMiddleware
+
+TELEGRAM_PORT = 18095
+WEBHOOK_PORT = 18096
+BOT_TOKEN = "42:bench"
+
+
+class FakeTelegram:
+    """getUpdates с long polling и доставка webhook с задержкой сети"""
+
+    def __init__(self, rtt: float):
+        self.one_way = rtt / 2
+        self.pending = []
+        self.arrived = asyncio.Condition()
+        self.created_at = {}
+        self.webhook = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        await asyncio.sleep(self.one_way)
+        if method == "getme":
+            result = {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method == "getupdates":
+            result = await self._long_poll(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        elif method == "setwebhook":
+            self.webhook = (params["url"], params.get("secret_token", ""))
+            result = True
+        else:
+            result = True
+        await asyncio.sleep(self.one_way)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _long_poll(self, offset: int, timeout: float):
+        async with self.arrived:
+            self.pending = [update for update in self.pending if update["update_id"] >= offset]
+            if not self.pending:
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self.pending)
+
+    async def publish(self, update: dict, session: aiohttp.ClientSession):
+        self.created_at[update["update_id"]] = time.perf_counter()
+        if self.webhook is not None:
+            url, secret = self.webhook
+            await asyncio.sleep(self.one_way)
+            async with session.post(url, json=update, headers={SECRET_HEADER: secret}):
+                pass
+            return
+        async with self.arrived:
+            self.pending.append(update)
+            self.arrived.notify_all()
+
+
+def make_update(update_id: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "u"},
+    }}
+
+
+async def measure(mode: str, args) -> LatencyStats:
+    telegram = FakeTelegram(args.rtt_ms / 1000)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", telegram.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", TELEGRAM_PORT).start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{TELEGRAM_PORT}"))
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = Dispatcher()
+    stats = LatencyStats(window=args.updates)
+    done = asyncio.Event()
+
+    @dp.message()
+    async def on_message(message: types.Message):
+        stats.observe(time.perf_counter() - telegram.created_at[message.message_id])
+        if stats.count == args.updates:
+            done.set()
+
+    # Оба режима обрабатывают обновления через планировщик, как bot.py
+    scheduler = UpdateScheduler()
+    if mode == "webhook":
+        server = WebhookServer(dp, bot, base_url=f"http://127.0.0.1:{WEBHOOK_PORT}",
+                               host="127.0.0.1", port=WEBHOOK_PORT, scheduler=scheduler)
+        await server.start()
+        receiver = None
+    else:
+        dp.update.outer_middleware(SchedulingMiddleware(scheduler))
+        scheduler.start()
+        receiver = asyncio.create_task(dp.start_polling(bot, polling_timeout=10, handle_signals=False,
+                                                        handle_as_tasks=False))
+        await asyncio.sleep(0.5)
+
+    rng = random.Random(1)
+    publishers = []
+    async with aiohttp.ClientSession() as client:
+        for update_id in range(1, args.updates + 1):
+            publishers.append(asyncio.create_task(telegram.publish(make_update(update_id), client)))
+            await asyncio.sleep(rng.expovariate(1000 / args.interval_ms))
+        await asyncio.wait_for(done.wait(), timeout=60)
+        await asyncio.gather(*publishers)
+
+    if receiver is not None:
+        await dp.stop_polling()
+        await receiver
+        await scheduler.close()
+    else:
+        await server.close()
+    await session.close()
+    await runner.cleanup()
+    return stats
+
+
+async def run(args):
+    print(f"updates={args.updates} rtt={args.rtt_ms}ms mean interval={args.interval_ms}ms")
+    for mode in ("polling", "webhook"):
+        snapshot = (await measure(mode, args)).snapshot()
+        print(f"{mode:<8} update->handler p50={snapshot['p50_ms']:7.2f}ms p99={snapshot['p99_ms']:7.2f}ms "
+              f"avg={snapshot['avg_ms']:7.2f}ms")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Задержка доставки обновлений: polling и webhook")
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--rtt-ms", type=float, default=40)
+    parser.add_argument("--interval-ms", type=float, default=30)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(0 if asyncio.run(run(parse_args())) else 1)
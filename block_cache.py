@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш статуса блокировки пользователей в процессе бота
+
+Бот проверяет блокировку перед каждым обновлением. Статус хранится локально
+с TTL, в том числе для незаблокированных пользователей. Изменения is_blocked
+(автоблокировка в API, админ-бот, manage_blacklist) приходят уведомлением
+из базы и сбрасывают запись сразу, TTL - страховка на случай обрыва.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# TTL статуса "не заблокирован" и "заблокирован" (секунды)
+BLOCK_CACHE_TTL = float(os.getenv("BLOCK_CACHE_TTL", "60"))
+BLOCK_CACHE_BLOCKED_TTL = float(os.getenv("BLOCK_CACHE_BLOCKED_TTL", "300"))
+# Максимум пользователей в кэше
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", "100000"))
+
+
+class BlockStatusCache:
+    """Статус блокировки по user_id с TTL и вытеснением давно неактивных"""
+
+    def __init__(self, ttl: float = BLOCK_CACHE_TTL,
+                 blocked_ttl: float = BLOCK_CACHE_BLOCKED_TTL,
+                 max_size: int = BLOCK_CACHE_SIZE):
+        self.ttl = ttl
+        self.blocked_ttl = blocked_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Растет при каждом сбросе; статус, запрошенный до сброса, не сохраняется
+        self.epoch = 0
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """True/False из кэша или None, если статус нужно запросить"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        blocked, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return blocked
+
+    def set(self, user_id: int, blocked: bool, epoch: Optional[int] = None):
+        """Запомнить статус; epoch - значение self.epoch до запроса статуса"""
+        ttl = self.blocked_ttl if blocked else self.ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        if epoch is not None and epoch != self.epoch:
+            return
+        self._entries[user_id] = (blocked, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.epoch += 1
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -1,16 +1,24 @@
 import os
+import re
 import asyncio
 import logging
-import aiohttp
+import contextvars
+from typing import Any, Awaitable, Callable, Dict
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram import Bot, Dispatcher, BaseMiddleware, types, F
+from aiogram.filters import Command, CommandObject
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from message_filter import get_message_filter, FilterResult
 from achievements import AchievementSystem
+from backend_client import create_backend_client, BACKEND_TRANSPORT, BACKEND_UDS
+from block_cache import BlockStatusCache
+from webhook_server import WebhookServer
+from update_scheduler import UpdateScheduler, SchedulingMiddleware
+from telegram_sender import install_sender, background_sends
+from db_events import DatabaseEvents, CHANNEL_USER_BLOCK, parse_user_block_event
 
 
 load_dotenv()
@@ -22,18 +30,33 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BACKEND_URL = os.getenv("BACKEND_URL")
 
+# База нужна боту только для уведомлений о блокировках (сброс кэша)
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_USER = os.getenv("DB_USER", "bot_user")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "8998")
+DB_NAME = os.getenv("DB_NAME", "support_bot")
+
+# Получение обновлений: polling или webhook (см. webhook_server.py)
+BOT_UPDATE_MODE = os.getenv("BOT_UPDATE_MODE", "polling").lower()
+
+# Как часто писать в лог статистику запросов к API на одно обновление
+BOT_STATS_LOG_EVERY = int(os.getenv("BOT_STATS_LOG_EVERY", "500"))
+
 if not BOT_TOKEN:
     logger.error("BOT_TOKEN not set!")
     exit(1)
 
-if not BACKEND_URL:
+if not BACKEND_URL and not BACKEND_UDS and BACKEND_TRANSPORT == "http":
     logger.error("BACKEND_URL not set!")
     exit(1)
 
 logger.info(f"🤖 Bot starting with token: {BOT_TOKEN[:10]}...")
-logger.info(f"🌐 Backend URL: {BACKEND_URL}")
+logger.info(f"🌐 Backend: {(BACKEND_UDS or BACKEND_URL) if BACKEND_TRANSPORT == 'http' else BACKEND_TRANSPORT}")
 
 bot = Bot(token=BOT_TOKEN)
+# Отправки в Telegram - через общий лимит скорости (ответы раньше фоновых)
+telegram_sender = install_sender(bot)
 dp = Dispatcher(storage=MemoryStorage())
 
 # Инициализируем фильтр сообщений
@@ -81,11 +104,27 @@ def escape_markdown(text: str) -> str:
         return text
     return text.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace(']', '\\]').replace('`', '\\`')
 
+# Статус блокировки: обновляется уведомлениями из базы, TTL - страховка
+block_cache = BlockStatusCache()
+
 async def check_user_blocked(user_id: int) -> bool:
-    """Проверяет заблокирован ли пользователь"""
+    """Проверяет заблокирован ли пользователь (сначала по кэшу)"""
+    blocked = block_cache.get(user_id)
+    if blocked is not None:
+        return blocked
+
     try:
+        epoch = block_cache.epoch
         profile = await api_request("profile", {"user_id": user_id})
-        return profile.get("status") == "ok" and profile.get("is_blocked", False)
+        if profile.get("status") == "ok":
+            blocked = bool(profile.get("is_blocked", False))
+        elif profile.get("status") == "not_found":
+            blocked = False
+        else:
+            # Ошибку API не кэшируем
+            return False
+        block_cache.set(user_id, blocked, epoch)
+        return blocked
     except Exception as e:
         logger.error(f"Error checking user block status: {e}")
         return False
@@ -138,20 +177,137 @@ async def send_blocked_callback(callback: types.CallbackQuery):
     await callback.message.answer(blocked_text, parse_mode='Markdown')
     await callback.answer()
 
+class GatekeeperMiddleware(BaseMiddleware):
+    """
+    Проверка блокировки один раз на обновление, до фильтров и обработчиков
+
+    Заменяет проверку в начале каждого обработчика. Заодно считает,
+    сколько запросов к API уходит на одно обновление.
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.backend_requests = 0
+        self.blocked_updates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        counter = [0]
+        token = update_backend_requests.set(counter)
+        try:
+            user = getattr(event, "from_user", None)
+            if user is not None and await check_user_blocked(user.id):
+                self.blocked_updates += 1
+                state = data.get("state")
+                if state is not None:
+                    await state.clear()
+                if isinstance(event, types.CallbackQuery):
+                    await send_blocked_callback(event)
+                else:
+                    await send_blocked_message(event)
+                return None
+            return await handler(event, data)
+        finally:
+            update_backend_requests.reset(token)
+            self._record(counter[0])
+
+    def _record(self, backend_requests: int):
+        self.updates += 1
+        self.backend_requests += backend_requests
+        if BOT_STATS_LOG_EVERY > 0 and self.updates % BOT_STATS_LOG_EVERY == 0:
+            logger.info(f"📊 {self.stats()}")
+
+    def stats(self) -> Dict:
+        return {
+            "updates": self.updates,
+            "backend_requests": self.backend_requests,
+            "backend_requests_per_update": round(self.backend_requests / self.updates, 3) if self.updates else 0.0,
+            "blocked_updates": self.blocked_updates,
+            "block_cache": block_cache.stats(),
+            "backend": backend.stats(),
+            "scheduler": update_scheduler.stats(),
+            "telegram": telegram_sender.stats(),
+        }
+
+# Обновления одного пользователя - по очереди, разных - параллельно
+update_scheduler = UpdateScheduler()
+
+gatekeeper = GatekeeperMiddleware()
+dp.message.outer_middleware(gatekeeper)
+dp.callback_query.outer_middleware(gatekeeper)
+
+def on_user_block_changed(payload: str):
+    user_id, blocked = parse_user_block_event(payload)
+    block_cache.invalidate(user_id)
+    block_cache.set(user_id, blocked)
+
+block_events = DatabaseEvents({
+    "host": DB_HOST, "port": DB_PORT,
+    "user": DB_USER, "password": DB_PASSWORD,
+    "database": DB_NAME
+})
+block_events.subscribe(CHANNEL_USER_BLOCK, on_user_block_changed)
+# Уведомления за время обрыва потеряны - забываем все статусы
+block_events.on_reconnect(block_cache.clear)
+
+# Одна сессия с keep-alive на весь процесс (или прямой вызов API, см. BACKEND_TRANSPORT)
+backend = create_backend_client(BACKEND_URL)
+
+# Счетчик запросов к API в рамках текущего обновления (см. GatekeeperMiddleware)
+update_backend_requests: contextvars.ContextVar = contextvars.ContextVar("update_backend_requests", default=None)
+
 async def api_request(endpoint: str, data: dict):
     """Простой HTTP запрос к API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{BACKEND_URL}/{endpoint}", json=data) as response:
-                if response.status != 200:
-                    logger.error(f"API returned status {response.status} for {endpoint}")
-                    return {"status": "error", "message": f"HTTP {response.status}"}
-                result = await response.json()
-                logger.info(f"API {endpoint} response: {result}")
-                return result
-    except Exception as e:
-        logger.error(f"API error for {endpoint}: {e}")
-        return {"status": "error", "message": str(e)}
+    counter = update_backend_requests.get()
+    if counter is not None:
+        counter[0] += 1
+    result = await backend.request(endpoint, data)
+    logger.info(f"API {endpoint} response: {result}")
+    return result
+
+class ApiBatch:
+    """
+    Несколько вызовов API одним запросом /batch
+
+        batch = ApiBatch()
+        profile = batch.add("profile", {"user_id": user_id})
+        achievements = batch.add("get_user_achievements", {"user_id": user_id})
+        results = await batch.flush()
+        results[profile], results[achievements]
+
+    С transaction=True API выполняет вызовы в одной транзакции: ошибка
+    любого из них откатывает все.
+    """
+
+    def __init__(self, transaction: bool = False):
+        self.transaction = transaction
+        self.operations = []
+
+    def add(self, endpoint: str, data: dict) -> int:
+        """Поставить вызов в очередь, вернуть индекс его результата"""
+        self.operations.append({"endpoint": endpoint, "data": data})
+        return len(self.operations) - 1
+
+    async def flush(self) -> list:
+        """Отправить накопленные вызовы, результаты - в порядке add()"""
+        operations, self.operations = self.operations, []
+        if not operations:
+            return []
+
+        response = await api_request("batch", {"operations": operations, "transaction": self.transaction})
+        results = response.get("results") or []
+        if response.get("rolled_back") or (self.transaction and response.get("status") == "error"):
+            # Выполненные до ошибки вызовы отменены вместе с ней (или не зафиксированы)
+            results = [
+                result if result.get("status") == "error" else {"status": "error", "message": "rolled back"}
+                for result in results
+            ]
+        # Вызовы без результата (ошибка запроса или пакета) получают общий ответ
+        return results + [response] * (len(operations) - len(results))
 
 async def check_user_achievements(user_id: int, action: str, **kwargs):
     """Проверить и выдать достижения пользователю"""
@@ -329,13 +485,12 @@ async def start(message: types.Message, state: FSMContext):
     await state.clear()
     user_id = message.from_user.id
     
-    # Проверяем профиль
-    profile = await api_request("profile", {"user_id": user_id})
-    
-    # Проверяем черный список
-    if await check_user_blocked(user_id):
-        await send_blocked_message(message)
-        return
+    # Проверяем профиль (блокировку уже проверил GatekeeperMiddleware). Тем же запросом и до чтения
+    # профиля: вернулся после блокировки бота - напоминания, выключенные из-за недоставки, снова включаются
+    batch = ApiBatch()
+    batch.add("restore_reminders", {"user_id": user_id})
+    profile_index = batch.add("profile", {"user_id": user_id})
+    profile = (await batch.flush())[profile_index]
     
     if profile.get("status") == "ok" and profile.get("nickname"):
         nickname = profile.get('nickname')
@@ -387,11 +542,6 @@ async def start(message: types.Message, state: FSMContext):
 @dp.message(UserStates.waiting_nickname)
 async def handle_nickname(message: types.Message, state: FSMContext):
     """Установка никнейма"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        await state.clear()
-        return
-    
     nickname = message.text.strip()
 
     # Проверяем никнейм через фильтр
@@ -425,11 +575,6 @@ async def handle_nickname(message: types.Message, state: FSMContext):
 @dp.message(UserStates.changing_nickname)
 async def handle_nickname_change(message: types.Message, state: FSMContext):
     """Смена никнейма"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        await state.clear()
-        return
-    
     nickname = message.text.strip()
 
     # Проверяем никнейм через фильтр
@@ -469,10 +614,6 @@ async def handle_nickname_change(message: types.Message, state: FSMContext):
 
 async def send_support(message: types.Message, state: FSMContext):
     """Отправить поддержку"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     await state.clear()
     await message.answer("💝 Напиши сообщение поддержки:")
     await state.set_state(UserStates.waiting_message)
@@ -480,10 +621,6 @@ async def send_support(message: types.Message, state: FSMContext):
 
 async def need_help(message: types.Message, state: FSMContext):
     """Запросить помощь"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     await state.clear()
     await message.answer(
         "💭 Расскажи, что случилось?\n\n"
@@ -530,14 +667,45 @@ async def handle_help_someone_button(message: types.Message, state: FSMContext):
     await help_someone(message, state)
 
 
+async def deliver_help_response(recipient_id: int, message_data: dict) -> bool:
+    """Доставить ответ на запрос помощи его автору"""
+    try:
+        # Сообщение другому пользователю - фоновая полоса, ответы в текущий чат идут раньше
+        with background_sends():
+            if message_data["message_type"] == "voice":
+                await bot.send_voice(
+                    chat_id=recipient_id,
+                    voice=message_data["file_id"],
+                    caption="💝 Для тебя пришло сообщение поддержки!\n\n🤗 Кто-то откликнулся на твой запрос."
+                )
+            elif message_data["message_type"] == "video_note":
+                await bot.send_video_note(
+                    chat_id=recipient_id,
+                    video_note=message_data["file_id"]
+                )
+                await bot.send_message(
+                    chat_id=recipient_id,
+                    text="💝 Для тебя пришло сообщение поддержки!\n\n🤗 Кто-то откликнулся на твой запрос."
+                )
+            else:
+                # Экранируем текст для Markdown
+                safe_message_text = escape_markdown(message_data['text'])
+                await bot.send_message(
+                    chat_id=recipient_id,
+                    text=f"💝 Для тебя пришло сообщение поддержки!\n\n"
+                         f"💬 _{safe_message_text}_\n\n"
+                         f"🤗 Кто-то откликнулся на твой запрос. Надеемся, это поможет!",
+                    parse_mode='Markdown'
+                )
+            logger.info(f"Help response delivered from {message_data['user_id']} to {recipient_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to deliver help response: {e}")
+        return False
+
 @dp.message(UserStates.waiting_message)
 async def handle_message(message: types.Message, state: FSMContext):
     """Обработка текстовых, голосовых сообщений и видео кружков"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        await state.clear()
-        return
-    
     data = await state.get_data()
     action = data.get("action")
     
@@ -582,10 +750,16 @@ async def handle_message(message: types.Message, state: FSMContext):
         help_recipient = data.get("help_recipient")
         
         if help_recipient:
-            # Отправляем ответ конкретному человеку
-            result = await api_request("send_support", message_data)
-            logger.info(f"Send support API result: {result}")
+            # Ответ конкретному человеку: сначала сохранение в API, доставка - только после него,
+            # иначе при ошибке API получатель уже увидел бы ответ, а отправитель повторил бы его
+            result = await api_request("respond_to_help", {
+                **message_data,
+                "request_id": help_recipient["id"],
+                "recipient_user_id": help_recipient["user_id"]
+            })
+            logger.info(f"Respond to help API result: {result}")
             if result.get("status") == "success":
+                delivered = await deliver_help_response(help_recipient["user_id"], message_data)
                 # Экранируем никнейм для Markdown
                 safe_recipient_nickname = escape_markdown(help_recipient['nickname'])
                 await message.answer(
@@ -594,58 +768,9 @@ async def handle_message(message: types.Message, state: FSMContext):
                     reply_markup=main_kb,
                     parse_mode='Markdown'
                 )
-        
-                # Отправляем сообщение получателю
-                try:
-                    if message_data["message_type"] == "voice":
-                        await bot.send_voice(
-                            chat_id=help_recipient["user_id"],
-                            voice=message_data["file_id"],
-                            caption="💝 Для тебя пришло сообщение поддержки!\n\n🤗 Кто-то откликнулся на твой запрос."
-                        )
-                    elif message_data["message_type"] == "video_note":
-                        await bot.send_video_note(
-                            chat_id=help_recipient["user_id"],
-                            video_note=message_data["file_id"]
-                        )
-                        await bot.send_message(
-                            chat_id=help_recipient["user_id"],
-                            text="💝 Для тебя пришло сообщение поддержки!\n\n🤗 Кто-то откликнулся на твой запрос."
-                        )
-                    else:
-                        # Экранируем текст для Markdown
-                        safe_message_text = escape_markdown(message_data['text'])
-                        await bot.send_message(
-                            chat_id=help_recipient["user_id"],
-                            text=f"💝 Для тебя пришло сообщение поддержки!\n\n"
-                                 f"💬 _{safe_message_text}_\n\n"
-                                 f"🤗 Кто-то откликнулся на твой запрос. Надеемся, это поможет!",
-                            parse_mode='Markdown'
-                        )
-                    logger.info(f"Help response delivered from {message.from_user.id} to {help_recipient['user_id']}")
-                    
-                    # Увеличиваем рейтинг пользователя за помощь
-                    rating_result = await api_request("increment_rating", {"user_id": message.from_user.id})
-                    if rating_result.get("status") == "success":
-                        new_rating = rating_result.get("new_rating", 0)
-                        logger.info(f"Rating incremented for user {message.from_user.id}, new rating: {new_rating}")
-                        
-                        # Достижения проверяются только при открытии профиля
-                    else:
-                        logger.warning(f"Failed to increment rating for user {message.from_user.id}")
-                    
-                    # Удаляем запрос помощи из базы данных
-                    delete_result = await api_request("delete_help_request", {
-                        "request_id": help_recipient["id"],
-                        "user_id": help_recipient["user_id"]
-                    })
-                    if delete_result.get("status") == "success":
-                        logger.info(f"Help request {help_recipient['id']} deleted after response")
-                    else:
-                        logger.warning(f"Failed to delete help request {help_recipient['id']}")
-                        
-                except Exception as e:
-                    logger.error(f"Failed to deliver help response: {e}")
+                logger.info(f"Rating incremented for user {message.from_user.id}, new rating: {result.get('new_rating', 0)}")
+                # Достижения проверяются только при открытии профиля
+                if not delivered:
                     await message.answer("⚠️ Сообщение сохранено, но возникла проблема с доставкой.")
             else:
                 await message.answer("❌ Ошибка отправки", reply_markup=main_kb)
@@ -676,10 +801,6 @@ async def handle_message(message: types.Message, state: FSMContext):
 
 async def get_support(message: types.Message, state: FSMContext):
     """Получить поддержку"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     await state.clear()
     result = await api_request("get_support", {"user_id": message.from_user.id})
     
@@ -690,10 +811,6 @@ async def get_support(message: types.Message, state: FSMContext):
 
 async def help_someone(message: types.Message, state: FSMContext):
     """Показать запрос помощи (начинаем сначала)"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     await state.clear()
     # Сбрасываем last_seen_id для начала с самого первого сообщения
     await state.update_data(last_seen_help_id=0)
@@ -792,10 +909,6 @@ async def show_help_request_simple(message: types.Message, state: FSMContext):
 
 async def show_profile(message: types.Message, state: FSMContext):
     """Показать профиль пользователя"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     # Очищаем состояние чтобы не было конфликтов
     await state.clear()
     
@@ -890,10 +1003,6 @@ async def show_profile(message: types.Message, state: FSMContext):
 @dp.message(Command("help"))
 async def help_command(message: types.Message):
     """Справка"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     await message.answer(
         "🆘 **Справка:**\n\n"
         "💌 Отправить поддержку - помочь кому-то\n"
@@ -901,7 +1010,8 @@ async def help_command(message: types.Message):
         "🆘 Нужна помощь - попросить поддержку\n"
         "🤝 Помочь кому-нибудь - ответить на чей-то запрос помощи\n"
         "👤 Профиль - посмотреть свою статистику, достижения и изменить никнейм\n"
-        "🏆 Топлист - посмотреть рейтинг лучших помощников\n\n"
+        "🏆 Топлист - посмотреть рейтинг лучших помощников\n"
+        "🕐 /timezone +3 - часовой пояс для напоминаний (по умолчанию московское время)\n\n"
         "🛡️ **Автофильтр:**\n"
         "Бот автоматически проверяет все сообщения на:\n"
         "• Нецензурные выражения (блокировка)\n"
@@ -911,13 +1021,46 @@ async def help_command(message: types.Message):
         parse_mode='Markdown'
     )
 
+# Смещение от UTC: "+3", "-5", "+5:30", "UTC+3"
+UTC_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?\s*([+-]?)(\d{1,2})(?::(\d{2}))?$", re.IGNORECASE)
+
+def parse_utc_offset(text: str):
+    """Смещение от UTC в минутах или None, если формат не распознан"""
+    match = UTC_OFFSET_RE.match(text.strip())
+    if not match:
+        return None
+    sign, hours, minutes = match.groups()
+    offset = int(hours) * 60 + int(minutes or 0)
+    return -offset if sign == "-" else offset
+
+@dp.message(Command("timezone"))
+async def timezone_command(message: types.Message, command: CommandObject):
+    """Часовой пояс для напоминаний: они приходят с 12:00 до 20:00 по местному времени"""
+    offset = parse_utc_offset(command.args or "")
+    if offset is None:
+        await message.answer(
+            "🕐 Укажи смещение от UTC, например:\n"
+            "/timezone +3 - Москва\n"
+            "/timezone +5 - Екатеринбург\n"
+            "/timezone +5:30 - Индия",
+            reply_markup=main_kb
+        )
+        return
+
+    result = await api_request("set_timezone", {"user_id": message.from_user.id, "utc_offset_minutes": offset})
+    if result.get("status") == "success":
+        hours, minutes = divmod(abs(offset), 60)
+        await message.answer(
+            f"✅ Часовой пояс: UTC{'-' if offset < 0 else '+'}{hours}{f':{minutes:02d}' if minutes else ''}\n"
+            "Напоминания будут приходить с 12:00 до 20:00 по твоему времени",
+            reply_markup=main_kb
+        )
+    else:
+        await message.answer(f"❌ Не удалось сохранить часовой пояс: {result.get('message', 'ошибка сервера')}", reply_markup=main_kb)
+
 @dp.callback_query(F.data == "help_respond")
 async def handle_help_respond(callback: types.CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Помочь'"""
-    if await check_user_blocked(callback.from_user.id):
-        await send_blocked_callback(callback)
-        return
-    
     data = await state.get_data()
     current_request = data.get("current_request")
     
@@ -942,10 +1085,6 @@ async def handle_help_respond(callback: types.CallbackQuery, state: FSMContext):
 @dp.callback_query(F.data == "help_next")
 async def handle_help_next(callback: types.CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Дальше'"""
-    if await check_user_blocked(callback.from_user.id):
-        await send_blocked_callback(callback)
-        return
-    
     # Удаляем последние 2 сообщения (видео кружок + текст или просто текст + предыдущий текст)
     try:
         # Получаем ID текущего сообщения с кнопками
@@ -969,10 +1108,6 @@ async def handle_help_next(callback: types.CallbackQuery, state: FSMContext):
 @dp.callback_query(F.data == "help_menu")
 async def handle_help_menu(callback: types.CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Главное меню'"""
-    if await check_user_blocked(callback.from_user.id):
-        await send_blocked_callback(callback)
-        return
-    
     await callback.message.answer("🏠 Главное меню", reply_markup=main_kb)
     await state.clear()
     await callback.answer()
@@ -1046,10 +1181,6 @@ async def handle_help_complaint(callback: types.CallbackQuery, state: FSMContext
 @dp.callback_query(F.data == "change_nickname")
 async def handle_change_nickname(callback: types.CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Сменить никнейм'"""
-    if await check_user_blocked(callback.from_user.id):
-        await send_blocked_callback(callback)
-        return
-    
     # Отправляем новое сообщение для смены никнейма, не редактируя профиль
     await callback.message.answer(
         "✏️ **Смена никнейма**\n\n"
@@ -1063,10 +1194,6 @@ async def handle_change_nickname(callback: types.CallbackQuery, state: FSMContex
 
 async def show_toplist(message: types.Message, state: FSMContext):
     """Показать топ-лист пользователя"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     user_id = message.from_user.id
     logger.info(f"Toplist button pressed by user {user_id}")
     
@@ -1164,10 +1291,6 @@ async def show_toplist(message: types.Message, state: FSMContext):
 @dp.message()
 async def unknown(message: types.Message, state: FSMContext):
     """Неизвестные сообщения"""
-    if await check_user_blocked(message.from_user.id):
-        await send_blocked_message(message)
-        return
-    
     # Проверяем все текстовые сообщения через фильтр
     if message.text:
         filter_result = message_filter.check_message(message.from_user.id, message.text, "text")
@@ -1181,7 +1304,28 @@ async def unknown(message: types.Message, state: FSMContext):
 async def main():
     """Запуск бота"""
     logger.info("Starting bot...")
-    await dp.start_polling(bot, skip_updates=True)
+    await backend.start()
+    try:
+        await block_events.start()
+    except Exception as e:
+        logger.warning(f"⚠️ Block notifications unavailable, relying on cache TTL: {e}")
+    try:
+        if BOT_UPDATE_MODE == "webhook":
+            await WebhookServer(dp, bot, scheduler=update_scheduler).run()
+        else:
+            # Webhook, оставшийся от запуска в режиме webhook, мешает getUpdates
+            await bot.delete_webhook(drop_pending_updates=True)
+            dp.update.outer_middleware(SchedulingMiddleware(update_scheduler))
+            update_scheduler.start()
+            try:
+                # Без задач на каждое обновление: при полной очереди polling ждет
+                await dp.start_polling(bot, skip_updates=True, handle_as_tasks=False)
+            finally:
+                await update_scheduler.close()
+    finally:
+        await block_events.close()
+        await backend.close()
+        await telegram_sender.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
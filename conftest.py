@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры для тестов, которым нужен PostgreSQL
+
+Тесты работают во временной схеме базы из переменных DB_*
+и пропускаются, если база недоступна.
+"""
+
+import os
+import uuid
+import asyncio
+
+import asyncpg
+import pytest
+
+
+def _db_settings() -> dict:
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", "5432")),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "8998"),
+        "database": os.getenv("DB_NAME", "support_bot"),
+    }
+
+
+async def _execute(sql: str):
+    conn = await asyncpg.connect(timeout=5, **_db_settings())
+    try:
+        await conn.execute(sql)
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def pg_schema():
+    """Параметры подключения к пустой временной схеме"""
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    try:
+        asyncio.run(_execute(f"CREATE SCHEMA {schema}"))
+    except Exception as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+    settings = _db_settings()
+    settings["server_settings"] = {"search_path": schema}
+    yield settings
+
+    asyncio.run(_execute(f"DROP SCHEMA {schema} CASCADE"))
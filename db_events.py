@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Подписка на уведомления PostgreSQL (LISTEN/NOTIFY)
+
+Триггеры из migrations.py сообщают об изменениях, которые влияют на данные
+в памяти процесса (блокировки пользователей, сообщения поддержки).
+Уведомления приходят и от изменений, сделанных в обход API (админ-бот, скрипты).
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Каналы уведомлений
+CHANNEL_USER_BLOCK = "user_block_changed"        # payload: "<user_id>:<0|1>"
+CHANNEL_SUPPORT_MESSAGE = "support_message_changed"  # payload: "<+|->:<message_id>:<user_id>"
+CHANNEL_USER_REMINDERS = "user_reminders_changed"  # payload: "<user_id>:<0|1>:<utc_offset_minutes>"
+
+# Пауза перед переподключением после обрыва соединения (секунды)
+RECONNECT_DELAY = 5
+
+
+def parse_user_block_event(payload: str) -> Tuple[int, bool]:
+    """Разобрать уведомление о блокировке: (user_id, is_blocked)"""
+    user_id, blocked = payload.split(":")
+    return int(user_id), blocked == "1"
+
+
+def parse_support_message_event(payload: str) -> Tuple[bool, int, int]:
+    """Разобрать уведомление о сообщении поддержки: (добавлено, message_id, user_id)"""
+    op, message_id, user_id = payload.split(":")
+    return op == "+", int(message_id), int(user_id)
+
+
+def parse_user_reminders_event(payload: str) -> Tuple[int, bool, int]:
+    """Разобрать уведомление о напоминаниях: (user_id, получает ли напоминания, смещение от UTC в минутах)"""
+    user_id, enabled, utc_offset = payload.split(":")
+    return int(user_id), enabled == "1", int(utc_offset)
+
+
+class DatabaseEvents:
+    """Отдельное соединение, слушающее каналы уведомлений"""
+
+    def __init__(self, connect_kwargs: Dict):
+        self.connect_kwargs = connect_kwargs
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+        # Вызываются после переподключения: уведомления за время обрыва потеряны
+        self._reconnect_callbacks: List[Callable[[], object]] = []
+        self._conn: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """Подписать обработчик на канал (до вызова start)"""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def on_reconnect(self, callback: Callable[[], object]):
+        """Обработчик, который перечитывает состояние после переподключения"""
+        self._reconnect_callbacks.append(callback)
+
+    async def start(self):
+        """Открыть соединение и начать слушать каналы"""
+        self._closed = False
+        await self._connect()
+
+    async def close(self):
+        """Перестать слушать и закрыть соединение"""
+        self._closed = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(**self.connect_kwargs)
+        for channel in self._subscribers:
+            await conn.add_listener(channel, self._dispatch)
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+        logger.info(f"👂 Listening for database events: {', '.join(self._subscribers) or '-'}")
+
+    def _dispatch(self, connection, pid, channel: str, payload: str):
+        for callback in self._subscribers.get(channel, []):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Error handling database event {channel}:{payload}: {e}")
+
+    def _on_terminated(self, connection):
+        if self._closed:
+            return
+        logger.warning("⚠️ Database events connection lost, reconnecting...")
+        self._conn = None
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._closed:
+            try:
+                await asyncio.sleep(RECONNECT_DELAY)
+                await self._connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Database events reconnect failed: {e}")
+                continue
+
+            for callback in self._reconnect_callbacks:
+                try:
+                    result = callback()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Error refreshing state after reconnect: {e}")
+            return
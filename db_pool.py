@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Общий пул соединений с PostgreSQL
+Создается один раз при старте процесса и используется всеми обработчиками
+"""
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Настройки пула
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+# Соединение пересоздается после указанного количества запросов
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+# Простаивающие соединения закрываются через указанное время (секунды)
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+
+
+class _Binding:
+    """Соединение, закрепленное за текущей задачей (см. DatabasePool.bind)"""
+
+    def __init__(self, pool: "DatabasePool", conn: asyncpg.Connection, transaction: bool):
+        self.pool = pool
+        self.conn = conn
+        self.transaction = transaction
+        self.on_commit: List[Callable[[], None]] = []
+
+
+_binding: contextvars.ContextVar = contextvars.ContextVar("db_pool_binding", default=None)
+
+
+class DatabasePool:
+    """Пул соединений asyncpg со статистикой занятости и ожидания"""
+
+    def __init__(self, host: str, port: int, user: str, password: str, database: str,
+                 min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE,
+                 acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+                 max_queries: int = DB_POOL_MAX_QUERIES,
+                 max_inactive_lifetime: float = DB_POOL_MAX_INACTIVE_LIFETIME,
+                 server_settings: Optional[Dict[str, str]] = None):
+        self.connect_kwargs = {
+            "host": host, "port": port,
+            "user": user, "password": password,
+            "database": database
+        }
+        if server_settings:
+            self.connect_kwargs["server_settings"] = server_settings
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_queries = max_queries
+        self.max_inactive_lifetime = max_inactive_lifetime
+
+        self._pool: Optional[asyncpg.Pool] = None
+
+        # Статистика
+        self.wait_stats = LatencyStats()
+        self.waiting = 0
+        self.acquire_timeouts = 0
+
+    @property
+    def is_started(self) -> bool:
+        return self._pool is not None
+
+    async def start(self):
+        """Создать пул (вызывается один раз при старте приложения)"""
+        if self._pool is not None:
+            return
+        self._pool = await asyncpg.create_pool(
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_queries=self.max_queries,
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+            **self.connect_kwargs
+        )
+        logger.info(f"🔗 Database pool started: min={self.min_size}, max={self.max_size}, "
+                    f"max_queries={self.max_queries}, acquire_timeout={self.acquire_timeout}s")
+
+    async def close(self):
+        """Закрыть пул и все соединения"""
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        await pool.close()
+        logger.info("🔌 Database pool closed")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Взять соединение из пула на время блока async with"""
+        binding = self._current_binding()
+        if binding is not None:
+            # Внутри bind() все запросы идут через закрепленное соединение
+            yield binding.conn
+            return
+
+        if self._pool is None:
+            raise RuntimeError("Database pool is not started")
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            logger.error(f"❌ Database pool acquire timeout after {self.acquire_timeout}s")
+            raise
+        finally:
+            self.waiting -= 1
+        self.wait_stats.observe(time.perf_counter() - started)
+
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    def _current_binding(self) -> Optional[_Binding]:
+        binding = _binding.get()
+        return binding if binding is not None and binding.pool is self else None
+
+    @asynccontextmanager
+    async def bind(self, transaction: bool = False):
+        """
+        Закрепить одно соединение за текущей задачей на время блока
+
+        Все acquire() внутри блока получают это соединение. С transaction=True
+        блок выполняется в одной транзакции: исключение откатывает ее, а
+        колбэки after_commit() вызываются только после успешной фиксации.
+        """
+        if self._current_binding() is not None:
+            raise RuntimeError("Connection is already bound to this task")
+
+        async with self.acquire() as conn:
+            binding = _Binding(self, conn, transaction)
+            token = _binding.set(binding)
+            try:
+                if transaction:
+                    async with conn.transaction():
+                        yield conn
+                else:
+                    yield conn
+            finally:
+                _binding.reset(token)
+
+        for callback in binding.on_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ after_commit callback failed: {e}")
+
+    def after_commit(self, callback: Callable[[], None]):
+        """
+        Выполнить изменение данных в памяти после фиксации в базе
+
+        Вне транзакции bind() колбэк вызывается сразу, при откате - отбрасывается.
+        """
+        binding = self._current_binding()
+        if binding is not None and binding.transaction:
+            binding.on_commit.append(callback)
+        else:
+            callback()
+
+    def stats(self) -> Dict:
+        """Занятость пула и время ожидания соединения"""
+        if self._pool is None:
+            return {"started": False}
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "started": True,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": self.waiting,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait": self.wait_stats.snapshot()
+        }
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Таблица лидеров в памяти процесса API
+
+Дерево Фенвика над значениями рейтинга хранит, сколько незаблокированных
+пользователей имеют каждый рейтинг. Позиция пользователя и топ-N считаются
+за O(log R) без обращения к базе. Из базы таблица читается только при старте
+и по запросу (/rebuild_leaderboard, переподключение к уведомлениям).
+"""
+
+import bisect
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Начальный размер дерева; растет удвоением при появлении большего рейтинга
+INITIAL_CAPACITY = 1024
+
+
+class FenwickTree:
+    """Префиксные суммы по индексам 0..size-1"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    @classmethod
+    def from_counts(cls, counts: List[int]) -> "FenwickTree":
+        """Построить дерево за O(n) по готовым значениям"""
+        tree = cls(len(counts))
+        for i, value in enumerate(counts, 1):
+            tree._tree[i] += value
+            parent = i + (i & -i)
+            if parent <= tree.size:
+                tree._tree[parent] += tree._tree[i]
+        return tree
+
+    def add(self, index: int, delta: int):
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> int:
+        """Сумма значений с индексами 0..index"""
+        total = 0
+        i = min(index + 1, self.size)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k: int) -> int:
+        """Наименьший индекс, для которого prefix(index) >= k (k >= 1)"""
+        position = 0
+        step = 1 << (self.size.bit_length() - 1) if self.size else 0
+        while step:
+            candidate = position + step
+            if candidate <= self.size and self._tree[candidate] < k:
+                position = candidate
+                k -= self._tree[candidate]
+            step >>= 1
+        return position
+
+
+class Leaderboard:
+    """Рейтинги пользователей с позицией и топом за O(log R)"""
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self._capacity = capacity
+        self._tree = FenwickTree(capacity)
+        # рейтинг -> отсортированные user_id незаблокированных пользователей
+        self._buckets: Dict[int, List[int]] = {}
+        # Только пользователи с записью в ratings
+        self._ratings: Dict[int, int] = {}
+        self._nicknames: Dict[int, str] = {}
+        self._blocked: Set[int] = set()
+        self._loaded = False
+        # Изменения, пришедшие во время загрузки, переигрываются после нее
+        self._pending: Optional[List[Tuple]] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def total(self) -> int:
+        """Число пользователей в рейтинге (без заблокированных)"""
+        return self._tree.prefix(self._tree.size - 1)
+
+    async def load(self, conn: asyncpg.Connection):
+        """Перечитать таблицу из базы"""
+        self._pending = []
+        try:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                users = await conn.fetch("SELECT user_id, nickname, is_blocked FROM users")
+                ratings = await conn.fetch("SELECT user_id, rating FROM ratings")
+
+            pending, self._pending = self._pending, None
+            self._nicknames = {row["user_id"]: row["nickname"] for row in users}
+            self._blocked = {row["user_id"] for row in users if row["is_blocked"]}
+            self._ratings = {row["user_id"]: row["rating"] or 0 for row in ratings}
+            self._rebuild()
+            for change in pending:
+                self._apply(*change)
+            self._loaded = True
+        finally:
+            self._pending = None
+
+        logger.info(f"🏆 Leaderboard loaded: {len(self._ratings)} rated users, {self.total} ranked")
+
+    def add_rating(self, user_id: int, delta: int):
+        """Изменить рейтинг пользователя на delta"""
+        self._record("rating", user_id, delta)
+
+    def set_nickname(self, user_id: int, nickname: str):
+        self._record("nickname", user_id, nickname)
+
+    def set_blocked(self, user_id: int, blocked: bool):
+        """Заблокированные пользователи не участвуют в рейтинге"""
+        self._record("block", user_id, blocked)
+
+    def has_user(self, user_id: int) -> bool:
+        """Пользователь есть в таблице users"""
+        return user_id in self._nicknames
+
+    def rating(self, user_id: int) -> int:
+        return self._ratings.get(user_id, 0)
+
+    def rank(self, user_id: int) -> int:
+        """Позиция: 1 + число незаблокированных пользователей с рейтингом выше"""
+        rating = self.rating(user_id)
+        return 1 + self.total - self._tree.prefix(rating)
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        """Первые limit пользователей: по убыванию рейтинга, при равенстве по user_id"""
+        result = []
+        remaining = self.total
+        while remaining > 0 and len(result) < limit:
+            rating = self._tree.find(remaining)
+            for user_id in self._buckets.get(rating, []):
+                result.append({
+                    "position": len(result) + 1,
+                    "nickname": self._nicknames.get(user_id),
+                    "rating": rating,
+                    "user_id": user_id
+                })
+                if len(result) >= limit:
+                    break
+            remaining = self._tree.prefix(rating - 1) if rating > 0 else 0
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self._loaded,
+            "rated_users": len(self._ratings),
+            "ranked_users": self.total,
+            "blocked_users": len(self._blocked),
+            "capacity": self._capacity,
+        }
+
+    def _record(self, kind: str, user_id: int, value):
+        if self._pending is not None:
+            self._pending.append((kind, user_id, value))
+        self._apply(kind, user_id, value)
+
+    def _apply(self, kind: str, user_id: int, value):
+        if kind == "rating":
+            old = self._ratings.get(user_id)
+            new = max(0, (old or 0) + value)
+            if old is not None:
+                self._unrank(user_id, old)
+            self._ratings[user_id] = new
+            self._rank(user_id, new)
+        elif kind == "nickname":
+            self._nicknames[user_id] = value
+        elif kind == "block":
+            if value == (user_id in self._blocked):
+                return
+            rating = self._ratings.get(user_id)
+            if value:
+                if rating is not None:
+                    self._unrank(user_id, rating)
+                self._blocked.add(user_id)
+            else:
+                self._blocked.discard(user_id)
+                if rating is not None:
+                    self._rank(user_id, rating)
+
+    def _rank(self, user_id: int, rating: int):
+        if user_id in self._blocked:
+            return
+        if rating >= self._capacity:
+            # self._ratings уже содержит новый рейтинг - пересборка его учтет
+            self._rebuild()
+            return
+        bisect.insort(self._buckets.setdefault(rating, []), user_id)
+        self._tree.add(rating, 1)
+
+    def _unrank(self, user_id: int, rating: int):
+        if user_id in self._blocked:
+            return
+        bucket = self._buckets.get(rating)
+        if not bucket:
+            return
+        index = bisect.bisect_left(bucket, user_id)
+        if index < len(bucket) and bucket[index] == user_id:
+            bucket.pop(index)
+            if not bucket:
+                del self._buckets[rating]
+            self._tree.add(rating, -1)
+
+    def _rebuild(self):
+        """Пересобрать корзины и дерево из self._ratings"""
+        top_rating = max(self._ratings.values(), default=0)
+        while top_rating >= self._capacity:
+            self._capacity *= 2
+
+        buckets: Dict[int, List[int]] = {}
+        for user_id, rating in self._ratings.items():
+            if user_id not in self._blocked:
+                buckets.setdefault(rating, []).append(user_id)
+        counts = [0] * self._capacity
+        for rating, bucket in buckets.items():
+            bucket.sort()
+            counts[rating] = len(bucket)
+
+        self._buckets = buckets
+        self._tree = FenwickTree.from_counts(counts)
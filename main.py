@@ -1,18 +1,31 @@
 import os
+import inspect
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List
-import asyncpg
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, Dict
+import json
 import logging
+from datetime import timedelta
 from achievements import AchievementSystem
+from api_codec import MsgpackRoute
+from db_pool import DatabasePool
+from leaderboard import Leaderboard
+from profile_cache import ProfileCache, MISS
+from db_events import (
+    DatabaseEvents, CHANNEL_USER_BLOCK, CHANNEL_SUPPORT_MESSAGE, CHANNEL_USER_REMINDERS,
+    parse_user_block_event, parse_support_message_event, parse_user_reminders_event
+)
+from migrations import run_migrations
+from rating_aggregator import RatingAggregator, RATING_WRITE_BEHIND
+from support_sampler import SupportSampler
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 # Конфигурация БД
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
@@ -20,22 +33,129 @@ DB_USER = os.getenv("DB_USER", "bot_user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "8998")
 DB_NAME = os.getenv("DB_NAME", "support_bot")
 
+# Применять миграции схемы при старте API
+DB_RUN_MIGRATIONS = os.getenv("DB_RUN_MIGRATIONS", "true").lower() in ("1", "true", "yes")
+
+# Unix-сокет API для бота на том же хосте (python main.py; для uvicorn - ключ --uds)
+API_UDS = os.getenv("API_UDS")
+
+# Автоматическая блокировка после стольких жалоб
+AUTO_BLOCK_COMPLAINTS = 5
+
+# Максимум операций в одном запросе /batch
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "20"))
+
+# Максимум пользователей в одном запросе /get_reminder_messages и /disable_reminders
+REMINDER_BULK_MAX = int(os.getenv("REMINDER_BULK_MAX", "1000"))
+
+# Исходы доставки напоминаний (см. reminder_scheduler.py); после недоставимых напоминания выключены
+REMINDER_OUTCOMES = ("ok", "forbidden", "chat_not_found", "rate_limited", "transient", "no_message")
+UNREACHABLE_OUTCOMES = ["forbidden", "chat_not_found"]
+
+# Максимум пользователей на страницу /get_users_with_reminders (и размер страницы потока)
+REMINDER_USERS_PAGE_MAX = int(os.getenv("REMINDER_USERS_PAGE_MAX", "10000"))
+
+# Допустимые часовые пояса пользователей (минуты к UTC): от UTC-12:00 до UTC+14:00
+MIN_UTC_OFFSET = -12 * 60
+MAX_UTC_OFFSET = 14 * 60
+
 # Логируем конфигурацию при запуске
 logger.info(f"📊 Database config: {DB_HOST}:{DB_PORT}, DB: {DB_NAME}, User: {DB_USER}")
 
-async def get_connection():
-    """Подключение к БД"""
+# Общий пул соединений, создается при старте приложения
+db_pool = DatabasePool(
+    host=DB_HOST, port=DB_PORT,
+    user=DB_USER, password=DB_PASSWORD,
+    database=DB_NAME
+)
+
+# Уведомления базы об изменениях, влияющих на данные в памяти
+db_events = DatabaseEvents(db_pool.connect_kwargs)
+
+# Пул сообщений поддержки для случайного выбора без ORDER BY RANDOM()
+support_sampler = SupportSampler()
+
+# Таблица лидеров для /toplist и достижения top_position
+leaderboard = Leaderboard()
+
+# Отложенная запись рейтинга (включается RATING_WRITE_BEHIND)
+rating_aggregator = RatingAggregator(db_pool)
+
+# Кэш /profile, сбрасывается эндпоинтами, которые меняют данные профиля
+profile_cache = ProfileCache()
+
+def on_ratings_flushed(user_ids: List[int]):
+    for user_id in user_ids:
+        profile_cache.invalidate(user_id)
+
+rating_aggregator.add_flush_listener(on_ratings_flushed)
+
+def on_user_block_changed(payload: str):
+    user_id, blocked = parse_user_block_event(payload)
+    support_sampler.set_blocked(user_id, blocked)
+    leaderboard.set_blocked(user_id, blocked)
+    profile_cache.invalidate(user_id)
+
+def on_user_reminders_changed(payload: str):
+    # reminders_enabled меняют и другие процессы API (планировщик, /disable_reminders)
+    user_id, _, _ = parse_user_reminders_event(payload)
+    profile_cache.invalidate(user_id)
+
+def on_support_message_changed(payload: str):
+    added, message_id, user_id = parse_support_message_event(payload)
+    if added:
+        support_sampler.add(message_id, user_id)
+    else:
+        support_sampler.remove(message_id)
+
+def apply_rating_increment(user_id: int, write_behind: bool):
+    """+1 к рейтингу в данных в памяти (после фиксации в базе)"""
+    if write_behind:
+        rating_aggregator.add(user_id)
+    leaderboard.add_rating(user_id, 1)
+    profile_cache.invalidate(user_id)
+
+async def reload_support_sampler():
+    async with db_pool.acquire() as conn:
+        await support_sampler.load(conn)
+
+async def reload_leaderboard():
+    # Пока таблица читается, накопленные приращения не пишутся, иначе учтутся дважды
+    async with rating_aggregator.paused():
+        async with db_pool.acquire() as conn:
+            await leaderboard.load(conn)
+
+db_events.subscribe(CHANNEL_USER_BLOCK, on_user_block_changed)
+db_events.subscribe(CHANNEL_SUPPORT_MESSAGE, on_support_message_changed)
+db_events.subscribe(CHANNEL_USER_REMINDERS, on_user_reminders_changed)
+# Уведомления за время обрыва потеряны - перечитываем данные целиком
+db_events.on_reconnect(reload_support_sampler)
+db_events.on_reconnect(reload_leaderboard)
+db_events.on_reconnect(profile_cache.clear)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Запуск и остановка общих ресурсов приложения"""
+    await db_pool.start()
+    if DB_RUN_MIGRATIONS:
+        async with db_pool.acquire() as conn:
+            await run_migrations(conn)
+    # Сначала подписка, потом загрузка: изменения во время загрузки не теряются
+    await db_events.start()
+    await reload_support_sampler()
+    await reload_leaderboard()
+    if RATING_WRITE_BEHIND:
+        rating_aggregator.start()
     try:
-        conn = await asyncpg.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        logger.info("🔗 Database connection successful")
-        return conn
-    except Exception as e:
-        logger.error(f"❌ Database connection failed: {e}")
-        raise
+        yield
+    finally:
+        await rating_aggregator.close()
+        await db_events.close()
+        await db_pool.close()
+
+app = FastAPI(lifespan=lifespan)
+# Тела запросов и ответов в msgpack по Content-Type/Accept, по умолчанию JSON
+app.router.route_class = MsgpackRoute
 
 # Модели данных
 class SetNickname(BaseModel):
@@ -56,12 +176,61 @@ class ReminderMessageQuery(BaseModel):
     user_id: int
     last_seen_id: Optional[int] = 0
 
+class ReminderMessagesQuery(BaseModel):
+    users: List[ReminderMessageQuery]
+
+class ReminderStateUpdate(BaseModel):
+    user_ids: List[int]
+    last_seen_ids: List[int]
+    # Время последней отправки (Unix-секунды), None - не менялось
+    last_sent_at: List[Optional[int]]
+    # Исход последней попытки доставки, None - не менялся
+    last_outcomes: Optional[List[Optional[str]]] = None
+
+class DisableReminders(BaseModel):
+    user_ids: List[int]
+    # Исход доставки каждого пользователя (forbidden или chat_not_found)
+    outcomes: List[str]
+
+class SetTimezone(BaseModel):
+    user_id: int
+    # Смещение местного времени от UTC в минутах (Москва - 180)
+    utc_offset_minutes: int
+
+class ReminderBuckets(BaseModel):
+    # Только пользователи этих корзин (user_id % bucket_count), см. reminder_leases.py
+    bucket_count: Optional[int] = None
+    buckets: Optional[List[int]] = None
+
+class ReminderUsersQuery(ReminderBuckets):
+    # Только пользователи этого часового пояса
+    utc_offset_minutes: Optional[int] = None
+    # Страница по ключу: пользователи с user_id > after_user_id, не больше limit
+    after_user_id: Optional[int] = None
+    limit: Optional[int] = None
+
+class ClaimReminderLeases(BaseModel):
+    worker_id: str
+    bucket_count: int
+    ttl_seconds: float
+
+class ReleaseReminderLeases(BaseModel):
+    worker_id: str
+
 class Message(BaseModel):
     user_id: int
     text: Optional[str] = None
     file_id: Optional[str] = None
     message_type: str = "text"  # "text", "voice" или "video_note"
 
+class HelpResponse(BaseModel):
+    user_id: int  # Кто отвечает
+    request_id: int
+    recipient_user_id: int  # Автор запроса помощи
+    text: Optional[str] = None
+    file_id: Optional[str] = None
+    message_type: str = "text"
+
 class ReminderSettings(BaseModel):
     user_id: int
     reminders_enabled: bool
@@ -77,6 +246,14 @@ class CheckAchievementsQuery(BaseModel):
     action: str
     data: Optional[dict] = {}
 
+class BatchOperation(BaseModel):
+    endpoint: str  # Имя POST-эндпоинта без слэша, например "profile"
+    data: dict = {}
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    transaction: bool = False
+
 # API эндпоинты
 @app.get("/")
 async def index():
@@ -86,114 +263,83 @@ async def index():
 async def set_nickname(data: SetNickname):
     """Установка никнейма"""
     logger.info(f"🔍 API: Attempting to set nickname '{data.nickname}' for user {data.user_id}")
-    
-    try:
-        conn = await get_connection()
-        logger.info("🔗 Database connection established")
-        
-        # Проверяем, есть ли уже такой никнейм у другого пользователя
-        existing_user = await conn.fetchrow(
-            "SELECT user_id FROM users WHERE nickname = $1", 
-            data.nickname
-        )
-        logger.info(f"🔍 Existing user check: {existing_user}")
-        
-        # Если никнейм занят другим пользователем - ошибка
-        if existing_user and existing_user['user_id'] != data.user_id:
-            await conn.close()
-            logger.warning(f"❌ Nickname '{data.nickname}' already taken by user {existing_user['user_id']}")
-            return {"status": "error", "message": "Nickname already taken"}
-        
-        # Если это тот же пользователь - просто обновляем (или ничего не делаем)
-        if existing_user and existing_user['user_id'] == data.user_id:
-            await conn.close()
-            logger.info(f"✅ User already has this nickname: {data.user_id} -> {data.nickname}")
-            return {"status": "success"}
 
-        # Создание/обновление пользователя
-        logger.info(f"💾 Creating/updating user {data.user_id} with nickname '{data.nickname}'")
-        await conn.execute("""
-            INSERT INTO users (user_id, nickname) VALUES ($1, $2)
-            ON CONFLICT (user_id) DO UPDATE SET nickname = EXCLUDED.nickname
-        """, data.user_id, data.nickname)
-        
-        # Проверяем, что данные действительно сохранились
-        saved_user = await conn.fetchrow("SELECT nickname FROM users WHERE user_id = $1", data.user_id)
-        logger.info(f"🔍 Verification check: {saved_user}")
-        
-        await conn.close()
-        
+    try:
+        async with db_pool.acquire() as conn:
+            # Проверяем, есть ли уже такой никнейм у другого пользователя
+            existing_user = await conn.fetchrow(
+                "SELECT user_id FROM users WHERE nickname = $1",
+                data.nickname
+            )
+            logger.info(f"🔍 Existing user check: {existing_user}")
+
+            # Если никнейм занят другим пользователем - ошибка
+            if existing_user and existing_user['user_id'] != data.user_id:
+                logger.warning(f"❌ Nickname '{data.nickname}' already taken by user {existing_user['user_id']}")
+                return {"status": "error", "message": "Nickname already taken"}
+
+            # Если это тот же пользователь - просто обновляем (или ничего не делаем)
+            if existing_user and existing_user['user_id'] == data.user_id:
+                logger.info(f"✅ User already has this nickname: {data.user_id} -> {data.nickname}")
+                return {"status": "success"}
+
+            # Создание/обновление пользователя
+            logger.info(f"💾 Creating/updating user {data.user_id} with nickname '{data.nickname}'")
+            await conn.execute("""
+                INSERT INTO users (user_id, nickname) VALUES ($1, $2)
+                ON CONFLICT (user_id) DO UPDATE SET nickname = EXCLUDED.nickname
+            """, data.user_id, data.nickname)
+
+            # Проверяем, что данные действительно сохранились
+            saved_user = await conn.fetchrow("SELECT nickname FROM users WHERE user_id = $1", data.user_id)
+            logger.info(f"🔍 Verification check: {saved_user}")
+
+        db_pool.after_commit(lambda: profile_cache.invalidate(data.user_id))
         if saved_user and saved_user['nickname'] == data.nickname:
+            db_pool.after_commit(lambda: leaderboard.set_nickname(data.user_id, data.nickname))
             logger.info(f"✅ User saved successfully: {data.user_id} -> {data.nickname}")
             return {"status": "success"}
         else:
             logger.error(f"❌ Failed to save user: {data.user_id}, saved: {saved_user}")
             return {"status": "error", "message": "Failed to save nickname"}
-            
+
     except Exception as e:
         logger.error(f"❌ Exception in set_nickname: {type(e).__name__}: {e}")
         import traceback
         logger.error(f"❌ Traceback: {traceback.format_exc()}")
         return {"status": "error", "message": f"Database error: {str(e)}"}
 
+# Профиль целиком одним запросом
+PROFILE_QUERY = """
+    SELECT u.user_id, u.nickname, u.is_blocked, u.reminders_enabled, u.complaints_count,
+           COALESCE(r.rating, 0) AS rating
+    FROM users u
+    LEFT JOIN ratings r ON r.user_id = u.user_id
+    WHERE u.user_id = $1
+"""
+
 @app.post("/profile")
 async def get_profile(data: UserProfile):
     """Получение профиля"""
     try:
-        conn = await get_connection()
-        
-        # Проверяем, существует ли столбец reminders_enabled
-        column_exists = await conn.fetchval("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = 'users' AND column_name = 'reminders_enabled'
-            )
-        """)
-        
-        if column_exists:
-            user = await conn.fetchrow(
-                "SELECT user_id, nickname, is_blocked, reminders_enabled FROM users WHERE user_id = $1", 
-                data.user_id
-            )
-        else:
-            user = await conn.fetchrow(
-                "SELECT user_id, nickname, is_blocked FROM users WHERE user_id = $1", 
-                data.user_id
-            )
-        
-        # Получаем рейтинг из таблицы ratings
-        try:
-            rating_row = await conn.fetchrow(
-                "SELECT rating FROM ratings WHERE user_id = $1", 
-                data.user_id
-            )
-            rating = rating_row["rating"] if rating_row else 0
-        except:
-            rating = 0
-        
-        # Получаем количество жалоб на пользователя
-        complaints_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM complaints WHERE original_user_id = $1", 
-            data.user_id
-        ) or 0
-        
-        await conn.close()
-        
+        user = profile_cache.get(data.user_id)
+        if user is MISS:
+            epoch = profile_cache.epoch
+            async with db_pool.acquire() as conn:
+                row = await conn.fetchrow(PROFILE_QUERY, data.user_id)
+            user = dict(row) if row else None
+            profile_cache.put(data.user_id, user, epoch)
+
         if user:
-            # Определяем значение reminders_enabled
-            if column_exists and "reminders_enabled" in user:
-                reminders_enabled = user["reminders_enabled"] if user["reminders_enabled"] is not None else True
-            else:
-                reminders_enabled = True  # По умолчанию включены
-            
             return {
                 "status": "ok",
                 "user_id": user["user_id"],
                 "nickname": user["nickname"],
-                "rating": rating,
-                "complaints_count": complaints_count,
+                # Приращения, еще не записанные в базу (write-behind)
+                "rating": user["rating"] + rating_aggregator.unflushed(data.user_id),
+                "complaints_count": user["complaints_count"],
                 "is_blocked": user["is_blocked"],
-                "reminders_enabled": reminders_enabled
+                "reminders_enabled": user["reminders_enabled"]
             }
         else:
             return {"status": "not_found"}
@@ -207,12 +353,11 @@ async def get_profile(data: UserProfile):
 async def send_support(data: Message):
     """Отправка поддержки"""
     try:
-        conn = await get_connection()
-        result = await conn.execute(
-            "INSERT INTO messages (user_id, text, file_id, message_type, type) VALUES ($1, $2, $3, $4, 'support')",
-            data.user_id, data.text, data.file_id, data.message_type
-        )
-        await conn.close()
+        async with db_pool.acquire() as conn:
+            result = await conn.execute(
+                "INSERT INTO messages (user_id, text, file_id, message_type, type) VALUES ($1, $2, $3, $4, 'support')",
+                data.user_id, data.text, data.file_id, data.message_type
+            )
         logger.info(f"✅ Support message saved: user_id={data.user_id}, type={data.message_type}")
         return {"status": "success"}
     except Exception as e:
@@ -223,32 +368,72 @@ async def send_support(data: Message):
 async def send_request(data: Message):
     """Запрос помощи"""
     try:
-        conn = await get_connection()
-        result = await conn.execute(
-            "INSERT INTO messages (user_id, text, file_id, message_type, type) VALUES ($1, $2, $3, $4, 'request')",
-            data.user_id, data.text, data.file_id, data.message_type
-        )
-        await conn.close()
+        async with db_pool.acquire() as conn:
+            result = await conn.execute(
+                "INSERT INTO messages (user_id, text, file_id, message_type, type) VALUES ($1, $2, $3, $4, 'request')",
+                data.user_id, data.text, data.file_id, data.message_type
+            )
         logger.info(f"✅ Help request saved: user_id={data.user_id}, type={data.message_type}")
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Error: {e}")
         return {"status": "error"}
 
+# Сколько кандидатов из пула проверить в базе, прежде чем перейти к запросу
+SUPPORT_LOOKUP_ATTEMPTS = 3
+
+async def pick_support_message(conn, user_id: int):
+    """Случайное сообщение поддержки не от самого пользователя и не от заблокированного автора"""
+    for _ in range(SUPPORT_LOOKUP_ATTEMPTS):
+        message_id = support_sampler.sample(exclude_user_id=user_id)
+        if message_id is None:
+            break
+
+        message = await conn.fetchrow("""
+            SELECT m.text, m.user_id, u.nickname, u.is_blocked
+            FROM messages m
+            JOIN users u ON m.user_id = u.user_id
+            WHERE m.id = $1 AND m.type = 'support'
+        """, message_id)
+
+        # Пул отстал от базы (уведомление еще не пришло) - поправляем и пробуем снова
+        if message is None:
+            support_sampler.remove(message_id)
+            continue
+        if message["is_blocked"]:
+            support_sampler.set_blocked(message["user_id"], True)
+            continue
+        if message["user_id"] != user_id:
+            return message
+
+    # Пул пуст или почти весь свой: случайная точка по первичному ключу
+    # и первое подходящее сообщение после нее (с переходом в начало)
+    return await conn.fetchrow("""
+        WITH pivot AS (
+            SELECT floor(random() * (SELECT COALESCE(MAX(id), 0) FROM messages))::int AS id
+        )
+        (SELECT m.text, m.user_id, u.nickname
+         FROM messages m
+         JOIN users u ON m.user_id = u.user_id
+         WHERE m.type = 'support' AND m.user_id != $1 AND u.is_blocked = FALSE
+           AND m.id >= (SELECT id FROM pivot)
+         ORDER BY m.id LIMIT 1)
+        UNION ALL
+        (SELECT m.text, m.user_id, u.nickname
+         FROM messages m
+         JOIN users u ON m.user_id = u.user_id
+         WHERE m.type = 'support' AND m.user_id != $1 AND u.is_blocked = FALSE
+         ORDER BY m.id LIMIT 1)
+        LIMIT 1
+    """, user_id)
+
 @app.post("/get_support")
 async def get_support(data: UserProfile):
     """Получение поддержки"""
     try:
-        conn = await get_connection()
-        message = await conn.fetchrow("""
-            SELECT m.text, u.nickname 
-            FROM messages m
-            JOIN users u ON m.user_id = u.user_id
-            WHERE m.type = 'support' AND m.user_id != $1
-            ORDER BY RANDOM() LIMIT 1
-        """, data.user_id)
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            message = await pick_support_message(conn, data.user_id)
+
         if message:
             return {
                 "status": "text",
@@ -261,36 +446,77 @@ async def get_support(data: UserProfile):
         logger.error(f"Error: {e}")
         return {"status": "error"}
 
+# Следующее сообщение ленты после last_seen_id, а если его нет - первое с начала.
+# Обе ветки идут по индексу (type, id); вторая выполняется, только если первая пуста.
+FEED_QUERY = """
+    (SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id, FALSE AS wrapped
+     FROM messages m
+     JOIN users u ON m.user_id = u.user_id
+     WHERE m.type = $3 AND m.user_id != $1 AND m.id > $2
+     ORDER BY m.id ASC LIMIT 1)
+    UNION ALL
+    (SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id, TRUE AS wrapped
+     FROM messages m
+     JOIN users u ON m.user_id = u.user_id
+     WHERE m.type = $3 AND m.user_id != $1 AND m.id <= $2
+     ORDER BY m.id ASC LIMIT 1)
+    LIMIT 1
+"""
+
+# То же для многих пользователей сразу: FEED_QUERY в LATERAL для каждой пары
+# (user_id, last_seen_id). Пользователи без подходящего сообщения в ответ не попадают.
+FEED_BULK_QUERY = """
+    SELECT q.user_id AS for_user_id, f.*
+    FROM unnest($1::bigint[], $2::int[]) AS q(user_id, last_seen_id)
+    CROSS JOIN LATERAL (
+        (SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id, FALSE AS wrapped
+         FROM messages m
+         JOIN users u ON m.user_id = u.user_id
+         WHERE m.type = $3 AND m.user_id != q.user_id AND m.id > q.last_seen_id
+         ORDER BY m.id ASC LIMIT 1)
+        UNION ALL
+        (SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id, TRUE AS wrapped
+         FROM messages m
+         JOIN users u ON m.user_id = u.user_id
+         WHERE m.type = $3 AND m.user_id != q.user_id AND m.id <= q.last_seen_id
+         ORDER BY m.id ASC LIMIT 1)
+        LIMIT 1
+    ) f
+"""
+
+async def fetch_feed_message(conn, message_type: str, user_id: int, last_seen_id: Optional[int]):
+    """Следующее по кругу сообщение типа message_type не от самого пользователя"""
+    return await conn.fetchrow(FEED_QUERY, user_id, last_seen_id or 0, message_type)
+
+async def fetch_feed_messages(conn, message_type: str, users: List[ReminderMessageQuery]):
+    """fetch_feed_message для списка пользователей одним запросом"""
+    return await conn.fetch(
+        FEED_BULK_QUERY,
+        [user.user_id for user in users],
+        [user.last_seen_id or 0 for user in users],
+        message_type
+    )
+
+def feed_message_dict(row) -> dict:
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "file_id": row["file_id"],
+        "message_type": row["message_type"],
+        "nickname": row["nickname"],
+        "user_id": row["user_id"]
+    }
+
 @app.post("/get_help_request")
 async def get_help_request(data: HelpRequestQuery):
     """Получение запроса помощи по порядку (FIFO)"""
     try:
-        conn = await get_connection()
-        
-        # Сначала пытаемся найти сообщение с id > last_seen_id
-        request = await conn.fetchrow("""
-            SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id 
-            FROM messages m
-            JOIN users u ON m.user_id = u.user_id
-            WHERE m.type = 'request' AND m.user_id != $1 AND m.id > $2
-            ORDER BY m.id ASC LIMIT 1
-        """, data.user_id, data.last_seen_id)
-        
-        # Если не найдено сообщение с id > last_seen_id, начинаем сначала
-        if not request:
-            request = await conn.fetchrow("""
-                SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id 
-                FROM messages m
-                JOIN users u ON m.user_id = u.user_id
-                WHERE m.type = 'request' AND m.user_id != $1
-                ORDER BY m.id ASC LIMIT 1
-            """, data.user_id)
-            
-            if request:
-                logger.info(f"No more messages after id {data.last_seen_id}, starting from beginning for user {data.user_id}")
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            request = await fetch_feed_message(conn, "request", data.user_id, data.last_seen_id)
+
+        if request and request["wrapped"]:
+            logger.info(f"No more messages after id {data.last_seen_id}, starting from beginning for user {data.user_id}")
+
         if request:
             logger.info(f"Showing help request id={request['id']} to user {data.user_id}, last_seen_id was {data.last_seen_id}")
             return {
@@ -316,96 +542,79 @@ async def delete_help_request(data: dict):
     try:
         request_id = data.get("request_id")
         user_id = data.get("user_id")  # ID автора запроса
-        
-        conn = await get_connection()
-        
-        # Удаляем запрос помощи
-        result = await conn.execute(
-            "DELETE FROM messages WHERE id = $1 AND user_id = $2 AND type = 'request'",
-            request_id, user_id
-        )
-        await conn.close()
-        
+
+        async with db_pool.acquire() as conn:
+            # Удаляем запрос помощи
+            result = await conn.execute(
+                "DELETE FROM messages WHERE id = $1 AND user_id = $2 AND type = 'request'",
+                request_id, user_id
+            )
+
         logger.info(f"✅ Help request deleted: id={request_id}, user_id={user_id}")
         return {"status": "success"}
-        
+
     except Exception as e:
         logger.error(f"Error deleting help request: {e}")
         return {"status": "error"}
 
+# Жалоба одним запросом: запрос помощи переносится в complaints, счетчик жалоб
+# автора увеличивается, и при достижении порога автор блокируется.
+# Строка автора блокируется (FOR UPDATE), поэтому одновременные жалобы
+# видят счетчик друг друга и порог срабатывает ровно один раз.
+SUBMIT_COMPLAINT_QUERY = """
+    WITH moved AS (
+        DELETE FROM messages
+        WHERE id = $1 AND type = 'request'
+        RETURNING id, user_id, text, file_id, message_type, created_at
+    ),
+    complaint AS (
+        INSERT INTO complaints (message_id, original_user_id, complainer_user_id, text, file_id, message_type, created_at)
+        SELECT id, user_id, $2, text, file_id, message_type, created_at FROM moved
+    ),
+    author AS (
+        SELECT u.user_id, u.complaints_count + 1 AS complaints_count, u.is_blocked AS was_blocked
+        FROM users u
+        JOIN moved ON u.user_id = moved.user_id
+        FOR UPDATE OF u
+    )
+    UPDATE users u
+    SET complaints_count = author.complaints_count,
+        is_blocked = author.was_blocked OR author.complaints_count >= $3
+    FROM author
+    WHERE u.user_id = author.user_id
+    RETURNING u.user_id, u.complaints_count, (u.is_blocked AND NOT author.was_blocked) AS auto_blocked
+"""
+
 @app.post("/submit_complaint")
 async def submit_complaint(data: dict):
     """Подача жалобы на сообщение"""
     try:
         request_id = data.get("request_id")
         complainer_user_id = data.get("complainer_user_id")
-        
-        conn = await get_connection()
-        
-        # Получаем данные сообщения, на которое жалуются
-        message_data = await conn.fetchrow("""
-            SELECT id, user_id, text, file_id, message_type, created_at
-            FROM messages 
-            WHERE id = $1 AND type = 'request'
-        """, request_id)
-        
-        if not message_data:
-            await conn.close()
-            return {"status": "message_not_found"}
-        
-        # Переносим сообщение в таблицу жалоб
-        await conn.execute("""
-            INSERT INTO complaints (message_id, original_user_id, complainer_user_id, text, file_id, message_type, created_at)
-            VALUES ($1, $2, $3, $4, $5, $6, $7)
-        """, 
-            message_data["id"], 
-            message_data["user_id"], 
-            complainer_user_id,
-            message_data["text"], 
-            message_data["file_id"], 
-            message_data["message_type"], 
-            message_data["created_at"]
-        )
-        
-        # Удаляем оригинальное сообщение из таблицы messages
-        await conn.execute("DELETE FROM messages WHERE id = $1", request_id)
-        
-        # Проверяем количество жалоб на пользователя
-        original_user_id = message_data["user_id"]
-        complaints_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM complaints WHERE original_user_id = $1", 
-            original_user_id
-        ) or 0
-        
-        # Автоматическая блокировка при 5 или более жалобах
-        auto_blocked = False
-        if complaints_count >= 5:
-            # Проверяем, не заблокирован ли уже пользователь
-            is_already_blocked = await conn.fetchval(
-                "SELECT is_blocked FROM users WHERE user_id = $1", 
-                original_user_id
+
+        async with db_pool.acquire() as conn:
+            author = await conn.fetchrow(
+                SUBMIT_COMPLAINT_QUERY, request_id, complainer_user_id, AUTO_BLOCK_COMPLAINTS
             )
-            
-            if not is_already_blocked:
-                # Блокируем пользователя
-                await conn.execute(
-                    "UPDATE users SET is_blocked = TRUE WHERE user_id = $1", 
-                    original_user_id
-                )
-                auto_blocked = True
-                logger.warning(f"🚫 AUTO-BLOCKED user {original_user_id} after {complaints_count} complaints")
-        
-        await conn.close()
-        
+
+        if not author:
+            return {"status": "message_not_found"}
+        author_id = author["user_id"]
+        db_pool.after_commit(lambda: profile_cache.invalidate(author_id))
+
+        complaints_count = author["complaints_count"]
+        if author["auto_blocked"]:
+            logger.warning(f"🚫 AUTO-BLOCKED user {author['user_id']} after {complaints_count} complaints")
+
         logger.info(f"✅ Complaint submitted: message_id={request_id}, by_user={complainer_user_id}, complaints_total={complaints_count}")
-        
+
         result = {"status": "success", "complaints_count": complaints_count}
-        if auto_blocked:
+        if author["auto_blocked"]:
             result["auto_blocked"] = True
             result["message"] = f"Пользователь автоматически заблокирован после {complaints_count} жалоб"
-        
+
         return result
-        
+
     except Exception as e:
         logger.error(f"Error submitting complaint: {e}")
         return {"status": "error"}
@@ -414,259 +623,514 @@ async def submit_complaint(data: dict):
 async def increment_rating(data: UserProfile):
     """Увеличение рейтинга пользователя на +1"""
     try:
-        conn = await get_connection()
-        
-        # Увеличиваем рейтинг на 1, создаем запись если ее нет
-        await conn.execute("""
-            INSERT INTO ratings (user_id, rating) VALUES ($1, 1)
-            ON CONFLICT (user_id) DO UPDATE SET rating = ratings.rating + 1
-        """, data.user_id)
-        
-        # Получаем новый рейтинг
-        new_rating = await conn.fetchval(
-            "SELECT rating FROM ratings WHERE user_id = $1", 
-            data.user_id
-        )
-        
-        await conn.close()
-        
+        if rating_aggregator.is_started:
+            # Запись в базу позже, новый рейтинг считаем по таблице лидеров
+            if not leaderboard.has_user(data.user_id):
+                logger.error(f"Error incrementing rating: unknown user {data.user_id}")
+                return {"status": "error"}
+            new_rating = leaderboard.rating(data.user_id) + 1
+            db_pool.after_commit(lambda: apply_rating_increment(data.user_id, write_behind=True))
+            return {"status": "success", "new_rating": new_rating}
+
+        async with db_pool.acquire() as conn:
+            # Увеличиваем рейтинг на 1, создаем запись если ее нет
+            new_rating = await conn.fetchval("""
+                INSERT INTO ratings (user_id, rating) VALUES ($1, 1)
+                ON CONFLICT (user_id) DO UPDATE SET rating = ratings.rating + 1
+                RETURNING rating
+            """, data.user_id)
+
+        db_pool.after_commit(lambda: apply_rating_increment(data.user_id, write_behind=False))
+
         logger.info(f"✅ Rating incremented for user {data.user_id}, new rating: {new_rating}")
         return {"status": "success", "new_rating": new_rating}
-        
+
     except Exception as e:
         logger.error(f"Error incrementing rating: {e}")
         return {"status": "error"}
 
+# Ответ на запрос помощи одним запросом: сообщение поддержки сохраняется,
+# запрос удаляется из очереди, рейтинг отвечающего растет на 1 - все или ничего.
+# $7 = FALSE, когда рейтинг пишется отложенно (RATING_WRITE_BEHIND).
+RESPOND_TO_HELP_QUERY = """
+    WITH support AS (
+        INSERT INTO messages (user_id, text, file_id, message_type, type)
+        VALUES ($1, $2, $3, $4, 'support')
+        RETURNING id
+    ),
+    answered AS (
+        DELETE FROM messages
+        WHERE id = $5 AND user_id = $6 AND type = 'request'
+        RETURNING id
+    ),
+    rating AS (
+        INSERT INTO ratings (user_id, rating)
+        SELECT $1, 1 WHERE $7
+        ON CONFLICT (user_id) DO UPDATE SET rating = ratings.rating + 1
+        RETURNING rating
+    )
+    SELECT (SELECT id FROM support) AS support_id,
+           (SELECT rating FROM rating) AS new_rating,
+           EXISTS (SELECT 1 FROM answered) AS request_deleted
+"""
+
+@app.post("/respond_to_help")
+async def respond_to_help(data: HelpResponse):
+    """Ответ на запрос помощи: вместо /send_support, /increment_rating и /delete_help_request"""
+    try:
+        write_behind = rating_aggregator.is_started
+        if write_behind and not leaderboard.has_user(data.user_id):
+            logger.error(f"Error responding to help: unknown user {data.user_id}")
+            return {"status": "error"}
+
+        async with db_pool.acquire() as conn:
+            row = await conn.fetchrow(
+                RESPOND_TO_HELP_QUERY,
+                data.user_id, data.text, data.file_id, data.message_type,
+                data.request_id, data.recipient_user_id, not write_behind
+            )
+
+        new_rating = leaderboard.rating(data.user_id) + 1 if write_behind else row["new_rating"]
+        db_pool.after_commit(lambda: apply_rating_increment(data.user_id, write_behind))
+
+        if not row["request_deleted"]:
+            logger.info(f"ℹ️ Help request {data.request_id} was already answered or removed")
+        logger.info(f"✅ Help response saved: from={data.user_id} to={data.recipient_user_id}, "
+                    f"request_id={data.request_id}, new rating: {new_rating}")
+        return {"status": "success", "new_rating": new_rating, "request_deleted": row["request_deleted"]}
+
+    except Exception as e:
+        logger.error(f"Error responding to help: {e}")
+        return {"status": "error"}
+
 @app.post("/toggle_reminders")
 async def toggle_reminders(data: ToggleReminders):
     """Переключение настройки напоминаний"""
     try:
-        conn = await get_connection()
-        
-        # Проверяем, существует ли столбец reminders_enabled
-        column_exists = await conn.fetchval("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = 'users' AND column_name = 'reminders_enabled'
-            )
-        """)
-        
-        if not column_exists:
-            # Если столбца нет, добавляем его
-            await conn.execute("ALTER TABLE users ADD COLUMN reminders_enabled BOOLEAN DEFAULT TRUE")
-            logger.info(f"Added reminders_enabled column to users table")
-        
-        # Получаем текущее состояние напоминаний
-        current_state = await conn.fetchval(
-            "SELECT reminders_enabled FROM users WHERE user_id = $1", 
-            data.user_id
-        )
-        
-        if current_state is None:
-            # Пользователь не найден
-            user_exists = await conn.fetchval("SELECT EXISTS(SELECT 1 FROM users WHERE user_id = $1)", data.user_id)
-            if not user_exists:
-                await conn.close()
-                return {"status": "error", "message": "User not found"}
-            else:
-                # Пользователь есть, но reminders_enabled NULL - устанавливаем TRUE
-                current_state = True
-                await conn.execute(
-                    "UPDATE users SET reminders_enabled = TRUE WHERE user_id = $1",
-                    data.user_id
+        async with db_pool.acquire() as conn:
+            # Переключаем состояние одним запросом; выбор пользователя важнее автоматического выключения,
+            # поэтому /restore_reminders его больше не трогает
+            new_state = await conn.fetchval("""
+                WITH cleared AS (
+                    UPDATE reminder_state SET last_outcome = NULL
+                    WHERE user_id = $1 AND last_outcome = ANY($2::varchar[])
                 )
-        
-        # Переключаем состояние
-        new_state = not current_state
-        await conn.execute(
-            "UPDATE users SET reminders_enabled = $1 WHERE user_id = $2",
-            new_state, data.user_id
-        )
-        
-        await conn.close()
-        
-        logger.info(f"✅ Reminders toggled for user {data.user_id}: {current_state} -> {new_state}")
+                UPDATE users SET reminders_enabled = NOT reminders_enabled WHERE user_id = $1 RETURNING reminders_enabled
+            """, data.user_id, UNREACHABLE_OUTCOMES)
+
+        db_pool.after_commit(lambda: profile_cache.invalidate(data.user_id))
+        if new_state is None:
+            # Пользователь не найден
+            return {"status": "error", "message": "User not found"}
+
+        logger.info(f"✅ Reminders toggled for user {data.user_id}: {not new_state} -> {new_state}")
         return {"status": "success", "reminders_enabled": new_state}
-        
+
     except Exception as e:
         logger.error(f"Error toggling reminders: {e}")
         return {"status": "error"}
 
+@app.post("/disable_reminders")
+async def disable_reminders(data: DisableReminders):
+    """Выключить напоминания пользователям, до которых бот не достучался (заблокировали бота, удалили аккаунт)"""
+    if len(data.user_ids) > REMINDER_BULK_MAX:
+        return {"status": "error", "message": f"Too many users (max {REMINDER_BULK_MAX})"}
+    if len(data.user_ids) != len(data.outcomes):
+        return {"status": "error", "message": "Columns must have equal length"}
+    if any(outcome not in UNREACHABLE_OUTCOMES for outcome in data.outcomes):
+        return {"status": "error", "message": "Only unreachable outcomes disable reminders"}
+    try:
+        async with db_pool.acquire() as conn:
+            # Одним запросом на всю часть раунда; планировщик узнает об этом уведомлением.
+            # Исход пишется тем же запросом: по нему /restore_reminders включит напоминания обратно
+            rows = await conn.fetch("""
+                WITH outcomes AS (
+                    INSERT INTO reminder_state (user_id, last_outcome)
+                    SELECT t.user_id, t.outcome
+                    FROM unnest($1::bigint[], $2::varchar[]) AS t(user_id, outcome)
+                    JOIN users u ON u.user_id = t.user_id
+                    ON CONFLICT (user_id) DO UPDATE SET last_outcome = EXCLUDED.last_outcome
+                )
+                UPDATE users SET reminders_enabled = FALSE
+                WHERE user_id = ANY($1::bigint[]) AND reminders_enabled = TRUE
+                RETURNING user_id
+            """, data.user_ids, data.outcomes)
+
+        disabled = [row["user_id"] for row in rows]
+
+        def invalidate():
+            for user_id in disabled:
+                profile_cache.invalidate(user_id)
+
+        db_pool.after_commit(invalidate)
+        if disabled:
+            logger.info(f"🔕 Reminders disabled for {len(disabled)} unreachable users")
+        return {"status": "success", "disabled": len(disabled)}
+
+    except Exception as e:
+        logger.error(f"Error disabling reminders: {e}")
+        return {"status": "error"}
+
+@app.post("/restore_reminders")
+async def restore_reminders(data: ToggleReminders):
+    """Пользователь вернулся в бота: включить напоминания, если их выключили из-за недоставки"""
+    try:
+        async with db_pool.acquire() as conn:
+            restored = await conn.fetchval("""
+                WITH cleared AS (
+                    UPDATE reminder_state SET last_outcome = NULL
+                    WHERE user_id = $1 AND last_outcome = ANY($2::varchar[])
+                    RETURNING user_id
+                )
+                UPDATE users SET reminders_enabled = TRUE
+                WHERE user_id IN (SELECT user_id FROM cleared)
+                RETURNING user_id
+            """, data.user_id, UNREACHABLE_OUTCOMES)
+
+        if restored is None:
+            return {"status": "success", "restored": False}
+
+        db_pool.after_commit(lambda: profile_cache.invalidate(data.user_id))
+        logger.info(f"🔔 Reminders restored for returning user {data.user_id}")
+        return {"status": "success", "restored": True}
+
+    except Exception as e:
+        logger.error(f"Error restoring reminders: {e}")
+        return {"status": "error"}
+
+@app.post("/set_timezone")
+async def set_timezone(data: SetTimezone):
+    """Часовой пояс пользователя: окно напоминаний считается по его местному времени"""
+    if not MIN_UTC_OFFSET <= data.utc_offset_minutes <= MAX_UTC_OFFSET or data.utc_offset_minutes % 15:
+        return {"status": "error", "message": "Offset must be between UTC-12:00 and UTC+14:00 in 15-minute steps"}
+    try:
+        async with db_pool.acquire() as conn:
+            updated = await conn.fetchval(
+                "UPDATE users SET utc_offset_minutes = $2 WHERE user_id = $1 RETURNING user_id",
+                data.user_id, data.utc_offset_minutes
+            )
+
+        if updated is None:
+            return {"status": "error", "message": "User not found"}
+
+        logger.info(f"🕐 Timezone set for user {data.user_id}: UTC{data.utc_offset_minutes:+d} min")
+        return {"status": "success", "utc_offset_minutes": data.utc_offset_minutes}
+
+    except Exception as e:
+        logger.error(f"Error setting timezone: {e}")
+        return {"status": "error"}
+
 @app.post("/get_reminder_message")
 async def get_reminder_message(data: ReminderMessageQuery):
     """Получение сообщения поддержки для напоминания (аналогично get_help_request)"""
     try:
-        conn = await get_connection()
-        
-        # Сначала пытаемся найти сообщение с id > last_seen_id
-        message = await conn.fetchrow("""
-            SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id 
-            FROM messages m
-            JOIN users u ON m.user_id = u.user_id
-            WHERE m.type = 'support' AND m.user_id != $1 AND m.id > $2
-            ORDER BY m.id ASC LIMIT 1
-        """, data.user_id, data.last_seen_id)
-        
-        # Если не найдено сообщение с id > last_seen_id, начинаем сначала
-        if not message:
-            message = await conn.fetchrow("""
-                SELECT m.id, m.text, m.file_id, m.message_type, u.nickname, m.user_id 
-                FROM messages m
-                JOIN users u ON m.user_id = u.user_id
-                WHERE m.type = 'support' AND m.user_id != $1
-                ORDER BY m.id ASC LIMIT 1
-            """, data.user_id)
-            
-            if message:
-                logger.info(f"No more support messages after id {data.last_seen_id}, starting from beginning for user {data.user_id}")
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            message = await fetch_feed_message(conn, "support", data.user_id, data.last_seen_id)
+
+        if message and message["wrapped"]:
+            logger.info(f"No more support messages after id {data.last_seen_id}, starting from beginning for user {data.user_id}")
+
         if message:
             logger.info(f"Reminder message found for user {data.user_id}: message_id={message['id']}")
-            return {
-                "status": "ok",
-                "message": {
-                    "id": message["id"],
-                    "text": message["text"],
-                    "file_id": message["file_id"],
-                    "message_type": message["message_type"],
-                    "nickname": message["nickname"],
-                    "user_id": message["user_id"]
-                }
-            }
+            return {"status": "ok", "message": feed_message_dict(message)}
         else:
             return {"status": "no_messages"}
     except Exception as e:
         logger.error(f"Error getting reminder message: {e}")
         return {"status": "error"}
 
-@app.get("/get_users_with_reminders")
-async def get_users_with_reminders():
-    """Получение списка пользователей с включенными напоминаниями"""
-    try:
-        conn = await get_connection()
-        
-        # Проверяем, существует ли столбец reminders_enabled
-        column_exists = await conn.fetchval("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = 'users' AND column_name = 'reminders_enabled'
+@app.post("/get_reminder_messages")
+async def get_reminder_messages(data: ReminderMessagesQuery):
+    """Сообщения для напоминаний сразу многим пользователям (один запрос к БД)"""
+    if len(data.users) > REMINDER_BULK_MAX:
+        return {"status": "error", "message": f"Too many users (max {REMINDER_BULK_MAX})"}
+    try:
+        async with db_pool.acquire() as conn:
+            rows = await fetch_feed_messages(conn, "support", data.users)
+
+        logger.info(f"Reminder messages found for {len(rows)}/{len(data.users)} users")
+        return {
+            "status": "ok",
+            "messages": [
+                {"for_user_id": row["for_user_id"], "message": feed_message_dict(row)} for row in rows
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error getting reminder messages: {e}")
+        return {"status": "error"}
+
+# Пользователи, которых уже нет в users, пропускаются; время отправки не откатывается назад
+SAVE_REMINDER_STATE_QUERY = """
+    INSERT INTO reminder_state (user_id, last_seen_id, last_sent_at, last_outcome)
+    SELECT t.user_id, t.last_seen_id, to_timestamp(t.sent_at), t.outcome
+    FROM unnest($1::bigint[], $2::int[], $3::bigint[], $4::varchar[]) AS t(user_id, last_seen_id, sent_at, outcome)
+    JOIN users u ON u.user_id = t.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        last_seen_id = EXCLUDED.last_seen_id,
+        last_sent_at = GREATEST(EXCLUDED.last_sent_at, reminder_state.last_sent_at),
+        last_outcome = COALESCE(EXCLUDED.last_outcome, reminder_state.last_outcome)
+"""
+
+@app.post("/get_reminder_state")
+async def get_reminder_state(data: ReminderBuckets = ReminderBuckets()):
+    """Состояние планировщика напоминаний столбцами, отсортированное по user_id"""
+    try:
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT user_id, last_seen_id, EXTRACT(EPOCH FROM last_sent_at)::bigint AS sent_at
+                FROM reminder_state
+                WHERE $1::int[] IS NULL OR user_id % $2 = ANY($1)
+                ORDER BY user_id
+            """, data.buckets, data.bucket_count)
+        return {
+            "status": "ok",
+            "user_ids": [row["user_id"] for row in rows],
+            "last_seen_ids": [row["last_seen_id"] for row in rows],
+            "last_sent_at": [row["sent_at"] for row in rows]
+        }
+    except Exception as e:
+        logger.error(f"Error getting reminder state: {e}")
+        return {"status": "error"}
+
+@app.post("/save_reminder_state")
+async def save_reminder_state(data: ReminderStateUpdate):
+    """Сохранить изменения состояния планировщика одним запросом"""
+    last_outcomes = data.last_outcomes if data.last_outcomes is not None else [None] * len(data.user_ids)
+    if not len(data.user_ids) == len(data.last_seen_ids) == len(data.last_sent_at) == len(last_outcomes):
+        return {"status": "error", "message": "Columns must have equal length"}
+    if any(outcome is not None and outcome not in REMINDER_OUTCOMES for outcome in last_outcomes):
+        return {"status": "error", "message": "Unknown delivery outcome"}
+    try:
+        async with db_pool.acquire() as conn:
+            await conn.execute(
+                SAVE_REMINDER_STATE_QUERY, data.user_ids, data.last_seen_ids, data.last_sent_at, last_outcomes
             )
-        """)
-        
-        if column_exists:
-            users = await conn.fetch("""
-                SELECT user_id FROM users 
-                WHERE (reminders_enabled = TRUE OR reminders_enabled IS NULL) AND is_blocked = FALSE
-            """)
-        else:
-            # Если столбца нет, считаем что у всех напоминания включены
-            users = await conn.fetch("""
-                SELECT user_id FROM users 
-                WHERE is_blocked = FALSE
-            """)
-        
-        await conn.close()
-        
+        return {"status": "ok", "saved": len(data.user_ids)}
+    except Exception as e:
+        logger.error(f"Error saving reminder state: {e}")
+        return {"status": "error"}
+
+# Страница по ключу user_id из частичного индекса idx_users_reminders (LIMIT NULL - все)
+REMINDER_USERS_QUERY = """
+    SELECT user_id, utc_offset_minutes FROM users
+    WHERE reminders_enabled = TRUE AND is_blocked = FALSE
+      AND ($1::smallint IS NULL OR utc_offset_minutes = $1)
+      AND ($2::int[] IS NULL OR user_id % $3 = ANY($2))
+      AND ($4::bigint IS NULL OR user_id > $4)
+    ORDER BY user_id
+    LIMIT $5
+"""
+
+async def fetch_reminder_users(conn, data: ReminderUsersQuery, after_user_id: Optional[int], limit: Optional[int]):
+    return await conn.fetch(
+        REMINDER_USERS_QUERY,
+        data.utc_offset_minutes, data.buckets, data.bucket_count, after_user_id, limit
+    )
+
+@app.get("/get_users_with_reminders")
+@app.post("/get_users_with_reminders")
+async def get_users_with_reminders(data: ReminderUsersQuery = ReminderUsersQuery()):
+    """
+    Получение списка пользователей с включенными напоминаниями и их часовых поясов
+
+    С limit - одна страница; next_after_user_id передается как after_user_id
+    следующего запроса (None - страниц больше нет). Без limit - все сразу.
+    """
+    limit = min(data.limit, REMINDER_USERS_PAGE_MAX) if data.limit is not None else None
+    if limit is not None and limit < 1:
+        return {"status": "error", "message": "limit must be positive"}
+    try:
+        async with db_pool.acquire() as conn:
+            users = await fetch_reminder_users(conn, data, data.after_user_id, limit)
+
         user_ids = [user["user_id"] for user in users]
         logger.info(f"Found {len(user_ids)} users with enabled reminders")
-        
-        return {"status": "ok", "user_ids": user_ids}
+
+        result = {
+            "status": "ok",
+            "user_ids": user_ids,
+            "utc_offsets": [user["utc_offset_minutes"] for user in users]
+        }
+        if limit is not None:
+            result["next_after_user_id"] = user_ids[-1] if len(user_ids) == limit else None
+        return result
     except Exception as e:
         logger.error(f"Error getting users with reminders: {e}")
         return {"status": "error"}
 
+@app.post("/stream_users_with_reminders")
+async def stream_users_with_reminders(data: ReminderUsersQuery = ReminderUsersQuery()):
+    """
+    Те же пользователи потоком NDJSON: {"user_id": ..., "utc_offset_minutes": ...} на строку
+
+    База читается страницами по ключу, поэтому память API не растет с числом
+    пользователей. Последняя строка - {"status": "ok", "count": N} или
+    {"status": "error", ...}: по ней клиент отличает полный ответ от оборванного.
+    """
+    async def lines():
+        after_user_id, count = data.after_user_id, 0
+        try:
+            while True:
+                async with db_pool.acquire() as conn:
+                    users = await fetch_reminder_users(conn, data, after_user_id, REMINDER_USERS_PAGE_MAX)
+                if users:
+                    yield "".join(
+                        f'{{"user_id": {user["user_id"]}, "utc_offset_minutes": {user["utc_offset_minutes"]}}}\n'
+                        for user in users
+                    )
+                    count += len(users)
+                    after_user_id = users[-1]["user_id"]
+                if len(users) < REMINDER_USERS_PAGE_MAX:
+                    break
+            logger.info(f"Streamed {count} users with enabled reminders")
+            yield json.dumps({"status": "ok", "count": count}) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming users with reminders: {e}")
+            yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/claim_reminder_leases")
+async def claim_reminder_leases(data: ClaimReminderLeases):
+    """
+    Продлить аренду корзин процесса напоминаний и выровнять их число между живыми процессами
+
+    Процесс держит не больше ceil(корзин / живых процессов). Лишние корзины
+    отпускаются, но занять их можно только через ttl: старый владелец успевает
+    узнать об этом и закончить начатые отправки. Корзины умершего процесса
+    освобождаются, когда истекает его аренда.
+    """
+    if data.bucket_count < 1 or data.ttl_seconds <= 0:
+        return {"status": "error", "message": "bucket_count and ttl_seconds must be positive"}
+    ttl = timedelta(seconds=data.ttl_seconds)
+    try:
+        async with db_pool.bind(transaction=True):
+            async with db_pool.acquire() as conn:
+                # Продления разных процессов идут по очереди, решения не пересекаются
+                await conn.execute("LOCK TABLE reminder_leases IN SHARE ROW EXCLUSIVE MODE")
+                await conn.execute(
+                    "INSERT INTO reminder_leases (bucket) SELECT generate_series(0, $1 - 1) ON CONFLICT DO NOTHING",
+                    data.bucket_count
+                )
+                await conn.execute("""
+                    INSERT INTO reminder_workers (worker_id, expires_at) VALUES ($1, NOW() + $2)
+                    ON CONFLICT (worker_id) DO UPDATE SET expires_at = EXCLUDED.expires_at
+                """, data.worker_id, ttl)
+                workers = await conn.fetchval("SELECT COUNT(*) FROM reminder_workers WHERE expires_at > NOW()")
+                fair_share = -(-data.bucket_count // workers)
+
+                owned = sorted(row["bucket"] for row in await conn.fetch("""
+                    UPDATE reminder_leases SET expires_at = NOW() + $2
+                    WHERE owner = $1 AND bucket < $3
+                    RETURNING bucket
+                """, data.worker_id, ttl, data.bucket_count))
+                if len(owned) > fair_share:
+                    await conn.execute(
+                        "UPDATE reminder_leases SET owner = NULL, expires_at = NOW() + $2 WHERE bucket = ANY($1)",
+                        owned[fair_share:], ttl
+                    )
+                    owned = owned[:fair_share]
+                elif len(owned) < fair_share:
+                    owned += [row["bucket"] for row in await conn.fetch("""
+                        UPDATE reminder_leases SET owner = $1, expires_at = NOW() + $2
+                        WHERE bucket IN (
+                            SELECT bucket FROM reminder_leases
+                            WHERE bucket < $3 AND expires_at <= NOW()
+                            ORDER BY bucket LIMIT $4
+                        )
+                        RETURNING bucket
+                    """, data.worker_id, ttl, data.bucket_count, fair_share - len(owned))]
+
+        return {"status": "ok", "buckets": sorted(owned), "workers": workers}
+    except Exception as e:
+        logger.error(f"Error claiming reminder leases: {e}")
+        return {"status": "error", "message": str(e)}
+
+@app.post("/release_reminder_leases")
+async def release_reminder_leases(data: ReleaseReminderLeases):
+    """Процесс напоминаний останавливается: его корзины сразу свободны"""
+    try:
+        async with db_pool.bind(transaction=True):
+            async with db_pool.acquire() as conn:
+                await conn.execute("DELETE FROM reminder_workers WHERE worker_id = $1", data.worker_id)
+                released = await conn.fetch(
+                    "UPDATE reminder_leases SET owner = NULL, expires_at = NOW() WHERE owner = $1 RETURNING bucket",
+                    data.worker_id
+                )
+        logger.info(f"🪣 Reminder worker {data.worker_id} released {len(released)} buckets")
+        return {"status": "ok", "released": len(released)}
+    except Exception as e:
+        logger.error(f"Error releasing reminder leases: {e}")
+        return {"status": "error", "message": str(e)}
+
 @app.post("/toplist")
 async def get_toplist(data: TopListQuery):
     """Получение топ-10 пользователей по рейтингу"""
     try:
-        conn = await get_connection()
-        
-        # Получаем топ-10 пользователей по рейтингу
-        top_users = await conn.fetch("""
-            SELECT u.nickname, r.rating, u.user_id
-            FROM ratings r
-            JOIN users u ON r.user_id = u.user_id
-            WHERE u.is_blocked = FALSE
-            ORDER BY r.rating DESC
-            LIMIT 10
-        """)
-        
-        # Получаем позицию текущего пользователя в рейтинге
-        user_position = await conn.fetchval("""
-            SELECT COUNT(*) + 1
-            FROM ratings r
-            JOIN users u ON r.user_id = u.user_id
-            WHERE u.is_blocked = FALSE AND r.rating > (
-                SELECT COALESCE(r2.rating, 0)
-                FROM ratings r2
-                WHERE r2.user_id = $1
-            )
-        """, data.user_id)
-        
-        # Получаем рейтинг текущего пользователя
-        user_rating = await conn.fetchval("""
-            SELECT COALESCE(rating, 0) FROM ratings WHERE user_id = $1
-        """, data.user_id)
-        
-        await conn.close()
-        
-        # Формируем список топ-10
-        toplist = []
-        for i, user in enumerate(top_users, 1):
-            toplist.append({
-                "position": i,
-                "nickname": user["nickname"],
-                "rating": user["rating"],
-                "user_id": user["user_id"]
-            })
-        
         return {
             "status": "ok",
-            "toplist": toplist,
-            "user_position": user_position,
-            "user_rating": user_rating
+            "toplist": leaderboard.top(10),
+            "user_position": leaderboard.rank(data.user_id),
+            "user_rating": leaderboard.rating(data.user_id)
         }
-        
+
     except Exception as e:
         logger.error(f"Error getting toplist: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.post("/rebuild_leaderboard")
+async def rebuild_leaderboard():
+    """Перечитать таблицу лидеров из базы"""
+    try:
+        await reload_leaderboard()
+        return {"status": "success", "leaderboard": leaderboard.stats()}
+    except Exception as e:
+        logger.error(f"Error rebuilding leaderboard: {e}")
+        return {"status": "error", "message": str(e)}
+
 @app.get("/health")
 async def health():
     """Проверка здоровья"""
     try:
-        conn = await get_connection()
-        await conn.fetchval("SELECT 1")
-        await conn.close()
+        async with db_pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
         return {"status": "healthy"}
     except Exception as e:
         return JSONResponse({"status": "unhealthy"}, status_code=503)
 
+@app.get("/metrics")
+async def metrics():
+    """Статистика пула соединений и данных в памяти"""
+    return {
+        "status": "ok",
+        "db_pool": db_pool.stats(),
+        "support_sampler": support_sampler.stats(),
+        "leaderboard": leaderboard.stats(),
+        "rating_write_behind": rating_aggregator.stats(),
+        "profile_cache": profile_cache.stats()
+    }
+
 # Эндпоинты для системы достижений
 @app.post("/check_achievements")
 async def check_achievements(data: CheckAchievementsQuery):
     """Проверка и выдача достижений пользователю"""
     try:
-        conn = await get_connection()
-        achievement_system = AchievementSystem(conn)
-        
-        # Проверяем достижения
-        new_achievements = await achievement_system.check_achievements(
-            data.user_id, 
-            data.action, 
-            **data.data
-        )
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            achievement_system = AchievementSystem(conn, leaderboard=leaderboard)
+
+            # Проверяем достижения
+            new_achievements = await achievement_system.check_achievements(
+                data.user_id,
+                data.action,
+                **data.data
+            )
+
         return {
             "status": "success",
             "new_achievements": new_achievements,
             "count": len(new_achievements)
         }
-        
+
     except Exception as e:
         logger.error(f"Error checking achievements: {e}")
         return {"status": "error", "message": str(e)}
@@ -675,20 +1139,18 @@ async def check_achievements(data: CheckAchievementsQuery):
 async def get_user_achievements(data: AchievementQuery):
     """Получение достижений пользователя"""
     try:
-        conn = await get_connection()
-        achievement_system = AchievementSystem(conn)
-        
-        achievements = await achievement_system.get_user_achievements(data.user_id)
-        stats = await achievement_system.get_achievement_stats(data.user_id)
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            achievement_system = AchievementSystem(conn, leaderboard=leaderboard)
+
+            achievements = await achievement_system.get_user_achievements(data.user_id)
+            stats = await achievement_system.get_achievement_stats(data.user_id)
+
         return {
             "status": "success",
             "achievements": achievements,
             "stats": stats
         }
-        
+
     except Exception as e:
         logger.error(f"Error getting user achievements: {e}")
         return {"status": "error", "message": str(e)}
@@ -698,18 +1160,16 @@ async def get_user_achievements(data: AchievementQuery):
 async def get_recent_achievements(data: AchievementQuery):
     """Получение последних достижений пользователя"""
     try:
-        conn = await get_connection()
-        achievement_system = AchievementSystem(conn)
-        
-        recent_achievements = await achievement_system.get_recent_achievements(data.user_id, limit=5)
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            achievement_system = AchievementSystem(conn, leaderboard=leaderboard)
+
+            recent_achievements = await achievement_system.get_recent_achievements(data.user_id, limit=5)
+
         return {
             "status": "success",
             "recent_achievements": recent_achievements
         }
-        
+
     except Exception as e:
         logger.error(f"Error getting recent achievements: {e}")
         return {"status": "error", "message": str(e)}
@@ -720,12 +1180,12 @@ async def get_all_achievements():
     try:
         from achievements_config import get_all_achievements
         achievements = get_all_achievements()
-        
+
         return {
             "status": "success",
             "achievements": achievements
         }
-        
+
     except Exception as e:
         logger.error(f"Error getting all achievements: {e}")
         return {"status": "error", "message": str(e)}
@@ -734,27 +1194,118 @@ async def get_all_achievements():
 async def check_achievements_dynamic(data: CheckAchievementsQuery):
     """Динамическая проверка достижений без сохранения в БД"""
     try:
-        conn = await get_connection()
-        achievement_system = AchievementSystem(conn)
-        
-        # Проверяем достижения без сохранения
-        earned_achievements = await achievement_system.check_achievements_dynamic(
-            data.user_id, 
-            **data.data
-        )
-        
-        await conn.close()
-        
+        async with db_pool.acquire() as conn:
+            achievement_system = AchievementSystem(conn, leaderboard=leaderboard)
+
+            # Проверяем достижения без сохранения
+            earned_achievements = await achievement_system.check_achievements_dynamic(
+                data.user_id,
+                **data.data
+            )
+
         return {
             "status": "success",
             "achievements": earned_achievements,
             "count": len(earned_achievements)
         }
-        
+
     except Exception as e:
         logger.error(f"Error checking dynamic achievements: {e}")
         return {"status": "error", "message": str(e)}
 
+_post_endpoints: Dict[str, tuple] = {}
+
+def post_endpoint(name: str):
+    """POST-эндпоинт по имени без слэша: (функция, тип тела запроса или None)"""
+    if not _post_endpoints:
+        for route in app.routes:
+            if not isinstance(route, APIRoute) or "POST" not in route.methods:
+                continue
+            params = list(inspect.signature(route.endpoint).parameters.values())
+            if len(params) > 1:
+                continue
+            body_type = params[0].annotation if params else None
+            _post_endpoints[route.path.lstrip("/")] = (route.endpoint, body_type)
+    return _post_endpoints.get(name)
+
+async def call_endpoint(name: str, data: dict):
+    """
+    Вызвать POST-эндпоинт напрямую, минуя HTTP
+
+    Тело проверяется моделью эндпоинта, как это сделал бы FastAPI.
+    Используется /batch и клиентом бота в режиме BACKEND_TRANSPORT=inprocess.
+    """
+    handler = post_endpoint(name)
+    if handler is None:
+        return {"status": "error", "message": f"Unknown endpoint: {name}"}
+
+    endpoint, body_type = handler
+    if body_type is None:
+        return await endpoint()
+    try:
+        body = data if body_type is dict else body_type.model_validate(data)
+    except ValidationError as e:
+        return {"status": "error", "message": f"Invalid data: {e}"}
+    return await endpoint(body)
+
+# Эндпоинты, которые нельзя вызывать из /batch
+BATCH_EXCLUDED_ENDPOINTS = {
+    "batch", "rebuild_leaderboard", "stream_users_with_reminders",
+    # Открывают собственную транзакцию (db_pool.bind), внутри пакета она невозможна
+    "claim_reminder_leases", "release_reminder_leases",
+}
+
+class BatchAborted(Exception):
+    """Операция пакета завершилась ошибкой, транзакция откатывается"""
+
+async def run_batch_operation(operation: BatchOperation) -> dict:
+    if operation.endpoint in BATCH_EXCLUDED_ENDPOINTS:
+        return {"status": "error", "message": f"Unknown endpoint: {operation.endpoint}"}
+    return await call_endpoint(operation.endpoint, operation.data)
+
+@app.post("/batch")
+async def batch(data: BatchRequest):
+    """
+    Несколько вызовов эндпоинтов за один запрос
+
+    Операции выполняются по порядку на одном соединении из пула. С
+    transaction=true - в одной транзакции: первая операция со статусом
+    "error" откатывает все, изменения данных в памяти применяются
+    только после фиксации.
+    """
+    if len(data.operations) > BATCH_MAX_OPERATIONS:
+        return {"status": "error", "message": f"Too many operations (max {BATCH_MAX_OPERATIONS})"}
+
+    results = []
+    try:
+        async with db_pool.bind(transaction=data.transaction):
+            for operation in data.operations:
+                result = await run_batch_operation(operation)
+                results.append(result)
+                if data.transaction and isinstance(result, dict) and result.get("status") == "error":
+                    raise BatchAborted()
+    except BatchAborted:
+        # Профили, прочитанные внутри откаченной транзакции, могли попасть в кэш
+        profile_cache.clear()
+        failed = data.operations[len(results) - 1].endpoint
+        logger.warning(f"⚠️ Batch rolled back: operation {len(results) - 1} ({failed}) failed")
+        return {"status": "error", "rolled_back": True, "failed_index": len(results) - 1, "results": results}
+    except Exception as e:
+        logger.error(f"Error in batch: {e}")
+        if data.transaction:
+            # Операция упала исключением или не удалась фиксация (обрыв соединения):
+            # успешные результаты тоже откачены. failed_index None - упала сама фиксация
+            profile_cache.clear()
+            failed_index = len(results) if len(results) < len(data.operations) else None
+            return {"status": "error", "message": str(e), "rolled_back": True,
+                    "failed_index": failed_index, "results": results}
+        return {"status": "error", "message": str(e), "results": results}
+
+    return {"status": "success", "results": results}
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if API_UDS:
+        uvicorn.run(app, uds=API_UDS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
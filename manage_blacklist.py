@@ -27,12 +27,9 @@ async def list_users():
     conn = await get_connection()
     try:
         users = await conn.fetch("""
-            SELECT u.user_id, u.nickname, u.is_blocked,
-                   COUNT(c.id) as complaints_count
-            FROM users u
-            LEFT JOIN complaints c ON u.user_id = c.original_user_id
-            GROUP BY u.user_id, u.nickname, u.is_blocked
-            ORDER BY complaints_count DESC, u.user_id
+            SELECT user_id, nickname, is_blocked, complaints_count
+            FROM users
+            ORDER BY complaints_count DESC, user_id
         """)
         
         print("=" * 60)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Простые метрики в памяти процесса
+Используются для статистики пула соединений, кэшей и клиентов API
+"""
+
+import math
+from collections import deque
+from typing import Dict
+
+
+class LatencyStats:
+    """Статистика задержек: количество, среднее, максимум и перцентили по последним замерам"""
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Последние замеры для расчета перцентилей
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        """Добавить замер (в секундах)"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """Перцентиль по последним замерам (в секундах)"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> Dict:
+        """Снимок статистики в миллисекундах"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы базы данных
+
+Единственный владелец схемы: таблицы, индексы и базовые данные создаются здесь.
+Примененные версии записываются в таблицу schema_migrations.
+
+Запуск:
+  python migrations.py           - применить новые миграции
+  python migrations.py status    - показать примененные и ожидающие миграции
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock, чтобы несколько процессов не применяли миграции одновременно
+MIGRATIONS_LOCK_KEY = 7301001
+
+
+@dataclass
+class Migration:
+    """Одна миграция схемы"""
+    version: int
+    name: str
+    sql: str
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline_schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            nickname VARCHAR(50) UNIQUE NOT NULL,
+            is_blocked BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS messages (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(user_id),
+            text TEXT,
+            file_id TEXT,
+            message_type VARCHAR(20) NOT NULL DEFAULT 'text' CHECK (message_type IN ('text', 'voice', 'video_note')),
+            type VARCHAR(20) NOT NULL CHECK (type IN ('support', 'request')),
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS complaints (
+            id SERIAL PRIMARY KEY,
+            message_id INTEGER,
+            original_user_id BIGINT,
+            complainer_user_id BIGINT REFERENCES users(user_id),
+            text TEXT,
+            file_id TEXT,
+            message_type VARCHAR(20) NOT NULL DEFAULT 'text' CHECK (message_type IN ('text', 'voice', 'video_note')),
+            created_at TIMESTAMP DEFAULT NOW(),
+            complaint_date TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS ratings (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+            rating INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        -- Старые базы были созданы без этого столбца
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS is_blocked BOOLEAN DEFAULT FALSE;
+
+        CREATE TABLE IF NOT EXISTS achievements (
+            id VARCHAR(50) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            condition_data JSONB NOT NULL,
+            icon VARCHAR(10) NOT NULL DEFAULT '🏆',
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            achievement_id VARCHAR(50) NOT NULL,
+            earned_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            FOREIGN KEY (achievement_id) REFERENCES achievements(id) ON DELETE CASCADE,
+            UNIQUE(user_id, achievement_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_messages_type ON messages(type);
+        CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id);
+        CREATE INDEX IF NOT EXISTS idx_complaints_original_user_id ON complaints(original_user_id);
+        CREATE INDEX IF NOT EXISTS idx_complaints_complainer_user_id ON complaints(complainer_user_id);
+        CREATE INDEX IF NOT EXISTS idx_users_blocked ON users(is_blocked);
+        CREATE INDEX IF NOT EXISTS idx_ratings_user_id ON ratings(user_id);
+        CREATE INDEX IF NOT EXISTS idx_ratings_rating ON ratings(rating);
+        CREATE INDEX IF NOT EXISTS idx_user_achievements_user_id ON user_achievements(user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_achievements_achievement_id ON user_achievements(achievement_id);
+        CREATE INDEX IF NOT EXISTS idx_user_achievements_earned_at ON user_achievements(earned_at);
+    """),
+
+    Migration(2, "achievements_seed", """
+        INSERT INTO achievements (id, name, description, type, condition_data, icon) VALUES
+        ('first_help_1', '🆘 Первая помощь', 'Помогли кому-то в первый раз', 'first_help', '{"action": "help_given", "count": 1}', '🆘'),
+        ('rating_10', '🥉 Бронзовый помощник', 'Достигли рейтинга 10', 'rating_milestone', '{"action": "rating_reached", "value": 10}', '🥉'),
+        ('rating_50', '🥈 Серебряный помощник', 'Достигли рейтинга 50', 'rating_milestone', '{"action": "rating_reached", "value": 50}', '🥈'),
+        ('rating_100', '🥇 Золотой помощник', 'Достигли рейтинга 100', 'rating_milestone', '{"action": "rating_reached", "value": 100}', '🥇'),
+        ('rating_500', '💎 Алмазный помощник', 'Достигли рейтинга 500', 'rating_milestone', '{"action": "rating_reached", "value": 500}', '💎'),
+        ('rating_1000', '👑 Король помощи', 'Достигли рейтинга 1000', 'rating_milestone', '{"action": "rating_reached", "value": 1000}', '👑'),
+        ('messages_10', '💬 Общительный', 'Отправили 10 сообщений поддержки', 'messages_sent', '{"action": "messages_sent", "count": 10}', '💬'),
+        ('messages_50', '📢 Голос поддержки', 'Отправили 50 сообщений поддержки', 'messages_sent', '{"action": "messages_sent", "count": 50}', '📢'),
+        ('messages_100', '📣 Мегафон добра', 'Отправили 100 сообщений поддержки', 'messages_sent', '{"action": "messages_sent", "count": 100}', '📣'),
+        ('messages_500', '📡 Радио поддержки', 'Отправили 500 сообщений поддержки', 'messages_sent', '{"action": "messages_sent", "count": 500}', '📡'),
+        ('first_day', '🎉 Добро пожаловать!', 'Зарегистрировались в боте', 'special', '{"action": "registration"}', '🎉'),
+        ('top_1', '🏆 Чемпион', 'Заняли первое место в рейтинге', 'special', '{"action": "top_position", "position": 1}', '🏆'),
+        ('helper_1000', '🎖️ Мастер помощи', 'Помогли 1000 людям', 'special', '{"action": "help_given", "count": 1000}', '🎖️')
+        ON CONFLICT (id) DO NOTHING;
+    """),
+
+    # Флаги пользователя больше не бывают NULL, эндпоинты полагаются на это
+    Migration(3, "users_flags_not_null", """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS reminders_enabled BOOLEAN DEFAULT TRUE;
+
+        UPDATE users SET is_blocked = FALSE WHERE is_blocked IS NULL;
+        UPDATE users SET reminders_enabled = TRUE WHERE reminders_enabled IS NULL;
+
+        ALTER TABLE users
+            ALTER COLUMN is_blocked SET DEFAULT FALSE,
+            ALTER COLUMN is_blocked SET NOT NULL,
+            ALTER COLUMN reminders_enabled SET DEFAULT TRUE,
+            ALTER COLUMN reminders_enabled SET NOT NULL;
+    """),
+
+    # Уведомления для данных в памяти API (см. db_events.py)
+    Migration(4, "notify_triggers", """
+        CREATE OR REPLACE FUNCTION notify_user_block_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_block_changed',
+                NEW.user_id || ':' || CASE WHEN NEW.is_blocked THEN '1' ELSE '0' END);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS users_block_changed ON users;
+        CREATE TRIGGER users_block_changed
+            AFTER UPDATE OF is_blocked ON users
+            FOR EACH ROW WHEN (OLD.is_blocked IS DISTINCT FROM NEW.is_blocked)
+            EXECUTE FUNCTION notify_user_block_changed();
+
+        CREATE OR REPLACE FUNCTION notify_support_message_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('support_message_changed', '+:' || NEW.id || ':' || NEW.user_id);
+            ELSE
+                PERFORM pg_notify('support_message_changed', '-:' || OLD.id || ':' || OLD.user_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS messages_support_inserted ON messages;
+        CREATE TRIGGER messages_support_inserted
+            AFTER INSERT ON messages
+            FOR EACH ROW WHEN (NEW.type = 'support')
+            EXECUTE FUNCTION notify_support_message_changed();
+
+        DROP TRIGGER IF EXISTS messages_support_deleted ON messages;
+        CREATE TRIGGER messages_support_deleted
+            AFTER DELETE ON messages
+            FOR EACH ROW WHEN (OLD.type = 'support')
+            EXECUTE FUNCTION notify_support_message_changed();
+    """),
+
+    # Ленты запросов и напоминаний идут по (type, id) без сортировки;
+    # одиночный индекс по type покрывается составным
+    Migration(5, "messages_type_id_index", """
+        CREATE INDEX IF NOT EXISTS idx_messages_type_id ON messages(type, id);
+        DROP INDEX IF EXISTS idx_messages_type;
+    """),
+
+    # Счетчик жалоб на пользователя вместо COUNT(*) по complaints;
+    # поддерживается /submit_complaint и сбрасывается при разблокировке в админ-боте
+    Migration(6, "users_complaints_count", """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS complaints_count INTEGER NOT NULL DEFAULT 0;
+
+        UPDATE users u SET complaints_count = c.total
+        FROM (
+            SELECT original_user_id, COUNT(*) AS total
+            FROM complaints
+            GROUP BY original_user_id
+        ) c
+        WHERE u.user_id = c.original_user_id;
+    """),
+
+    # Состояние планировщика напоминаний переживает его перезапуск
+    Migration(7, "reminder_state", """
+        CREATE TABLE IF NOT EXISTS reminder_state (
+            user_id BIGINT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            last_seen_id INTEGER NOT NULL DEFAULT 0,
+            last_sent_on DATE
+        );
+    """),
+
+    # Планировщик напоминаний узнает о включении/выключении напоминаний и блокировках
+    # без перечитывания всех пользователей (см. reminder_wheel.py)
+    Migration(8, "notify_user_reminders", """
+        CREATE OR REPLACE FUNCTION notify_user_reminders_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_reminders_changed',
+                NEW.user_id || ':' || CASE WHEN NEW.reminders_enabled AND NOT NEW.is_blocked THEN '1' ELSE '0' END);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS users_reminders_changed ON users;
+        CREATE TRIGGER users_reminders_changed
+            AFTER UPDATE OF reminders_enabled, is_blocked ON users
+            FOR EACH ROW WHEN (OLD.reminders_enabled IS DISTINCT FROM NEW.reminders_enabled
+                               OR OLD.is_blocked IS DISTINCT FROM NEW.is_blocked)
+            EXECUTE FUNCTION notify_user_reminders_changed();
+
+        DROP TRIGGER IF EXISTS users_reminders_inserted ON users;
+        CREATE TRIGGER users_reminders_inserted
+            AFTER INSERT ON users
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_user_reminders_changed();
+    """),
+
+    # Часовой пояс пользователя (минуты к UTC, по умолчанию Москва) и время последнего
+    # напоминания вместо даты: "сегодня" у пользователей разных поясов наступает в разное время
+    Migration(9, "user_timezones", """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS utc_offset_minutes SMALLINT NOT NULL DEFAULT 180;
+
+        ALTER TABLE reminder_state ADD COLUMN IF NOT EXISTS last_sent_at TIMESTAMPTZ;
+        -- Отправки прошлых дней считаем сделанными в конце московского окна
+        UPDATE reminder_state
+        SET last_sent_at = (last_sent_on + TIME '20:00') AT TIME ZONE 'Europe/Moscow'
+        WHERE last_sent_on IS NOT NULL AND last_sent_at IS NULL;
+        ALTER TABLE reminder_state DROP COLUMN IF EXISTS last_sent_on;
+
+        CREATE OR REPLACE FUNCTION notify_user_reminders_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('user_reminders_changed',
+                NEW.user_id || ':' || CASE WHEN NEW.reminders_enabled AND NOT NEW.is_blocked THEN '1' ELSE '0' END
+                || ':' || NEW.utc_offset_minutes);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS users_reminders_changed ON users;
+        CREATE TRIGGER users_reminders_changed
+            AFTER UPDATE OF reminders_enabled, is_blocked, utc_offset_minutes ON users
+            FOR EACH ROW WHEN (OLD.reminders_enabled IS DISTINCT FROM NEW.reminders_enabled
+                               OR OLD.is_blocked IS DISTINCT FROM NEW.is_blocked
+                               OR OLD.utc_offset_minutes IS DISTINCT FROM NEW.utc_offset_minutes)
+            EXECUTE FUNCTION notify_user_reminders_changed();
+    """),
+
+    # Аренда корзин пользователей процессами reminder_scheduler.py (см. reminder_leases.py)
+    Migration(10, "reminder_leases", """
+        CREATE TABLE IF NOT EXISTS reminder_workers (
+            worker_id VARCHAR(100) PRIMARY KEY,
+            expires_at TIMESTAMPTZ NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS reminder_leases (
+            bucket INTEGER PRIMARY KEY,
+            owner VARCHAR(100),
+            -- Корзину можно занять, когда аренда истекла
+            expires_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """),
+
+    # Постраничное чтение получателей напоминаний по ключу user_id: в индексе только они
+    Migration(11, "idx_users_reminders", """
+        CREATE INDEX IF NOT EXISTS idx_users_reminders ON users (user_id) INCLUDE (utc_offset_minutes)
+            WHERE reminders_enabled = TRUE AND is_blocked = FALSE;
+    """),
+
+    # Исход последней попытки доставки напоминания:
+    # ok, forbidden, chat_not_found, rate_limited, transient, no_message
+    Migration(12, "reminder_outcomes", """
+        ALTER TABLE reminder_state ADD COLUMN IF NOT EXISTS last_outcome VARCHAR(20);
+    """),
+]
+
+
+async def _ensure_migrations_table(conn: asyncpg.Connection):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+async def get_applied_versions(conn: asyncpg.Connection) -> List[int]:
+    """Список уже примененных версий"""
+    await _ensure_migrations_table(conn)
+    rows = await conn.fetch("SELECT version FROM schema_migrations ORDER BY version")
+    return [row["version"] for row in rows]
+
+
+async def run_migrations(conn: asyncpg.Connection) -> List[int]:
+    """
+    Применить все новые миграции по порядку
+
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    в schema_migrations. Возвращает список примененных версий.
+    """
+    applied_now = []
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_KEY)
+    try:
+        applied = set(await get_applied_versions(conn))
+
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version in applied:
+                continue
+
+            logger.info(f"🗄️ Applying migration {migration.version}: {migration.name}")
+            async with conn.transaction():
+                await conn.execute(migration.sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                    migration.version, migration.name
+                )
+            applied_now.append(migration.version)
+
+        if applied_now:
+            logger.info(f"✅ Applied migrations: {applied_now}")
+        else:
+            logger.info("✅ Database schema is up to date")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+
+    return applied_now
+
+
+async def _connect() -> asyncpg.Connection:
+    return await asyncpg.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT", "5432")),
+        user=os.getenv("DB_USER", "bot_user"),
+        password=os.getenv("DB_PASSWORD", "8998"),
+        database=os.getenv("DB_NAME", "support_bot")
+    )
+
+
+async def main():
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else "apply"
+
+    conn = await _connect()
+    try:
+        if command == "status":
+            applied = set(await get_applied_versions(conn))
+            for migration in MIGRATIONS:
+                mark = "✅" if migration.version in applied else "⏳"
+                print(f"{mark} {migration.version:>3} {migration.name}")
+        elif command == "apply":
+            await run_migrations(conn)
+        else:
+            print(f"❌ Неизвестная команда: {command}")
+            print("Использование: python migrations.py [apply|status]")
+            return False
+    finally:
+        await conn.close()
+
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
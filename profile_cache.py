@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш профилей пользователей в памяти процесса API
+
+Бот запрашивает /profile почти перед каждым обработчиком (проверка блокировки),
+поэтому профиль кэшируется. Эндпоинты, меняющие данные профиля, сбрасывают
+запись пользователя; блокировки из админ-бота приходят через db_events.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Максимум профилей в кэше (0 - кэш выключен)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+# Страховка от изменений в обход API и уведомлений (секунды)
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+# Значение get(), если профиля нет в кэше
+MISS = object()
+
+
+class ProfileCache:
+    """LRU-кэш профилей с ограниченным размером и сбросом по записи"""
+
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Растет при каждом сбросе; профиль, прочитанный до сброса, не сохраняется
+        self.epoch = 0
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, user_id: int):
+        """Профиль (None - пользователь не найден) или MISS"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return MISS
+
+        profile, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return MISS
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return profile
+
+    def put(self, user_id: int, profile: Optional[Dict], epoch: int):
+        """
+        Сохранить профиль, прочитанный из базы
+
+        epoch - значение self.epoch до чтения: если за время запроса был сброс,
+        прочитанные данные могли устареть, и профиль не сохраняется.
+        """
+        if self.max_size <= 0 or epoch != self.epoch:
+            return
+        self._entries[user_id] = (profile, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        """Сбросить профиль пользователя после изменения его данных"""
+        self.epoch += 1
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
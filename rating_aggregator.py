@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенная запись рейтинга (write-behind)
+
+В этом режиме /increment_rating не пишет в базу сразу. Приращения копятся
+в памяти по user_id и сбрасываются одним многострочным
+INSERT ... ON CONFLICT DO UPDATE каждые RATING_FLUSH_INTERVAL_MS миллисекунд
+или после RATING_FLUSH_MAX_EVENTS приращений. При остановке API все
+накопленное записывается.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Включить отложенную запись рейтинга
+RATING_WRITE_BEHIND = os.getenv("RATING_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+# Максимальная задержка записи (миллисекунды)
+RATING_FLUSH_INTERVAL_MS = int(os.getenv("RATING_FLUSH_INTERVAL_MS", "200"))
+# Сбросить раньше, если накопилось столько приращений
+RATING_FLUSH_MAX_EVENTS = int(os.getenv("RATING_FLUSH_MAX_EVENTS", "500"))
+# Попытки записи при остановке
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+# Пользователи, которых нет в users, отбрасываются (ratings ссылается на users)
+FLUSH_QUERY = """
+    INSERT INTO ratings (user_id, rating)
+    SELECT d.user_id, d.delta
+    FROM unnest($1::bigint[], $2::int[]) AS d(user_id, delta)
+    JOIN users u ON u.user_id = d.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET rating = ratings.rating + EXCLUDED.rating, updated_at = NOW()
+"""
+
+
+class RatingAggregator:
+    """Накопитель приращений рейтинга с пакетной записью в базу"""
+
+    def __init__(self, db_pool,
+                 flush_interval_ms: int = RATING_FLUSH_INTERVAL_MS,
+                 max_events: int = RATING_FLUSH_MAX_EVENTS):
+        self.db_pool = db_pool
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_events = max_events
+
+        self._pending: Dict[int, int] = {}
+        self._pending_events = 0
+        self._oldest_pending: Optional[float] = None
+        # Приращения, которые сейчас записываются
+        self._in_flight: Dict[int, int] = {}
+
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Вызываются со списком user_id после успешной записи
+        self._flush_listeners: List[Callable[[List[int]], None]] = []
+
+        # Статистика
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flushed_events = 0
+        self.dropped_users = 0
+        self.last_flush_rows = 0
+        self.max_flush_rows = 0
+        self.flush_time = LatencyStats()
+        # Сколько приращение ждало записи
+        self.lag = LatencyStats()
+
+    @property
+    def is_started(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Запустить фоновую запись"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"📝 Rating write-behind started: every {int(self.flush_interval * 1000)}ms "
+                        f"or {self.max_events} events")
+
+    async def close(self):
+        """Остановить фоновую запись и записать все накопленное"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for attempt in range(1, SHUTDOWN_FLUSH_ATTEMPTS + 1):
+            try:
+                await self.flush()
+                break
+            except Exception as e:
+                logger.error(f"❌ Rating flush on shutdown failed (attempt {attempt}): {e}")
+                await asyncio.sleep(0.5 * attempt)
+        if self._pending:
+            logger.error(f"❌ Lost rating increments on shutdown: {self._pending}")
+
+    def add(self, user_id: int, delta: int = 1):
+        """Запомнить приращение; запись произойдет позже"""
+        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+        self._pending_events += 1
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+        if self._pending_events >= self.max_events:
+            self._wakeup.set()
+
+    def add_flush_listener(self, callback: Callable[[List[int]], None]):
+        """Подписаться на запись пакета (например, чтобы сбросить кэши)"""
+        self._flush_listeners.append(callback)
+
+    def unflushed(self, user_id: int) -> int:
+        """Приращения пользователя, которых еще нет в базе"""
+        return self._pending.get(user_id, 0) + self._in_flight.get(user_id, 0)
+
+    async def flush(self) -> int:
+        """Записать накопленное сейчас; возвращает число записанных пользователей"""
+        async with self._lock:
+            return await self._flush_locked()
+
+    @asynccontextmanager
+    async def paused(self):
+        """Записать накопленное и не писать новое, пока выполняется блок"""
+        async with self._lock:
+            await self._flush_locked()
+            yield
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Rating flush failed, will retry: {e}")
+
+    async def _flush_locked(self) -> int:
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        events, self._pending_events = self._pending_events, 0
+        oldest, self._oldest_pending = self._oldest_pending, None
+        self._in_flight = batch
+
+        started = time.perf_counter()
+        try:
+            async with self.db_pool.acquire() as conn:
+                status = await conn.execute(FLUSH_QUERY, list(batch.keys()), list(batch.values()))
+        except Exception:
+            # Возвращаем приращения в очередь, запишем в следующий раз
+            self.flush_errors += 1
+            for user_id, delta in batch.items():
+                self._pending[user_id] = self._pending.get(user_id, 0) + delta
+            self._pending_events += events
+            if oldest is not None:
+                self._oldest_pending = min(oldest, self._oldest_pending or oldest)
+            raise
+        finally:
+            self._in_flight = {}
+
+        self.flush_time.observe(time.perf_counter() - started)
+        if oldest is not None:
+            self.lag.observe(time.monotonic() - oldest)
+
+        rows = int(status.split()[-1])
+        if rows < len(batch):
+            self.dropped_users += len(batch) - rows
+            logger.warning(f"⚠️ Rating flush skipped {len(batch) - rows} unknown users")
+
+        self.flushes += 1
+        self.flushed_events += events
+        self.last_flush_rows = rows
+        self.max_flush_rows = max(self.max_flush_rows, rows)
+
+        user_ids = list(batch.keys())
+        for callback in self._flush_listeners:
+            try:
+                callback(user_ids)
+            except Exception as e:
+                logger.error(f"Error in rating flush listener: {e}")
+        return rows
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.is_started,
+            "pending_users": len(self._pending),
+            "pending_events": self._pending_events,
+            "pending_age_ms": round((time.monotonic() - self._oldest_pending) * 1000, 3)
+            if self._oldest_pending is not None else 0.0,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "flushed_events": self.flushed_events,
+            "dropped_users": self.dropped_users,
+            "last_flush_rows": self.last_flush_rows,
+            "max_flush_rows": self.max_flush_rows,
+            "avg_flush_events": round(self.flushed_events / self.flushes, 2) if self.flushes else 0.0,
+            "flush_time": self.flush_time.snapshot(),
+            "lag": self.lag.snapshot(),
+        }
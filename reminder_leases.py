@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Разделение пользователей напоминаний между несколькими процессами reminder_scheduler.py
+
+Пользователи разложены по корзинам user_id % REMINDER_BUCKETS (id Telegram
+распределены по остаткам равномерно). Процесс арендует корзины через
+/claim_reminder_leases и продлевает аренду каждые ttl / 3; API выравнивает
+число корзин между живыми процессами, а корзины умершего процесса отдает
+другим после истечения его аренды. Процесс планирует и отправляет напоминания
+только пользователям своих корзин. Если продлить аренду не удалось до ее
+истечения, процесс считает, что корзин у него нет: их уже может занять другой.
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+from typing import Callable, Dict, FrozenSet, Optional
+
+from backend_client import BackendClient
+
+logger = logging.getLogger(__name__)
+
+# Режим нескольких процессов; без него процесс рассылает всем и должен быть один
+REMINDER_PARTITIONED = os.getenv("REMINDER_PARTITIONED", "false").lower() in ("1", "true", "yes")
+# Число корзин пользователей - верхняя граница числа процессов
+REMINDER_BUCKETS = int(os.getenv("REMINDER_BUCKETS", "64"))
+# Срок аренды (секунды): дольше отправки одной части раунда (REMINDER_BULK_SIZE / REMINDER_SEND_RATE)
+REMINDER_LEASE_TTL = float(os.getenv("REMINDER_LEASE_TTL", "120"))
+# Имя процесса в таблице аренды
+REMINDER_WORKER_ID = os.getenv("REMINDER_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def bucket_of(user_id: int, bucket_count: int = REMINDER_BUCKETS) -> int:
+    """Корзина пользователя (так же считает SQL в API)"""
+    return user_id % bucket_count
+
+
+class LeaseManager:
+    """Аренда корзин одного процесса с периодическим продлением"""
+
+    def __init__(self, backend: BackendClient, worker_id: str = REMINDER_WORKER_ID,
+                 bucket_count: int = REMINDER_BUCKETS, ttl: float = REMINDER_LEASE_TTL):
+        self.backend = backend
+        self.worker_id = worker_id
+        self.bucket_count = bucket_count
+        self.ttl = ttl
+        self.buckets: FrozenSet[int] = frozenset()
+        # Живых процессов по последнему продлению
+        self.workers = 0
+        # До какого момента (monotonic) аренда точно действует
+        self._valid_until = 0.0
+        # Вызывается при смене набора корзин
+        self.on_change: Optional[Callable[[], None]] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.heartbeats = 0
+        self.failures = 0
+        self.changes = 0
+
+    def owns(self, user_id: int) -> bool:
+        """Отправлять ли напоминание этому пользователю"""
+        return time.monotonic() < self._valid_until and bucket_of(user_id, self.bucket_count) in self.buckets
+
+    def request_filter(self) -> Dict:
+        """Фильтр по своим корзинам для запросов к API"""
+        return {"bucket_count": self.bucket_count, "buckets": sorted(self.buckets)}
+
+    async def heartbeat(self) -> bool:
+        """Продлить аренду и получить актуальный набор корзин"""
+        started = time.monotonic()
+        data = await self.backend.request("claim_reminder_leases", {
+            "worker_id": self.worker_id, "bucket_count": self.bucket_count, "ttl_seconds": self.ttl
+        })
+        if data.get("status") != "ok":
+            self.failures += 1
+            logger.error(f"Error renewing reminder leases: {data.get('message')}")
+            if self.buckets and time.monotonic() >= self._valid_until:
+                logger.warning("⚠️ Reminder leases expired, deliveries paused until renewed")
+                self._set_buckets(frozenset())
+            return False
+
+        self.heartbeats += 1
+        # Отсчет от отправки запроса: база продлила аренду не раньше
+        self._valid_until = started + self.ttl
+        self.workers = data["workers"]
+        self._set_buckets(frozenset(data["buckets"]))
+        return True
+
+    def _set_buckets(self, buckets: FrozenSet[int]):
+        if buckets == self.buckets:
+            return
+        logger.info(f"🪣 Reminder buckets {len(self.buckets)} -> {len(buckets)} of {self.bucket_count} "
+                    f"({self.workers} workers)")
+        self.buckets = buckets
+        self.changes += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    async def start(self):
+        """Первое продление сразу (до планирования), дальше - в фоне"""
+        await self.heartbeat()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Error in reminder lease heartbeat: {e}")
+
+    async def close(self):
+        """Остановить продление и сразу отдать корзины другим процессам"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.buckets = frozenset()
+        self._valid_until = 0.0
+        await self.backend.request("release_reminder_leases", {"worker_id": self.worker_id})
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "buckets": len(self.buckets),
+            "bucket_count": self.bucket_count,
+            "workers": self.workers,
+            "heartbeats": self.heartbeats,
+            "failures": self.failures,
+            "changes": self.changes,
+        }
@@ -1,16 +1,39 @@
 """
 Планировщик напоминаний для бота поддержки.
-Отправляет случайные сообщения поддержки пользователям в случайное время с 12:00 до 20:00.
+Отправляет случайные сообщения поддержки пользователям в случайное время с 12:00 до 20:00
+по их местному времени.
+
+Каждый пользователь получает одно напоминание в день в свое время окна
+(см. reminder_wheel.py); у каждого часового пояса свое колесо, планировщик
+спит до ближайшего наступившего слота среди всех. Включение и выключение
+напоминаний и смена пояса приходят уведомлением из базы. С
+REMINDER_PARTITIONED процессов может быть несколько: каждый рассылает только
+пользователям арендованных корзин (см. reminder_leases.py).
+
+Исход каждой доставки классифицируется (classify_send_error) и пишется в
+reminder_state. Тем, до кого бот не может достучаться (заблокировали бота,
+удалили аккаунт), напоминания выключаются одним запросом на часть раунда
+(/disable_reminders), а не пробуются каждый день; вернувшемуся через /start
+бот включает их снова (/restore_reminders).
 """
 
 import asyncio
 import os
-import random
-import requests
+import time
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
 import pytz
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter
+
+from telegram_sender import TelegramSender, install_sender, PRIORITY_BACKGROUND
+from backend_client import BackendClient
+from reminder_state import ReminderState
+from reminder_wheel import ReminderWheel
+from reminder_leases import LeaseManager, REMINDER_PARTITIONED
+from db_events import DatabaseEvents, CHANNEL_USER_REMINDERS, parse_user_reminders_event
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -19,71 +42,225 @@ logger = logging.getLogger(__name__)
 # Конфигурация
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
-TIMEZONE = pytz.timezone('Europe/Moscow')  # Можно настроить под нужную временную зону
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_USER = os.getenv("DB_USER", "bot_user")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "8998")
+DB_NAME = os.getenv("DB_NAME", "support_bot")
+TIMEZONE = pytz.timezone('Europe/Moscow')  # Часовой пояс логов; окна считаются по поясу пользователя
+# Доля общего лимита Telegram (30 сообщений/с на бота), остальное - интерактивным ответам бота
+REMINDER_SEND_RATE = float(os.getenv("REMINDER_SEND_RATE", "10"))
+# Сколько напоминаний готовится и отправляется одновременно (темп задает REMINDER_SEND_RATE)
+REMINDER_CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "50"))
+# Сколько пользователей в одном запросе /get_reminder_messages
+REMINDER_BULK_SIZE = int(os.getenv("REMINDER_BULK_SIZE", "500"))
+# Окно отправки напоминаний (часы по местному времени пользователя)
+REMINDER_WINDOW_START = int(os.getenv("REMINDER_WINDOW_START", "12"))
+REMINDER_WINDOW_END = int(os.getenv("REMINDER_WINDOW_END", "20"))
+# Пауза после ошибки в цикле планировщика (секунды)
+REMINDER_RETRY_DELAY = 60
+
+# Исходы доставки напоминания
+OUTCOME_OK = "ok"
+OUTCOME_FORBIDDEN = "forbidden"              # 403: бот заблокирован, аккаунт удален
+OUTCOME_CHAT_NOT_FOUND = "chat_not_found"    # чата с пользователем нет
+OUTCOME_RATE_LIMITED = "rate_limited"        # 429 остался и после повторов telegram_sender
+OUTCOME_TRANSIENT = "transient"              # сеть, 5xx, прочие ошибки - попробуем в следующий раз
+OUTCOME_NO_MESSAGE = "no_message"            # нечего отправить
+# После этих исходов напоминания пользователю выключаются
+UNREACHABLE_OUTCOMES = (OUTCOME_FORBIDDEN, OUTCOME_CHAT_NOT_FOUND)
+
+
+def classify_send_error(error: Exception) -> str:
+    """Исход доставки по ошибке отправки в Telegram"""
+    if isinstance(error, TelegramForbiddenError):
+        return OUTCOME_FORBIDDEN
+    if isinstance(error, TelegramNotFound) or (
+        isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+    ):
+        return OUTCOME_CHAT_NOT_FOUND
+    if isinstance(error, TelegramRetryAfter):
+        return OUTCOME_RATE_LIMITED
+    return OUTCOME_TRANSIENT
+
 
 class ReminderScheduler:
-    def __init__(self):
-        self.user_last_seen_ids: Dict[int, int] = {}
-        self.sent_today: set = set()
-        self.last_reset_date = datetime.now(TIMEZONE).date()
-        
-    def reset_daily_tracking(self):
-        """Сброс ежедневного отслеживания в полночь"""
-        current_date = datetime.now(TIMEZONE).date()
-        if current_date != self.last_reset_date:
-            self.sent_today.clear()
-            self.last_reset_date = current_date
-            logger.info("🔄 Daily reminder tracking reset")
-    
-    def is_sending_time(self) -> bool:
-        """Проверка, что текущее время в диапазоне 12:00-20:00"""
-        now = datetime.now(TIMEZONE)
-        return 12 <= now.hour < 20
-    
-    def get_random_delay_until_next_check(self) -> int:
-        """Получить случайную задержку до следующей проверки (в секундах)"""
-        # Проверяем каждые 30-90 минут в рабочее время
-        if self.is_sending_time():
-            return random.randint(30 * 60, 90 * 60)  # 30-90 минут
-        else:
-            # Вне рабочего времени проверяем реже - каждые 2-4 часа
-            return random.randint(2 * 60 * 60, 4 * 60 * 60)  # 2-4 часа
+    def __init__(self, bot: Bot, backend: BackendClient, concurrency: int = REMINDER_CONCURRENCY,
+                 partition: Optional[LeaseManager] = None):
+        self.bot = bot
+        self.backend = backend
+        self.concurrency = concurrency
+        # Корзины пользователей этого процесса; None - процесс один и рассылает всем
+        self.partition = partition
+        if partition is not None:
+            partition.on_change = self.on_partition_changed
+        # Курсоры ленты и время последней отправки; хранятся в reminder_state
+        self.state = ReminderState()
+        self.state_loaded = False
+        # Колесо на каждый часовой пояс (смещение от UTC в минутах): окно считается раз на группу
+        self.wheels: Dict[int, ReminderWheel] = {}
+        self._replan = True
+        self._wakeup = asyncio.Event()
+
+        # Статистика доставки: всего и за последний цикл
+        self.cycles = 0
+        self.outcomes: Counter = Counter()
+        self.disabled = 0
+        self.last_cycle: Dict = {}
     
-    async def get_users_with_reminders(self) -> List[int]:
-        """Получить список пользователей с включенными напоминаниями"""
+    def owns(self, user_id: int) -> bool:
+        return self.partition is None or self.partition.owns(user_id)
+    
+    def _partition_filter(self) -> dict:
+        return self.partition.request_filter() if self.partition is not None else {}
+    
+    async def load_state(self) -> bool:
+        """Прочитать состояние из базы (после перезапуска и смены корзин)"""
+        data = await self.backend.request("get_reminder_state", self._partition_filter())
+        if data.get("status") != "ok":
+            logger.error(f"Error loading reminder state: {data.get('message')}")
+            return False
+        self.state.load(data["user_ids"], data["last_seen_ids"], data["last_sent_at"])
+        self.state_loaded = True
+        logger.info(f"📥 Reminder state loaded: {len(self.state)} users, {self.state.memory_bytes()} bytes")
+        return True
+
+    async def save_state(self) -> bool:
+        """Записать изменения раунда одним запросом"""
+        rows = self.state.dirty_rows()
+        if not rows["user_ids"]:
+            return True
+        data = await self.backend.request("save_reminder_state", rows)
+        if data.get("status") != "ok":
+            # Изменения остаются в dirty и уйдут со следующим раундом
+            logger.error(f"Error saving reminder state: {data.get('message')}")
+            return False
+        self.state.mark_clean(rows["user_ids"])
+        return True
+    
+    def window(self, day: date, utc_offset: int) -> tuple:
+        """Начало и конец окна отправки в местный день пояса UTC+utc_offset минут (timestamp)"""
+        midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() - utc_offset * 60
+        return midnight + REMINDER_WINDOW_START * 3600, midnight + REMINDER_WINDOW_END * 3600
+    
+    def zone_wheel(self, utc_offset: int, now: float) -> ReminderWheel:
+        """Пустое колесо часового пояса: текущее местное окно, а после его конца - завтрашнее"""
+        day = datetime.fromtimestamp(now + utc_offset * 60, timezone.utc).date()
+        start_ts, end_ts = self.window(day, utc_offset)
+        if now >= end_ts:
+            day += timedelta(days=1)
+            start_ts, end_ts = self.window(day, utc_offset)
+        return ReminderWheel(start_ts, int(end_ts - start_ts), day.toordinal())
+    
+    async def build_wheels(self, query: dict, now: float) -> Optional[Dict[int, ReminderWheel]]:
+        """
+        Разложить пользователей с напоминаниями по колесам их поясов; None - ошибка API
+
+        Пользователи читаются потоком (/stream_users_with_reminders) и
+        раскладываются пачками по мере чтения: кроме самих колес память
+        не зависит от числа пользователей.
+        """
+        wheels: Dict[int, ReminderWheel] = {}
+        pending: Dict[int, List[int]] = {}
+
+        def flush(utc_offset: int):
+            wheel = wheels.get(utc_offset)
+            if wheel is None:
+                wheel = wheels[utc_offset] = self.zone_wheel(utc_offset, now)
+            # Слоты, прошедшие до запуска, отработают сразу - кроме уже получивших напоминание в этом окне
+            wheel.add_many(user_id for user_id in pending.pop(utc_offset)
+                           if not self.state.was_sent(user_id, wheel.start_ts))
+
         try:
-            response = requests.get(f"{API_BASE_URL}/get_users_with_reminders", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "ok":
-                    return data.get("user_ids", [])
-            return []
+            async for user in self.backend.stream("stream_users_with_reminders", {**self._partition_filter(), **query}):
+                batch = pending.setdefault(user["utc_offset_minutes"], [])
+                batch.append(user["user_id"])
+                if len(batch) >= REMINDER_BULK_SIZE:
+                    flush(user["utc_offset_minutes"])
         except Exception as e:
             logger.error(f"Error getting users with reminders: {e}")
-            return []
+            return None
+        for utc_offset in list(pending):
+            flush(utc_offset)
+        return wheels
     
-    async def get_reminder_message(self, user_id: int) -> dict:
-        """Получить сообщение для напоминания пользователю"""
-        try:
-            last_seen_id = self.user_last_seen_ids.get(user_id, 0)
-            
-            response = requests.post(
-                f"{API_BASE_URL}/get_reminder_message",
-                json={"user_id": user_id, "last_seen_id": last_seen_id},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "ok":
-                    message_data = data.get("message", {})
-                    # Обновляем last_seen_id для этого пользователя
-                    self.user_last_seen_ids[user_id] = message_data.get("id", last_seen_id)
-                    return message_data
-            return {}
-        except Exception as e:
-            logger.error(f"Error getting reminder message for user {user_id}: {e}")
-            return {}
+    async def plan(self, now: float) -> bool:
+        """Разложить всех пользователей по колесам их часовых поясов"""
+        # Без сохраненного состояния можно повторно отправить напоминания
+        if not self.state_loaded:
+            await self.save_state()
+            if not await self.load_state():
+                return False
+        wheels = await self.build_wheels({}, now)
+        if wheels is None:
+            return False
+
+        self.wheels = wheels
+        self._replan = False
+        logger.info(f"🗓️ Planned {sum(len(wheel) for wheel in self.wheels.values())} reminders "
+                    f"in {len(self.wheels)} time zones, wheel memory "
+                    f"{sum(wheel.memory_bytes() for wheel in self.wheels.values())} bytes")
+        return True
+    
+    async def plan_next_day(self, utc_offset: int, now: float) -> bool:
+        """Окно пояса закончилось: перечитать только его пользователей на следующий местный день"""
+        wheels = await self.build_wheels({"utc_offset_minutes": utc_offset}, now)
+        if wheels is None:
+            return False
+        wheel = wheels.get(utc_offset)
+        if wheel is not None:
+            self.wheels[utc_offset] = wheel
+            logger.info(f"🗓️ Planned {len(wheel)} reminders for UTC{utc_offset:+d} min, "
+                        f"day {date.fromordinal(wheel.day)}")
+        else:
+            # В поясе никого не осталось; появится снова по уведомлению
+            self.wheels.pop(utc_offset, None)
+        return True
+    
+    def on_reminders_changed(self, payload: str):
+        """Уведомление из базы: пользователь включил или выключил напоминания, сменил пояс или был заблокирован"""
+        user_id, enabled, utc_offset = parse_user_reminders_event(payload)
+        if self._replan:
+            return
+        # Пользователь мог сменить пояс - убираем из всех колес
+        for wheel in self.wheels.values():
+            wheel.remove(user_id)
+        if not enabled or not self.owns(user_id):
+            return
+        wheel = self.wheels.get(utc_offset)
+        if wheel is None:
+            wheel = self.wheels[utc_offset] = self.zone_wheel(utc_offset, time.time())
+        if wheel.add(user_id):
+            # Слот может оказаться раньше того, до которого спит планировщик
+            self._wakeup.set()
+    
+    def request_replan(self):
+        """Уведомления потеряны (переподключение) - перечитать пользователей"""
+        self._replan = True
+        self._wakeup.set()
+    
+    def on_partition_changed(self):
+        """Корзины процесса изменились - перечитать их пользователей и состояние"""
+        self.state_loaded = False
+        self.request_replan()
+    
+    async def get_reminder_messages(self, user_ids: List[int]) -> Dict[int, dict]:
+        """Сообщения для напоминаний многим пользователям: один запрос на REMINDER_BULK_SIZE"""
+        messages: Dict[int, dict] = {}
+        for start in range(0, len(user_ids), REMINDER_BULK_SIZE):
+            chunk = user_ids[start:start + REMINDER_BULK_SIZE]
+            data = await self.backend.request("get_reminder_messages", {"users": [
+                {"user_id": user_id, "last_seen_id": self.state.last_seen(user_id)} for user_id in chunk
+            ]})
+            if data.get("status") != "ok":
+                logger.error(f"Error getting reminder messages for {len(chunk)} users: {data.get('message')}")
+                continue
+            for item in data.get("messages", []):
+                message_data = item["message"]
+                messages[item["for_user_id"]] = message_data
+                # Обновляем last_seen_id для этого пользователя
+                self.state.set_last_seen(item["for_user_id"], message_data["id"])
+        return messages
     
     def format_message_text(self, message_data: dict) -> str:
         """Форматирование текста напоминания"""
@@ -93,65 +270,38 @@ class ReminderScheduler:
         return f"💝 **Напоминание о поддержке**\n\n{text}\n\n_— {nickname}_\n\n💭 Помни: ты не один, и всё наладится! 🌟"
     
     async def send_telegram_message(self, user_id: int, text: str, file_id: str = None, message_type: str = "text"):
-        """Отправка сообщения через Telegram Bot API"""
+        """Отправка сообщения через Telegram Bot API (с ограничением скорости, см. telegram_sender)"""
         try:
             if message_type == "voice" and file_id:
                 # Отправляем голосовое сообщение с подписью
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendVoice"
-                data = {
-                    "chat_id": user_id,
-                    "voice": file_id,
-                    "caption": text,
-                    "parse_mode": "Markdown"
-                }
+                await self.bot.send_voice(user_id, file_id, caption=text, parse_mode="Markdown")
             elif message_type == "video_note" and file_id:
                 # Отправляем видеосообщение с текстом отдельно
-                # Сначала отправляем видео
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendVideoNote"
-                data = {
-                    "chat_id": user_id,
-                    "video_note": file_id
-                }
-                response = requests.post(url, json=data, timeout=10)
-                
-                # Затем отправляем текст
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-                data = {
-                    "chat_id": user_id,
-                    "text": text,
-                    "parse_mode": "Markdown"
-                }
+                await self.bot.send_video_note(user_id, file_id)
+                await self.bot.send_message(user_id, text, parse_mode="Markdown")
             else:
                 # Обычное текстовое сообщение
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-                data = {
-                    "chat_id": user_id,
-                    "text": text,
-                    "parse_mode": "Markdown"
-                }
-            
-            response = requests.post(url, json=data, timeout=10)
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Reminder sent to user {user_id}")
-                return True
-            else:
-                logger.error(f"❌ Failed to send reminder to user {user_id}: {response.status_code}")
-                return False
-                
+                await self.bot.send_message(user_id, text, parse_mode="Markdown")
+
+            logger.info(f"✅ Reminder sent to user {user_id}")
+            return OUTCOME_OK
+
         except Exception as e:
-            logger.error(f"Error sending reminder to user {user_id}: {e}")
-            return False
+            outcome = classify_send_error(e)
+            logger.error(f"❌ Failed to send reminder to user {user_id} ({outcome}): {e}")
+            return outcome
     
-    async def send_reminder_to_user(self, user_id: int):
-        """Отправить напоминание конкретному пользователю"""
+    async def send_reminder_to_user(self, user_id: int, message_data: Optional[dict] = None,
+                                    sent_at: Optional[float] = None):
+        """Отправить напоминание конкретному пользователю и вернуть исход (сообщение - заранее полученное или запросить)"""
         try:
             # Получаем сообщение для напоминания
-            message_data = await self.get_reminder_message(user_id)
+            if message_data is None:
+                message_data = (await self.get_reminder_messages([user_id])).get(user_id, {})
             
             if not message_data:
                 logger.info(f"No reminder message available for user {user_id}")
-                return False
+                return OUTCOME_NO_MESSAGE
             
             # Форматируем текст
             text = self.format_message_text(message_data)
@@ -159,59 +309,130 @@ class ReminderScheduler:
             message_type = message_data.get("message_type", "text")
             
             # Отправляем напоминание
-            success = await self.send_telegram_message(user_id, text, file_id, message_type)
+            outcome = await self.send_telegram_message(user_id, text, file_id, message_type)
+            self.state.set_outcome(user_id, outcome)
             
-            if success:
-                self.sent_today.add(user_id)
+            if outcome == OUTCOME_OK:
+                self.state.mark_sent(user_id, time.time() if sent_at is None else sent_at)
                 logger.info(f"📬 Reminder sent to user {user_id} (message_id: {message_data.get('id')})")
             
-            return success
+            return outcome
             
         except Exception as e:
             logger.error(f"Error sending reminder to user {user_id}: {e}")
-            return False
+            return OUTCOME_TRANSIENT
     
-    async def process_reminders(self):
-        """Основной процесс отправки напоминаний"""
-        self.reset_daily_tracking()
-        
-        if not self.is_sending_time():
-            logger.info("⏰ Not in sending time window (12:00-20:00)")
-            return
-        
-        # Получаем пользователей с включенными напоминаниями
-        users = await self.get_users_with_reminders()
-        
-        if not users:
-            logger.info("📭 No users with enabled reminders found")
-            return
-        
-        # Фильтруем пользователей, которым сегодня еще не отправляли
-        eligible_users = [user_id for user_id in users if user_id not in self.sent_today]
-        
-        if not eligible_users:
-            logger.info("📫 All eligible users already received reminders today")
-            return
-        
-        # Выбираем случайное количество пользователей (10-30% от доступных)
-        max_users = max(1, len(eligible_users) // 3)  # Максимум треть пользователей
-        num_users_to_send = random.randint(1, max_users)
-        
-        selected_users = random.sample(eligible_users, min(num_users_to_send, len(eligible_users)))
-        
-        logger.info(f"📤 Sending reminders to {len(selected_users)} users out of {len(eligible_users)} eligible")
-        
-        # Отправляем напоминания
-        successful_sends = 0
-        for user_id in selected_users:
-            success = await self.send_reminder_to_user(user_id)
-            if success:
-                successful_sends += 1
-            
-            # Небольшая задержка между отправками
-            await asyncio.sleep(random.uniform(1, 3))
-        
-        logger.info(f"✅ Successfully sent {successful_sends}/{len(selected_users)} reminders")
+    async def tick(self, now: Optional[float] = None) -> float:
+        """Отправить напоминания наступивших слотов всех поясов; вернуть, сколько спать до следующих"""
+        self._wakeup.clear()
+        now = time.time() if now is None else now
+        if self._replan and not await self.plan(now):
+            return REMINDER_RETRY_DELAY
+
+        due = [user_id for wheel in self.wheels.values() for user_id in wheel.pop_due(now)
+               if self.owns(user_id) and not self.state.was_sent(user_id, wheel.start_ts)]
+        if due:
+            logger.info(f"📤 Sending reminders to {len(due)} users, "
+                        f"{sum(len(wheel) for wheel in self.wheels.values())} left in windows")
+        # Состояние сохраняется после каждой части: процесс, получивший корзину, увидит отправки
+        cycle = {"total": 0, "outcomes": Counter(), "disabled": 0}
+        for start in range(0, len(due), REMINDER_BULK_SIZE):
+            result = await self.deliver(due[start:start + REMINDER_BULK_SIZE], sent_at=now)
+            await self.save_state()
+            logger.info(f"✅ Successfully sent {result['sent']}/{result['total']} reminders "
+                        f"in {result['duration_s']}s ({result['per_second']}/s)")
+            cycle["total"] += result["total"]
+            cycle["outcomes"].update(result["outcomes"])
+            cycle["disabled"] += result["disabled"]
+        if due:
+            self.record_cycle(cycle)
+
+        # Окна закончившихся поясов (их слоты уже выданы выше) - на следующий день
+        for utc_offset, wheel in list(self.wheels.items()):
+            if now >= wheel.end_ts and not await self.plan_next_day(utc_offset, now):
+                return REMINDER_RETRY_DELAY
+
+        next_ts = min((wheel.next_due_ts() or wheel.end_ts for wheel in self.wheels.values()),
+                      default=now + REMINDER_RETRY_DELAY)
+        return max(0.0, next_ts - now)
+    
+    async def deliver(self, user_ids: List[int], sent_at: Optional[float] = None) -> Dict:
+        """
+        Разослать напоминания пользователям, не больше concurrency одновременно
+
+        Сообщения запрашиваются пакетами, а не по одному на пользователя.
+        Пауз между отправками нет: темп задает лимит Telegram в telegram_sender,
+        а параллельность скрывает задержки API и Telegram.
+        Недоставимым пользователям (UNREACHABLE_OUTCOMES) напоминания выключаются
+        одним запросом после отправки.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        self.state.add_users(user_ids)
+        messages = await self.get_reminder_messages(user_ids)
+
+        async def deliver_one(user_id: int) -> Optional[str]:
+            async with semaphore:
+                # Корзину могли отдать другому процессу, пока ждали очереди
+                if not self.owns(user_id):
+                    return None
+                return await self.send_reminder_to_user(user_id, messages.get(user_id, {}), sent_at)
+
+        results = await asyncio.gather(*(deliver_one(user_id) for user_id in user_ids))
+        duration = time.perf_counter() - started
+        outcomes = Counter(outcome for outcome in results if outcome is not None)
+        unreachable = {user_id: outcome for user_id, outcome in zip(user_ids, results) if outcome in UNREACHABLE_OUTCOMES}
+        disabled = await self.disable_reminders(unreachable) if unreachable else 0
+        sent = outcomes[OUTCOME_OK]
+        return {
+            "total": len(user_ids),
+            "sent": sent,
+            "failed": len(user_ids) - sent,
+            "duration_s": round(duration, 3),
+            "per_second": round(sent / duration, 1) if duration > 0 else 0.0,
+            "outcomes": dict(outcomes),
+            "disabled": disabled,
+        }
+    
+    async def disable_reminders(self, outcomes: Dict[int, str]) -> int:
+        """
+        Выключить напоминания недоставимым пользователям; колеса обновит уведомление из базы
+
+        Исходы API записывает вместе с выключением, не дожидаясь save_state:
+        без них /restore_reminders не включит напоминания вернувшемуся.
+        """
+        disabled = 0
+        user_ids = list(outcomes)
+        for start in range(0, len(user_ids), REMINDER_BULK_SIZE):
+            chunk = user_ids[start:start + REMINDER_BULK_SIZE]
+            data = await self.backend.request("disable_reminders", {
+                "user_ids": chunk, "outcomes": [outcomes[user_id] for user_id in chunk]
+            })
+            if data.get("status") != "success":
+                # Попробуем снова при следующей неудачной доставке
+                logger.error(f"Error disabling reminders for {len(chunk)} users: {data.get('message')}")
+                continue
+            disabled += data["disabled"]
+        return disabled
+    
+    def record_cycle(self, cycle: Dict):
+        """Учесть и записать в лог статистику доставки одного цикла"""
+        self.cycles += 1
+        self.outcomes.update(cycle["outcomes"])
+        self.disabled += cycle["disabled"]
+        self.last_cycle = {"total": cycle["total"], "outcomes": dict(cycle["outcomes"]),
+                           "disabled": cycle["disabled"]}
+        outcomes = ", ".join(f"{outcome} {count}" for outcome, count in cycle["outcomes"].most_common())
+        logger.info(f"📊 Reminder cycle: {cycle['total']} users, {outcomes or 'nothing sent'}, "
+                    f"{cycle['disabled']} disabled as unreachable")
+    
+    def stats(self) -> dict:
+        return {
+            "cycles": self.cycles,
+            "outcomes": dict(self.outcomes),
+            "disabled": self.disabled,
+            "last_cycle": self.last_cycle,
+        }
     
     async def run_scheduler(self):
         """Запуск планировщика"""
@@ -219,20 +440,19 @@ class ReminderScheduler:
         
         while True:
             try:
-                await self.process_reminders()
-                
-                # Случайная задержка до следующей проверки
-                delay = self.get_random_delay_until_next_check()
-                next_check = datetime.now(TIMEZONE) + timedelta(seconds=delay)
-                
-                logger.info(f"⏳ Next reminder check at: {next_check.strftime('%H:%M:%S')} (in {delay//60} minutes)")
-                
-                await asyncio.sleep(delay)
-                
+                delay = await self.tick()
             except Exception as e:
                 logger.error(f"Error in reminder scheduler: {e}")
-                # В случае ошибки ждем 10 минут и пытаемся снова
-                await asyncio.sleep(600)
+                delay = REMINDER_RETRY_DELAY
+            
+            if delay > 60:
+                next_check = datetime.now(TIMEZONE) + timedelta(seconds=delay)
+                logger.info(f"⏳ Next reminders at: {next_check.strftime('%H:%M:%S')} (in {int(delay)//60} minutes)")
+            try:
+                # Спим до следующего слота; уведомление о включении напоминаний будит раньше
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
 async def main():
     """Главная функция"""
@@ -240,8 +460,40 @@ async def main():
         logger.error("❌ BOT_TOKEN environment variable is required")
         return
     
-    scheduler = ReminderScheduler()
-    await scheduler.run_scheduler()
+    bot = Bot(token=BOT_TOKEN)
+    # Все напоминания - фоновая полоса с собственной долей лимита
+    sender = install_sender(bot, TelegramSender(rate=REMINDER_SEND_RATE), priority=PRIORITY_BACKGROUND)
+    backend = BackendClient(API_BASE_URL)
+    await backend.start()
+    # Несколько процессов делят пользователей арендой корзин
+    partition = LeaseManager(backend) if REMINDER_PARTITIONED else None
+    scheduler = ReminderScheduler(bot, backend, partition=partition)
+    events = DatabaseEvents({
+        "host": DB_HOST, "port": DB_PORT,
+        "user": DB_USER, "password": DB_PASSWORD,
+        "database": DB_NAME
+    })
+    events.subscribe(CHANNEL_USER_REMINDERS, scheduler.on_reminders_changed)
+    events.on_reconnect(scheduler.request_replan)
+    try:
+        await events.start()
+    except Exception as e:
+        logger.warning(f"⚠️ Reminder toggle notifications unavailable, users are re-read once a day: {e}")
+    try:
+        if partition is not None:
+            await partition.start()
+        await scheduler.run_scheduler()
+    finally:
+        await events.close()
+        if partition is not None:
+            await scheduler.save_state()
+            await partition.close()
+            logger.info(f"🪣 Reminder leases: {partition.stats()}")
+        logger.info(f"📊 Reminder deliveries: {scheduler.stats()}")
+        logger.info(f"📊 Telegram sends: {sender.stats()}, API: {backend.stats()}")
+        await sender.close()
+        await backend.close()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Состояние планировщика напоминаний в памяти: курсор ленты и время последней отправки
+
+Пользователи хранятся в отсортированном array('q') - плотный индекс находится
+бинарным поиском. По индексу лежат last_seen_id в array('i') и минута
+последней отправки (Unix-время / 60) в array('i'): 16 байт на пользователя
+против 60+ у словарей (см. bench_reminder_state.py). Время, а не флаг
+"сегодня", потому что у пользователей разные часовые пояса. Новых
+пользователей раунда add_users вставляет одним слиянием. Изменения с
+последнего сохранения копятся в dirty и пишутся в таблицу reminder_state
+одним запросом (/save_reminder_state). Исход последней попытки доставки
+хранится только до сохранения: в памяти его держать незачем.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Set
+
+
+class ReminderState:
+    """Курсоры и время отправки, упакованные по плотному индексу пользователя"""
+
+    def __init__(self):
+        self._user_ids = array("q")
+        self._last_seen = array("i")
+        # Минута последней отправки, 0 - не отправляли
+        self._sent_min = array("i")
+        self._dirty: Set[int] = set()
+        # Исходы доставки, еще не записанные в базу
+        self._outcomes: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def _index(self, user_id: int) -> Optional[int]:
+        i = bisect_left(self._user_ids, user_id)
+        if i < len(self._user_ids) and self._user_ids[i] == user_id:
+            return i
+        return None
+
+    def _ensure(self, user_id: int) -> int:
+        i = bisect_left(self._user_ids, user_id)
+        if i < len(self._user_ids) and self._user_ids[i] == user_id:
+            return i
+        self._user_ids.insert(i, user_id)
+        self._last_seen.insert(i, 0)
+        self._sent_min.insert(i, 0)
+        return i
+
+    def add_users(self, user_ids: Iterable[int]):
+        """Добавить отсутствующих пользователей одним слиянием, а не вставкой по одному"""
+        new_ids = sorted(set(user_ids).difference(self._user_ids))
+        if not new_ids:
+            return
+        merged_ids, merged_seen, merged_sent = array("q"), array("i"), array("i")
+        i = 0
+        for user_id in new_ids:
+            while i < len(self._user_ids) and self._user_ids[i] < user_id:
+                merged_ids.append(self._user_ids[i])
+                merged_seen.append(self._last_seen[i])
+                merged_sent.append(self._sent_min[i])
+                i += 1
+            merged_ids.append(user_id)
+            merged_seen.append(0)
+            merged_sent.append(0)
+        merged_ids.extend(self._user_ids[i:])
+        merged_seen.extend(self._last_seen[i:])
+        merged_sent.extend(self._sent_min[i:])
+        self._user_ids, self._last_seen, self._sent_min = merged_ids, merged_seen, merged_sent
+
+    def load(self, user_ids: Iterable[int], last_seen_ids: Iterable[int], last_sent_at: Iterable[Optional[int]]):
+        """Заменить состояние данными из базы (user_ids отсортированы, время - Unix-секунды или None)"""
+        self._user_ids = array("q", user_ids)
+        self._last_seen = array("i", last_seen_ids)
+        self._sent_min = array("i", (ts // 60 if ts else 0 for ts in last_sent_at))
+        self._dirty.clear()
+        self._outcomes.clear()
+
+    def last_seen(self, user_id: int) -> int:
+        i = self._index(user_id)
+        return self._last_seen[i] if i is not None else 0
+
+    def set_last_seen(self, user_id: int, last_seen_id: int):
+        i = self._ensure(user_id)
+        if self._last_seen[i] != last_seen_id:
+            self._last_seen[i] = last_seen_id
+            self._dirty.add(user_id)
+
+    def was_sent(self, user_id: int, since_ts: float) -> bool:
+        """Отправляли ли пользователю начиная с since_ts (например, с начала его окна)"""
+        i = self._index(user_id)
+        return i is not None and 0 < self._sent_min[i] >= since_ts // 60
+
+    def mark_sent(self, user_id: int, ts: float):
+        i = self._ensure(user_id)
+        self._sent_min[i] = int(ts // 60)
+        self._dirty.add(user_id)
+
+    def set_outcome(self, user_id: int, outcome: str):
+        """Исход попытки доставки (ok, forbidden, ...) - уйдет в базу со следующим сохранением"""
+        self._ensure(user_id)
+        self._outcomes[user_id] = outcome
+        self._dirty.add(user_id)
+
+    def sent_count(self, since_ts: float) -> int:
+        since = since_ts // 60
+        return sum(1 for minute in self._sent_min if 0 < minute >= since)
+
+    def dirty_rows(self) -> Dict[str, list]:
+        """Изменения с последнего сохранения - столбцами, как их принимает API"""
+        user_ids = sorted(self._dirty)
+        indexes = [self._index(user_id) for user_id in user_ids]
+        return {
+            "user_ids": user_ids,
+            "last_seen_ids": [self._last_seen[i] for i in indexes],
+            "last_sent_at": [self._sent_min[i] * 60 or None for i in indexes],
+            "last_outcomes": [self._outcomes.get(user_id) for user_id in user_ids],
+        }
+
+    def mark_clean(self, user_ids: Iterable[int]):
+        user_ids = list(user_ids)
+        self._dirty.difference_update(user_ids)
+        for user_id in user_ids:
+            self._outcomes.pop(user_id, None)
+
+    def memory_bytes(self) -> int:
+        """Размер упакованных данных (без dirty и несохраненных исходов)"""
+        return (self._user_ids.itemsize * len(self._user_ids)
+                + self._last_seen.itemsize * len(self._last_seen)
+                + self._sent_min.itemsize * len(self._sent_min))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Колесо таймеров для напоминаний: у каждого пользователя свое время в окне отправки
+
+Окно дня (12:00-20:00) делится на слоты по REMINDER_SLOT_SECONDS; слот
+пользователя на день - хэш (user_id, день), поэтому отправки равномерно
+распределены по окну и время не нужно хранить: слот - это array('q') с
+user_id, 8 байт на пользователя. Планировщик спит ровно до ближайшего
+непустого слота. Включение и выключение напоминаний меняет один слот.
+"""
+
+import os
+from array import array
+from typing import List, Optional
+
+# Ширина слота колеса (секунды)
+REMINDER_SLOT_SECONDS = int(os.getenv("REMINDER_SLOT_SECONDS", "60"))
+
+MASK64 = (1 << 64) - 1
+
+
+def mix64(x: int) -> int:
+    """splitmix64: быстрый равномерный хэш целого"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class ReminderWheel:
+    """Слоты одного окна отправки: [start_ts, start_ts + slots * slot_seconds)"""
+
+    def __init__(self, start_ts: float, window_seconds: int, day: int,
+                 slot_seconds: int = REMINDER_SLOT_SECONDS):
+        self.start_ts = start_ts
+        self.slot_seconds = slot_seconds
+        self.day = day
+        self._slots: List[array] = [array("q") for _ in range(max(1, window_seconds // slot_seconds))]
+        # Следующий еще не выданный слот
+        self._cursor = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def end_ts(self) -> float:
+        return self.start_ts + len(self._slots) * self.slot_seconds
+
+    def slot_of(self, user_id: int) -> int:
+        """Слот пользователя в этот день (один и тот же при каждом вызове)"""
+        return mix64(user_id * 100_003 + self.day) % len(self._slots)
+
+    def due_ts(self, user_id: int) -> float:
+        return self.start_ts + self.slot_of(user_id) * self.slot_seconds
+
+    def add(self, user_id: int) -> bool:
+        """Запланировать пользователя; False - его слот уже прошел или он уже в колесе"""
+        slot = self.slot_of(user_id)
+        if slot < self._cursor or user_id in self._slots[slot]:
+            return False
+        self._slots[slot].append(user_id)
+        self._size += 1
+        return True
+
+    def add_many(self, user_ids) -> int:
+        """Начальное заполнение: без проверки на повтор (user_ids уникальны)"""
+        added = 0
+        slots, cursor, n = self._slots, self._cursor, len(self._slots)
+        for user_id in user_ids:
+            slot = mix64(user_id * 100_003 + self.day) % n
+            if slot >= cursor:
+                slots[slot].append(user_id)
+                added += 1
+        self._size += added
+        return added
+
+    def remove(self, user_id: int) -> bool:
+        slot = self.slot_of(user_id)
+        if slot < self._cursor or user_id not in self._slots[slot]:
+            return False
+        self._slots[slot].remove(user_id)
+        self._size -= 1
+        return True
+
+    def pop_due(self, now: float) -> List[int]:
+        """Забрать пользователей всех слотов, время которых наступило"""
+        due: List[int] = []
+        last = min(len(self._slots), int((now - self.start_ts) // self.slot_seconds) + 1)
+        while self._cursor < last:
+            slot = self._slots[self._cursor]
+            due.extend(slot)
+            self._size -= len(slot)
+            # Память отработанного слота освобождаем сразу
+            self._slots[self._cursor] = array("q")
+            self._cursor += 1
+        return due
+
+    def next_due_ts(self) -> Optional[float]:
+        """Время ближайшего непустого слота; None - до конца окна никого нет"""
+        for i in range(self._cursor, len(self._slots)):
+            if self._slots[i]:
+                return self.start_ts + i * self.slot_seconds
+        return None
+
+    def memory_bytes(self) -> int:
+        return sum(slot.itemsize * len(slot) for slot in self._slots)
@@ -1,6 +1,7 @@
 import asyncpg
 import asyncio
 import os
+from migrations import run_migrations
 
 # Настройки подключения из переменных окружения
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -21,76 +22,14 @@ async def setup_database():
             database=DB_NAME
         )
         
-        print("Создание таблиц...")
+        print("Применение миграций схемы...")
         
-        # Создаем таблицы
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                nickname VARCHAR(50) UNIQUE NOT NULL,
-                is_blocked BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        """)
-        
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES users(user_id),
-                text TEXT,
-                file_id TEXT,
-                message_type VARCHAR(20) NOT NULL DEFAULT 'text' CHECK (message_type IN ('text', 'voice', 'video_note')),
-                type VARCHAR(20) NOT NULL CHECK (type IN ('support', 'request')),
-                created_at TIMESTAMP DEFAULT NOW()
-            )
-        """)
-        
-        # Создаем таблицу жалоб
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS complaints (
-                id SERIAL PRIMARY KEY,
-                message_id INTEGER,
-                original_user_id BIGINT,
-                complainer_user_id BIGINT REFERENCES users(user_id),
-                text TEXT,
-                file_id TEXT,
-                message_type VARCHAR(20) NOT NULL DEFAULT 'text' CHECK (message_type IN ('text', 'voice', 'video_note')),
-                created_at TIMESTAMP DEFAULT NOW(),
-                complaint_date TIMESTAMP DEFAULT NOW()
-            )
-        """)
-        
-        # Создаем таблицу рейтингов
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS ratings (
-                user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
-                rating INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT NOW(),
-                updated_at TIMESTAMP DEFAULT NOW()
-            )
-        """)
-        
-        # Добавляем недостающие столбцы в существующие таблицы
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_blocked BOOLEAN DEFAULT FALSE")
-            print("✅ Столбец is_blocked добавлен в таблицу users")
-        except Exception as e:
-            print(f"ℹ️ Столбец is_blocked уже существует: {e}")
-        
-        try:
-            await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS reminders_enabled BOOLEAN DEFAULT TRUE")
-            print("✅ Столбец reminders_enabled добавлен в таблицу users")
-        except Exception as e:
-            print(f"ℹ️ Столбец reminders_enabled уже существует: {e}")
-        
-        # Создаем индексы
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_type ON messages(type)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_complaints_original_user_id ON complaints(original_user_id)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_complaints_complainer_user_id ON complaints(complainer_user_id)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_blocked ON users(is_blocked)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user_id ON ratings(user_id)")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_ratings_rating ON ratings(rating)")
+        # Схемой владеет migrations.py, здесь только применяем новые версии
+        applied = await run_migrations(conn)
+        if applied:
+            print(f"✅ Применены миграции: {applied}")
+        else:
+            print("ℹ️ Схема уже актуальна")
         
         await conn.close()
         print("✅ Таблицы созданы/обновлены успешно!")
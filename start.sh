@@ -77,7 +77,7 @@ if not asyncio.run(check_db()):
 init_db() {
     log "🗄️ Инициализация базы данных..."
     
-    python setup_db_manual.py
+    python migrations.py
     
     if [ $? -eq 0 ]; then
         log "✅ База данных инициализирована"
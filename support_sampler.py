@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Случайный выбор сообщений поддержки без ORDER BY RANDOM()
+
+В памяти процесса хранятся два параллельных массива: id сообщений поддержки
+и их авторы. Выбор - случайный индекс и проверка кандидата (не свой,
+автор не заблокирован, сообщение не удалено), поэтому время не зависит
+от размера пула. Массивы обновляются по уведомлениям из db_events.
+"""
+
+import os
+import random
+import logging
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Сколько случайных кандидатов проверить, прежде чем отказаться
+SUPPORT_SAMPLER_MAX_ATTEMPTS = int(os.getenv("SUPPORT_SAMPLER_MAX_ATTEMPTS", "32"))
+
+# Сжимать массивы, когда удаленных записей больше этой доли
+COMPACT_RATIO = 0.25
+COMPACT_MIN_DELETED = 1024
+
+
+class SupportSampler:
+    """Пул id сообщений поддержки для выбора за O(1)"""
+
+    def __init__(self, max_attempts: int = SUPPORT_SAMPLER_MAX_ATTEMPTS, rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self._rng = rng or random.Random()
+        self._ids = array("q")
+        self._authors = array("q")
+        self._deleted: Set[int] = set()
+        self._blocked: Set[int] = set()
+        self._loaded = False
+        # Изменения, пришедшие во время загрузки, переигрываются после нее
+        self._pending: Optional[List[Tuple[str, int, int]]] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._deleted)
+
+    async def load(self, conn: asyncpg.Connection):
+        """Перечитать пул из базы (при старте и после потери уведомлений)"""
+        self._pending = []
+        ids = array("q")
+        authors = array("q")
+        try:
+            # Один снимок для сообщений и блокировок
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                blocked = {row["user_id"] for row in await conn.fetch(
+                    "SELECT user_id FROM users WHERE is_blocked = TRUE"
+                )}
+                async for row in conn.cursor(
+                    "SELECT id, user_id FROM messages WHERE type = 'support'", prefetch=10000
+                ):
+                    ids.append(row["id"])
+                    authors.append(row["user_id"])
+
+            pending, self._pending = self._pending, None
+            self._ids, self._authors = ids, authors
+            self._deleted = set()
+            self._blocked = blocked
+            # Уведомление о сообщении, зафиксированном до снимка, приходит и во время загрузки:
+            # такое сообщение уже есть в пуле, второй раз его не добавляем (иначе двойной вес)
+            pending_adds = {first for op, first, _ in pending if op == "add"}
+            present = {message_id for message_id in ids if message_id in pending_adds} if pending_adds else set()
+            for op, first, second in pending:
+                if op == "add":
+                    if first in present:
+                        continue
+                    present.add(first)
+                self._apply(op, first, second)
+            self._loaded = True
+        finally:
+            self._pending = None
+
+        logger.info(f"🎲 Support sampler loaded: {len(self)} messages, {len(self._blocked)} blocked authors")
+
+    def add(self, message_id: int, user_id: int):
+        """Новое сообщение поддержки"""
+        self._record("add", message_id, user_id)
+
+    def remove(self, message_id: int):
+        """Сообщение удалено"""
+        self._record("remove", message_id, 0)
+
+    def set_blocked(self, user_id: int, blocked: bool):
+        """Автор заблокирован или разблокирован"""
+        self._record("block", user_id, int(blocked))
+
+    def sample(self, exclude_user_id: int) -> Optional[int]:
+        """
+        Случайный id сообщения не от exclude_user_id и не от заблокированного автора
+
+        None - подходящий кандидат не найден за max_attempts попыток
+        (пул пуст или почти весь принадлежит самому пользователю).
+        """
+        size = len(self._ids)
+        if size == 0:
+            self.misses += 1
+            return None
+
+        for _ in range(self.max_attempts):
+            index = self._rng.randrange(size)
+            author = self._authors[index]
+            if author == exclude_user_id or author in self._blocked:
+                continue
+            message_id = self._ids[index]
+            if message_id in self._deleted:
+                continue
+            self.hits += 1
+            return message_id
+
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self._loaded,
+            "messages": len(self),
+            "deleted_pending_compaction": len(self._deleted),
+            "blocked_authors": len(self._blocked),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _record(self, op: str, first: int, second: int):
+        if self._pending is not None:
+            self._pending.append((op, first, second))
+        self._apply(op, first, second)
+
+    def _apply(self, op: str, first: int, second: int):
+        if op == "add":
+            self._ids.append(first)
+            self._authors.append(second)
+        elif op == "remove":
+            self._deleted.add(first)
+            self._maybe_compact()
+        elif op == "block":
+            if second:
+                self._blocked.add(first)
+            else:
+                self._blocked.discard(first)
+
+    def _maybe_compact(self):
+        deleted = len(self._deleted)
+        if deleted < COMPACT_MIN_DELETED or deleted < len(self._ids) * COMPACT_RATIO:
+            return
+
+        ids = array("q")
+        authors = array("q")
+        for message_id, author in zip(self._ids, self._authors):
+            if message_id not in self._deleted:
+                ids.append(message_id)
+                authors.append(author)
+        self._ids, self._authors = ids, authors
+        self._deleted = set()
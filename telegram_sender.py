@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Исходящие сообщения в Telegram: ограничение скорости и очередь с приоритетами
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного
+в секунду в один чат; при превышении отвечает 429 с retry_after, и сообщение
+теряется. Все отправки (send*, copyMessage, forwardMessage) проходят через
+TelegramSender: общий token bucket, token bucket на чат и две полосы -
+интерактивные ответы идут раньше фоновых рассылок (напоминаний, ответов
+другим пользователям). retry_after приостанавливает все отправки процесса,
+сообщение отправляется повторно.
+
+Подключается к aiogram как middleware сессии: install_sender(bot).
+Бот и планировщик напоминаний - разные процессы со своими лимитами,
+поэтому планировщику выделяется часть общего лимита (REMINDER_SEND_RATE).
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Сообщений в секунду на процесс и допустимый всплеск
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "5"))
+# Сообщений в секунду в один чат и допустимый всплеск
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+# Сколько раз повторять отправку после 429
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Полоса для отправок текущей задачи (см. background_sends)
+send_priority: contextvars.ContextVar[int] = contextvars.ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Чатов с заполненным bucket больше этого - лишние забываются
+CHAT_BUCKETS_MAX = 10000
+
+
+@contextmanager
+def background_sends():
+    """Отправки внутри блока идут в фоновой полосе"""
+    token = send_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+def is_send_method(method: TelegramMethod) -> bool:
+    name = method.__api_method__
+    return name.startswith("send") and name != "sendChatAction" or name in ("copyMessage", "forwardMessage")
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет токен"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class TelegramSender:
+    """Очередь разрешений на отправку: приоритет, затем порядок постановки"""
+
+    def __init__(self, rate: float = TELEGRAM_GLOBAL_RATE,
+                 burst: int = TELEGRAM_GLOBAL_BURST,
+                 chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST,
+                 retries: int = TELEGRAM_SEND_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retries = retries
+        self._global = TokenBucket(rate, burst)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+
+        self._seq = itertools.count()
+        # (priority, seq, chat_id, future, queued_at)
+        self._queue: List[tuple] = []
+        # Ждут лимита своего чата: (ready_at, priority, seq, chat_id, future, queued_at)
+        self._delayed: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.granted = [0, 0]
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self.queue_wait = [LatencyStats(), LatencyStats()]
+        self.send_latency = LatencyStats()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + len(self._delayed)
+
+    async def acquire(self, chat_id: Optional[int], priority: int = PRIORITY_INTERACTIVE):
+        """Дождаться разрешения на одну отправку в chat_id"""
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), chat_id, future, time.perf_counter()))
+        self._wakeup.set()
+        await future
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать: отправки процесса встают на seconds"""
+        self.retry_after += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"⏳ Telegram flood control: pausing sends for {seconds}s")
+
+    async def close(self):
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+        for item in self._queue + self._delayed:
+            item[-2].cancel()
+        self._queue.clear()
+        self._delayed.clear()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_MAX:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_full(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                heapq.heappush(self._queue, heapq.heappop(self._delayed)[1:])
+
+            if not self._queue:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = max(self._paused_until - now, self._global.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            priority, seq, chat_id, future, queued_at = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            bucket = self._chat_bucket(chat_id, now) if chat_id is not None else None
+            if bucket is not None:
+                delay = bucket.delay(now)
+                if delay > 0:
+                    # Чат исчерпал лимит - не задерживаем остальные чаты
+                    heapq.heappush(self._delayed, (now + delay, priority, seq, chat_id, future, queued_at))
+                    continue
+                bucket.take()
+            self._global.take()
+            self.granted[priority] += 1
+            self.queue_wait[priority].observe(time.perf_counter() - queued_at)
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after": self.retry_after,
+            "interactive": {"granted": self.granted[PRIORITY_INTERACTIVE],
+                            "queue_wait": self.queue_wait[PRIORITY_INTERACTIVE].snapshot()},
+            "background": {"granted": self.granted[PRIORITY_BACKGROUND],
+                           "queue_wait": self.queue_wait[PRIORITY_BACKGROUND].snapshot()},
+            "send_latency": self.send_latency.snapshot(),
+        }
+
+
+class TelegramSenderMiddleware(BaseRequestMiddleware):
+    """Middleware сессии aiogram: отправки ждут очереди TelegramSender"""
+
+    def __init__(self, sender: TelegramSender, priority: Optional[int] = None):
+        self.sender = sender
+        # Полоса по умолчанию для всех отправок этого бота (иначе - send_priority)
+        self.priority = priority
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        if not is_send_method(method):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_key = chat_id if isinstance(chat_id, int) else None
+        priority = self.priority if self.priority is not None else send_priority.get()
+        attempt = 0
+        while True:
+            await self.sender.acquire(chat_key, priority)
+            started = time.perf_counter()
+            try:
+                response = await make_request(bot, method)
+                self.sender.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.sender.pause(e.retry_after)
+                attempt += 1
+                if attempt > self.sender.retries:
+                    self.sender.failed += 1
+                    raise
+            except Exception:
+                self.sender.failed += 1
+                raise
+            finally:
+                self.sender.send_latency.observe(time.perf_counter() - started)
+
+
+def install_sender(bot: Bot, sender: Optional[TelegramSender] = None,
+                   priority: Optional[int] = None) -> TelegramSender:
+    """Пустить отправки бота через sender (по умолчанию - новый)"""
+    sender = sender or TelegramSender()
+    bot.session.middleware(TelegramSenderMiddleware(sender, priority))
+    return sender
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Тест клиента API ботов: переиспользование соединений, таймауты, статистика
+"""
+
+import asyncio
+
+import uvicorn
+from aiohttp import web
+
+import main
+from backend_client import BackendClient, InProcessBackend
+from db_pool import DatabasePool
+
+
+async def start_backend():
+    async def handler(request):
+        endpoint = request.match_info["endpoint"]
+        if endpoint == "slow":
+            await asyncio.sleep(1)
+        if endpoint == "broken":
+            return web.Response(status=500)
+        if endpoint.startswith("stream"):
+            return await stream(request, endpoint)
+        return web.json_response({"status": "ok", "echo": await request.json()})
+
+    async def stream(request, endpoint):
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        count = (await request.json())["count"]
+        body = "".join(f'{{"n": {n}}}\n' for n in range(count))
+        if endpoint == "stream":
+            body += f'{{"status": "ok", "count": {count}}}\n'
+        elif endpoint == "stream_error":
+            body += '{"status": "error", "message": "db down"}\n'
+        # Куски не совпадают с границами строк
+        for start in range(0, len(body), 7):
+            await response.write(body[start:start + 7].encode())
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/{endpoint}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_keepalive_timeouts_and_stats():
+    async def run():
+        runner, url = await start_backend()
+        client = BackendClient(url, timeout=5)
+        try:
+            for i in range(20):
+                assert await client.request("profile", {"user_id": i}) == {"status": "ok", "echo": {"user_id": i}}
+            # Последовательные запросы идут по одному соединению
+            assert client.connections_opened == 1
+
+            assert await client.request("slow", {}, timeout=0.05) == {"status": "error", "message": "timeout"}
+            assert (await client.request("broken", {}))["message"] == "HTTP 500"
+
+            stats = client.stats()
+            assert stats["timeouts"] == 1
+            assert stats["endpoints"]["profile"]["count"] == 20
+            assert stats["endpoints"]["profile"]["errors"] == 0
+            assert stats["endpoints"]["broken"]["errors"] == 1
+        finally:
+            await client.close()
+            await runner.cleanup()
+        assert not client.is_started
+
+    asyncio.run(run())
+
+
+def test_msgpack_over_unix_socket(tmp_path):
+    """msgpack в запросе и ответе по Unix-сокету; JSON-клиент работает с тем же API"""
+    from fastapi import FastAPI
+    from pydantic import BaseModel
+
+    from api_codec import MsgpackRoute
+
+    class Query(BaseModel):
+        user_id: int
+        text: str
+
+    api = FastAPI()
+    api.router.route_class = MsgpackRoute
+
+    @api.post("/echo")
+    async def echo(data: Query):
+        return {"status": "ok", "user_id": data.user_id, "text": data.text}
+
+    async def run():
+        socket_path = str(tmp_path / "api.sock")
+        server = uvicorn.Server(uvicorn.Config(api, uds=socket_path, lifespan="off", log_level="warning"))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            payload = {"user_id": 7, "text": "привет"}
+            for codec in ("msgpack", "json"):
+                client = BackendClient(None, uds=socket_path, codec=codec)
+                try:
+                    assert await client.request("echo", payload) == {"status": "ok", **payload}
+                    assert (await client.request("echo", {"user_id": "x"}))["message"] == "HTTP 422"
+                finally:
+                    await client.close()
+        finally:
+            server.should_exit = True
+            await task
+
+    asyncio.run(run())
+
+
+def test_ndjson_stream():
+    """Записи потока отдаются по строкам; обрыв и ошибка в последней строке - исключения"""
+    async def run():
+        runner, url = await start_backend()
+        client = BackendClient(url, timeout=5)
+        try:
+            records = [record async for record in client.stream("stream", {"count": 50})]
+            assert records == [{"n": n} for n in range(50)]
+
+            for endpoint, message in (("stream_truncated", "without status"), ("stream_error", "db down"),
+                                      ("broken", "HTTP 500")):
+                try:
+                    async for _ in client.stream(endpoint, {"count": 3}):
+                        pass
+                except RuntimeError as e:
+                    assert message in str(e)
+                else:
+                    raise AssertionError(f"{endpoint} did not fail")
+
+            stats = client.stats()["endpoints"]
+            assert stats["stream"]["count"] == 1 and stats["stream"]["errors"] == 0
+            assert stats["stream_truncated"]["errors"] == 1
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_in_process_backend(pg_schema, monkeypatch):
+    """BACKEND_TRANSPORT=inprocess: ресурсы API через main.lifespan, ответы как после JSON"""
+    async def run():
+        monkeypatch.setattr(main, "db_pool", DatabasePool(**pg_schema, min_size=1, max_size=2))
+        monkeypatch.setattr(main.db_events, "connect_kwargs", pg_schema)
+        main.profile_cache.clear()
+        client = InProcessBackend(timeout=5)
+
+        # Первый запрос запускает lifespan: пул, миграции, уведомления, данные в памяти
+        result = await client.request("set_nickname", {"user_id": 1, "nickname": "first"})
+        assert result["status"] == "success" and client.is_started
+        assert main.db_events._conn is not None
+        await client.start()  # повторный запуск ничего не делает
+        try:
+            profile = await client.request("profile", {"user_id": 1})
+            assert profile["nickname"] == "first" and profile["rating"] == 0
+
+            # datetime из базы приводится к строке, как в ответе HTTP
+            async with main.db_pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO user_achievements (user_id, achievement_id)
+                    SELECT 1, id FROM achievements ORDER BY id LIMIT 1
+                """)
+            achievements = (await client.request("get_user_achievements", {"user_id": 1}))["achievements"]
+            assert len(achievements) == 1 and isinstance(achievements[0]["earned_at"], str)
+
+            assert (await client.request("profile", {"user_id": "x"}))["message"].startswith("Invalid data")
+
+            records = [record async for record in client.stream("stream_users_with_reminders", {})]
+            assert records == [{"user_id": 1, "utc_offset_minutes": 180}]
+            try:
+                async for _ in client.stream("stream_users_with_reminders", {"limit": "x"}):
+                    pass
+            except RuntimeError as e:
+                assert "Invalid data" in str(e)
+            else:
+                raise AssertionError("invalid stream request did not fail")
+
+            # Запись другим процессом сбрасывает кэш профиля через уведомления базы
+            async with main.db_pool.acquire() as conn:
+                await conn.execute("UPDATE users SET reminders_enabled = FALSE WHERE user_id = 1")
+            for _ in range(100):
+                profile = await client.request("profile", {"user_id": 1})
+                if not profile["reminders_enabled"]:
+                    break
+                await asyncio.sleep(0.01)
+            assert not profile["reminders_enabled"]
+
+            # Таймаут на вызов обработчика
+            call_endpoint = main.call_endpoint
+
+            async def slow_call_endpoint(endpoint, data):
+                await asyncio.sleep(1)
+                return await call_endpoint(endpoint, data)
+
+            monkeypatch.setattr(main, "call_endpoint", slow_call_endpoint)
+            assert await client.request("profile", {"user_id": 1}, timeout=0.05) == {
+                "status": "error", "message": "timeout"}
+            monkeypatch.setattr(main, "call_endpoint", call_endpoint)
+            assert client.stats()["timeouts"] == 1
+        finally:
+            await client.close()
+
+        # Остановка закрывает ресурсы API
+        assert not client.is_started and main.db_events._conn is None
+        assert not main.db_pool.is_started
+
+    asyncio.run(run())
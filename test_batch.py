@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Тест /batch: несколько эндпоинтов на одном соединении, в транзакции и без
+"""
+
+import os
+import asyncio
+
+import main
+from db_pool import DatabasePool
+from migrations import run_migrations
+
+
+def batch_request(operations, transaction=False):
+    return main.BatchRequest(
+        operations=[{"endpoint": endpoint, "data": data} for endpoint, data in operations],
+        transaction=transaction
+    )
+
+
+def test_batch_commits_and_rolls_back(pg_schema, monkeypatch):
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await main.leaderboard.load(conn)
+            main.profile_cache.clear()
+
+            result = await main.batch(batch_request([
+                ("set_nickname", {"user_id": 1, "nickname": "first"}),
+                ("set_nickname", {"user_id": 2, "nickname": "second"}),
+                ("profile", {"user_id": 1}),
+                ("no_such_endpoint", {}),
+            ]))
+            assert result["status"] == "success"
+            statuses = [item["status"] for item in result["results"]]
+            assert statuses == ["success", "success", "ok", "error"]
+            assert main.leaderboard.has_user(1) and main.leaderboard.has_user(2)
+
+            # Вторая операция падает (никнейм занят) - первая откатывается
+            result = await main.batch(batch_request([
+                ("increment_rating", {"user_id": 1}),
+                ("set_nickname", {"user_id": 2, "nickname": "first"}),
+                ("increment_rating", {"user_id": 2}),
+            ], transaction=True))
+            assert result["rolled_back"] and result["failed_index"] == 1
+            assert len(result["results"]) == 2
+            async with pool.acquire() as conn:
+                assert await conn.fetchval("SELECT COUNT(*) FROM ratings") == 0
+            assert main.leaderboard.rating(1) == 0
+
+            result = await main.batch(batch_request([
+                ("increment_rating", {"user_id": 1}),
+                ("profile", {"user_id": 1}),
+            ], transaction=True))
+            assert result["status"] == "success"
+            assert result["results"][0]["new_rating"] == 1
+            assert result["results"][1]["rating"] == 1
+            # Изменения в памяти применены после фиксации
+            assert main.leaderboard.rating(1) == 1
+            assert (await main.get_profile(main.UserProfile(user_id=1)))["rating"] == 1
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_commit_failure_rolls_back_batch(pg_schema, monkeypatch):
+    """Все операции прошли, но фиксация не удалась - успешные результаты тоже откачены"""
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await main.leaderboard.load(conn)
+                # Отложенный триггер срабатывает только при COMMIT
+                await conn.execute("""
+                    CREATE FUNCTION fail_on_commit() RETURNS trigger AS $$
+                    BEGIN RAISE EXCEPTION 'commit failed'; END $$ LANGUAGE plpgsql;
+                    CREATE CONSTRAINT TRIGGER fail_on_commit AFTER INSERT ON users
+                        DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION fail_on_commit();
+                """)
+            main.profile_cache.clear()
+
+            result = await main.batch(batch_request([
+                ("set_nickname", {"user_id": 1, "nickname": "first"}),
+                ("profile", {"user_id": 1}),
+            ], transaction=True))
+            assert result["status"] == "error" and result["rolled_back"]
+            assert result["failed_index"] is None and len(result["results"]) == 2
+            assert result["results"][0]["status"] == "success"
+            async with pool.acquire() as conn:
+                assert await conn.fetchval("SELECT COUNT(*) FROM users") == 0
+            assert not main.leaderboard.has_user(1)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def _bot_module():
+    # Бот читает настройки при импорте
+    os.environ.setdefault("BOT_TOKEN", "42:test")
+    os.environ.setdefault("BACKEND_URL", "http://127.0.0.1:1")
+    import bot
+    return bot
+
+
+def test_api_batch_flush(pg_schema, monkeypatch):
+    """Клиент бота: результаты по индексам add(), откат и ответы без результатов"""
+    bot = _bot_module()
+
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        monkeypatch.setattr(bot, "api_request", main.call_endpoint)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await main.leaderboard.load(conn)
+            main.profile_cache.clear()
+
+            batch = bot.ApiBatch()
+            assert await batch.flush() == []
+            first = batch.add("set_nickname", {"user_id": 1, "nickname": "first"})
+            profile = batch.add("profile", {"user_id": 1})
+            missing = batch.add("profile", {"user_id": 404})
+            results = await batch.flush()
+            assert results[first]["status"] == "success" and results[profile]["nickname"] == "first"
+            assert results[missing]["status"] == "not_found" and batch.operations == []
+
+            # Транзакция откатилась: успешный до ошибки вызов тоже считается неудавшимся
+            batch = bot.ApiBatch(transaction=True)
+            rating = batch.add("increment_rating", {"user_id": 1})
+            taken = batch.add("set_nickname", {"user_id": 2, "nickname": "first"})
+            after = batch.add("profile", {"user_id": 1})
+            results = await batch.flush()
+            assert results[rating] == {"status": "error", "message": "rolled back"}
+            assert results[taken]["status"] == "error" and results[taken] != results[rating]
+            # Не выполненный вызов получает общий ответ пакета
+            assert results[after]["rolled_back"] and len(results) == 3
+            assert main.leaderboard.rating(1) == 0
+
+            # Как в /start: включение напоминаний сбрасывает кэш профиля до его чтения в том же пакете
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE users SET reminders_enabled = FALSE WHERE user_id = 1")
+                await conn.execute("INSERT INTO reminder_state (user_id, last_outcome) VALUES (1, 'forbidden')")
+            main.profile_cache.clear()
+            assert (await main.get_profile(main.UserProfile(user_id=1)))["reminders_enabled"] is False
+            batch = bot.ApiBatch()
+            restore = batch.add("restore_reminders", {"user_id": 1})
+            profile = batch.add("profile", {"user_id": 1})
+            results = await batch.flush()
+            assert results[restore]["restored"] and results[profile]["reminders_enabled"] is True
+
+            # Пакет отклонен целиком - у всех вызовов его ответ
+            monkeypatch.setattr(main, "BATCH_MAX_OPERATIONS", 1)
+            batch = bot.ApiBatch()
+            batch.add("profile", {"user_id": 1})
+            batch.add("profile", {"user_id": 1})
+            results = await batch.flush()
+            assert len(results) == 2 and all(r["message"].startswith("Too many operations") for r in results)
+
+            # Ошибка транзакционного пакета без rolled_back (обрыв соединения) - не выполнено ничего
+            async def connection_lost(endpoint, data):
+                return {"status": "error", "message": "connection lost", "results": [{"status": "success"}]}
+
+            monkeypatch.setattr(bot, "api_request", connection_lost)
+            batch = bot.ApiBatch(transaction=True)
+            batch.add("increment_rating", {"user_id": 1})
+            batch.add("profile", {"user_id": 1})
+            results = await batch.flush()
+            assert results == [{"status": "error", "message": "rolled back"},
+                               {"status": "error", "message": "connection lost", "results": [{"status": "success"}]}]
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_after_commit_outside_transaction_runs_immediately(pg_schema):
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        await pool.start()
+        calls = []
+        try:
+            pool.after_commit(lambda: calls.append("now"))
+            assert calls == ["now"]
+
+            async with pool.bind(transaction=True) as bound:
+                async with pool.acquire() as conn:
+                    assert conn is bound
+                pool.after_commit(lambda: calls.append("commit"))
+                assert calls == ["now"]
+            assert calls == ["now", "commit"]
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_call_endpoint_validates_like_http():
+    """Прямой вызов (/batch, BACKEND_TRANSPORT=inprocess) проверяет тело моделью эндпоинта"""
+    async def run():
+        result = await main.call_endpoint("profile", {"user_id": "not a number"})
+        assert result["status"] == "error" and result["message"].startswith("Invalid data")
+        assert (await main.call_endpoint("no_such_endpoint", {}))["status"] == "error"
+        assert main.post_endpoint("respond_to_help")[1] is main.HelpResponse
+        assert main.post_endpoint("rebuild_leaderboard")[1] is None
+
+    asyncio.run(run())
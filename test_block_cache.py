@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тест кэша статуса блокировки бота
+"""
+
+import time
+
+from block_cache import BlockStatusCache
+
+
+def test_negative_and_positive_caching():
+    """Кэшируется и "не заблокирован", и "заблокирован" - каждый со своим TTL"""
+    cache = BlockStatusCache(ttl=0.01, blocked_ttl=60)
+    assert cache.get(1) is None
+    cache.set(1, False)
+    cache.set(2, True)
+    assert cache.get(1) is False and cache.get(2) is True
+
+    time.sleep(0.02)
+    assert cache.get(1) is None
+    assert cache.get(2) is True
+
+    stats = cache.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 2
+
+
+def test_invalidation_drops_stale_lookup():
+    """Статус, запрошенный до уведомления о блокировке, не сохраняется"""
+    cache = BlockStatusCache(ttl=60, blocked_ttl=60)
+    epoch = cache.epoch
+    cache.invalidate(3)
+    cache.set(3, True)
+    cache.set(3, False, epoch)
+    assert cache.get(3) is True
+
+    cache.clear()
+    assert cache.get(3) is None
+
+
+def test_size_limit_and_disabled_cache():
+    cache = BlockStatusCache(ttl=60, blocked_ttl=60, max_size=2)
+    for user_id in (1, 2, 3):
+        cache.set(user_id, False)
+    assert cache.get(1) is None and cache.get(3) is False
+
+    disabled = BlockStatusCache(ttl=0, blocked_ttl=0)
+    disabled.set(1, True)
+    assert disabled.get(1) is None
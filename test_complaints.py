@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тест подачи жалоб одним запросом и автоблокировки
+"""
+
+import asyncio
+
+import asyncpg
+
+from main import SUBMIT_COMPLAINT_QUERY, AUTO_BLOCK_COMPLAINTS
+from migrations import run_migrations
+
+
+def test_concurrent_complaints_block_once(pg_schema):
+    """Одновременные жалобы считаются все, автоблокировка срабатывает один раз"""
+    complaints_total = AUTO_BLOCK_COMPLAINTS + 2
+
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        workers = []
+        try:
+            await run_migrations(conn)
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'author'), (2, 'complainer')")
+            request_ids = [
+                await conn.fetchval(
+                    "INSERT INTO messages (user_id, text, type) VALUES (1, $1, 'request') RETURNING id",
+                    f"request {i}"
+                )
+                for i in range(complaints_total)
+            ]
+
+            workers = [await asyncpg.connect(**pg_schema) for _ in request_ids]
+            results = await asyncio.gather(*[
+                worker.fetchrow(SUBMIT_COMPLAINT_QUERY, request_id, 2, AUTO_BLOCK_COMPLAINTS)
+                for worker, request_id in zip(workers, request_ids)
+            ])
+
+            assert sorted(row["complaints_count"] for row in results) == list(range(1, complaints_total + 1))
+            assert [row["complaints_count"] for row in results if row["auto_blocked"]] == [AUTO_BLOCK_COMPLAINTS]
+
+            user = await conn.fetchrow("SELECT is_blocked, complaints_count FROM users WHERE user_id = 1")
+            assert user["is_blocked"] and user["complaints_count"] == complaints_total
+            assert await conn.fetchval("SELECT COUNT(*) FROM complaints") == complaints_total
+            assert await conn.fetchval("SELECT COUNT(*) FROM messages") == 0
+
+            # Повторная жалоба на уже перенесенное сообщение ничего не меняет
+            assert await conn.fetchrow(SUBMIT_COMPLAINT_QUERY, request_ids[0], 2, AUTO_BLOCK_COMPLAINTS) is None
+            assert await conn.fetchval("SELECT complaints_count FROM users WHERE user_id = 1") == complaints_total
+        finally:
+            for worker in workers:
+                await worker.close()
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_complaint_rolls_back_on_error(pg_schema):
+    """Если жалобу нельзя записать, сообщение и счетчик остаются как были"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await run_migrations(conn)
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'author')")
+            request_id = await conn.fetchval(
+                "INSERT INTO messages (user_id, text, type) VALUES (1, 'x', 'request') RETURNING id"
+            )
+
+            # Пожаловавшегося нет в users - нарушение внешнего ключа
+            try:
+                await conn.fetchrow(SUBMIT_COMPLAINT_QUERY, request_id, 404, AUTO_BLOCK_COMPLAINTS)
+            except asyncpg.ForeignKeyViolationError:
+                pass
+            else:
+                raise AssertionError("expected foreign key violation")
+
+            assert await conn.fetchval("SELECT COUNT(*) FROM messages") == 1
+            assert await conn.fetchval("SELECT complaints_count FROM users WHERE user_id = 1") == 0
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Тест ленты запросов помощи и напоминаний: переход в начало и план запроса
+"""
+
+import asyncio
+import json
+
+import asyncpg
+
+from main import FEED_QUERY, ReminderMessageQuery, fetch_feed_message, fetch_feed_messages
+from migrations import run_migrations
+
+
+async def _prepare(conn, rows: int, request_every: int):
+    await run_migrations(conn)
+    await conn.execute("""
+        INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b');
+    """)
+    await conn.execute("""
+        INSERT INTO messages (user_id, text, type)
+        SELECT 1 + g % 2, 'm' || g, CASE WHEN g % $2 < 2 THEN 'request' ELSE 'support' END
+        FROM generate_series(1, $1) g
+    """, rows, request_every)
+    await conn.execute("ANALYZE")
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def test_feed_wraps_around(pg_schema):
+    """После последнего сообщения лента начинается сначала, свои сообщения пропускаются"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await _prepare(conn, 12, 3)
+            ids = [row["id"] for row in await conn.fetch(
+                "SELECT id FROM messages WHERE type = 'request' AND user_id != 1 ORDER BY id"
+            )]
+
+            first = await fetch_feed_message(conn, "request", 1, 0)
+            assert first["id"] == ids[0] and not first["wrapped"]
+
+            second = await fetch_feed_message(conn, "request", 1, ids[0])
+            assert second["id"] == ids[1]
+
+            wrapped = await fetch_feed_message(conn, "request", 1, ids[-1])
+            assert wrapped["id"] == ids[0] and wrapped["wrapped"]
+
+            assert await fetch_feed_message(conn, "request", 1, None) is not None
+            assert await fetch_feed_message(conn, "support", 3, 10_000) is not None
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_feed_uses_index_range_scan(pg_schema):
+    """
+    Обе ленты читаются диапазоном по индексу без сортировки
+
+    Редкие запросы помощи идут по (type, id); для ленты поддержки, которая
+    составляет большую часть таблицы, и для заведомо пустого диапазона
+    планировщик вправе взять первичный ключ.
+    """
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await _prepare(conn, 30_000, 500)
+            for message_type in ("request", "support"):
+                for last_seen_id in (0, 15_000, 30_000):
+                    result = await conn.fetchval(
+                        "EXPLAIN (FORMAT JSON) " + FEED_QUERY, 1, last_seen_id, message_type
+                    )
+                    plan = json.loads(result)[0]["Plan"]
+                    nodes = list(_plan_nodes(plan))
+
+                    assert not [n for n in nodes if n["Node Type"] == "Sort"], plan
+                    index_scans = [
+                        n for n in nodes
+                        if n["Node Type"] in ("Index Scan", "Index Only Scan")
+                        and n.get("Relation Name") == "messages"
+                    ]
+                    assert len(index_scans) == 2, plan
+                    assert all("id" in n.get("Index Cond", "") for n in index_scans), plan
+                    if message_type == "request" and last_seen_id == 15_000:
+                        assert all(n["Index Name"] == "idx_messages_type_id" for n in index_scans), plan
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_bulk_feed_matches_single_queries(pg_schema):
+    """Пакетный запрос возвращает то же, что fetch_feed_message для каждого пользователя"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await _prepare(conn, 40, 4)
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (3, 'c')")
+            ids = [row["id"] for row in await conn.fetch("SELECT id FROM messages WHERE type = 'support' ORDER BY id")]
+            pairs = [(1, 0), (2, ids[3]), (3, ids[-1]), (1, None), (404, ids[5])]
+
+            rows = await fetch_feed_messages(
+                conn, "support", [ReminderMessageQuery(user_id=u, last_seen_id=s) for u, s in pairs]
+            )
+            assert len(rows) == len(pairs)
+            for (user_id, last_seen_id), row in zip(pairs, rows):
+                single = await fetch_feed_message(conn, "support", user_id, last_seen_id)
+                assert row["for_user_id"] == user_id
+                assert (row["id"], row["wrapped"]) == (single["id"], single["wrapped"])
+
+            # Для пользователя без подходящих сообщений строки нет
+            await conn.execute("DELETE FROM messages WHERE user_id = 2")
+            rows = await fetch_feed_messages(conn, "support", [ReminderMessageQuery(user_id=1), ReminderMessageQuery(user_id=2)])
+            assert [row["for_user_id"] for row in rows] == [2]
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
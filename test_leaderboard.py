@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Тест таблицы лидеров в памяти
+"""
+
+import asyncio
+import random
+
+import asyncpg
+
+from leaderboard import FenwickTree, Leaderboard
+from migrations import run_migrations
+
+
+def expected_top(ratings, blocked, limit):
+    ranked = sorted(
+        ((rating, user_id) for user_id, rating in ratings.items() if user_id not in blocked),
+        key=lambda item: (-item[0], item[1])
+    )
+    return [(user_id, rating) for rating, user_id in ranked[:limit]]
+
+
+def expected_rank(ratings, blocked, user_id):
+    rating = ratings.get(user_id, 0)
+    return 1 + sum(1 for uid, r in ratings.items() if uid not in blocked and r > rating)
+
+
+def test_fenwick_prefix_and_find():
+    counts = [0, 3, 0, 2, 5, 0, 1]
+    tree = FenwickTree.from_counts(counts)
+    for index in range(len(counts)):
+        assert tree.prefix(index) == sum(counts[:index + 1])
+    for k in range(1, sum(counts) + 1):
+        index = tree.find(k)
+        assert tree.prefix(index) >= k and (index == 0 or tree.prefix(index - 1) < k)
+
+
+def test_matches_brute_force():
+    """Топ и позиции совпадают с сортировкой при случайных изменениях"""
+    rng = random.Random(7)
+    board = Leaderboard(capacity=4)
+    ratings, blocked = {}, set()
+
+    for _ in range(3000):
+        user_id = rng.randrange(60)
+        if rng.random() < 0.1:
+            is_blocked = user_id not in blocked
+            board.set_blocked(user_id, is_blocked)
+            (blocked.add if is_blocked else blocked.discard)(user_id)
+        else:
+            board.add_rating(user_id, 1)
+            ratings[user_id] = ratings.get(user_id, 0) + 1
+
+    top = [(row["user_id"], row["rating"]) for row in board.top(10)]
+    assert top == expected_top(ratings, blocked, 10)
+    for user_id in range(70):
+        assert board.rank(user_id) == expected_rank(ratings, blocked, user_id)
+        assert board.rating(user_id) == ratings.get(user_id, 0)
+
+
+def test_block_removes_from_top():
+    board = Leaderboard()
+    board.add_rating(1, 5)
+    board.add_rating(2, 3)
+    board.set_nickname(1, "alice")
+    assert board.top(1)[0]["nickname"] == "alice"
+
+    board.set_blocked(1, True)
+    assert [row["user_id"] for row in board.top(10)] == [2]
+    assert board.rank(2) == 1
+
+    board.set_blocked(1, False)
+    assert [row["user_id"] for row in board.top(10)] == [1, 2]
+
+
+def test_load_from_database(pg_schema):
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await run_migrations(conn)
+            await conn.execute("""
+                INSERT INTO users (user_id, nickname, is_blocked) VALUES
+                    (1, 'a', FALSE), (2, 'b', FALSE), (3, 'c', TRUE), (4, 'd', FALSE);
+                INSERT INTO ratings (user_id, rating) VALUES (1, 2), (2, 7), (3, 100);
+            """)
+            board = Leaderboard()
+            await board.load(conn)
+
+            assert [(row["nickname"], row["rating"]) for row in board.top(10)] == [("b", 7), ("a", 2)]
+            assert board.rank(1) == 2
+            # Без записи в ratings - рейтинг 0, после всех с рейтингом
+            assert board.rank(4) == 3 and board.rating(4) == 0
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тест версионных миграций схемы
+"""
+
+import asyncio
+
+import asyncpg
+
+from migrations import MIGRATIONS, run_migrations, get_applied_versions
+
+
+def test_migrations_apply_once(pg_schema):
+    """Миграции применяются по порядку и повторный запуск ничего не делает"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            applied = await run_migrations(conn)
+            assert applied == [m.version for m in MIGRATIONS]
+
+            # Повторный запуск - схема уже актуальна
+            assert await run_migrations(conn) == []
+            assert await get_applied_versions(conn) == applied
+
+            # Эндпоинты полагаются на NOT NULL флаги пользователя
+            nullable = await conn.fetch("""
+                SELECT column_name, is_nullable FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'users'
+                  AND column_name IN ('is_blocked', 'reminders_enabled')
+            """)
+            assert {row["column_name"]: row["is_nullable"] for row in nullable} == {
+                "is_blocked": "NO",
+                "reminders_enabled": "NO",
+            }
+
+            achievements = await conn.fetchval("SELECT COUNT(*) FROM achievements")
+            assert achievements > 0
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_migrations_upgrade_legacy_schema(pg_schema):
+    """Старая схема без reminders_enabled и с NULL флагами обновляется"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await conn.execute("""
+                CREATE TABLE users (
+                    user_id BIGINT PRIMARY KEY,
+                    nickname VARCHAR(50) UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+                INSERT INTO users (user_id, nickname) VALUES (1, 'legacy');
+            """)
+
+            await run_migrations(conn)
+
+            user = await conn.fetchrow("SELECT is_blocked, reminders_enabled FROM users WHERE user_id = 1")
+            assert user["is_blocked"] is False
+            assert user["reminders_enabled"] is True
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Тест кэша профилей
+"""
+
+import time
+
+from profile_cache import ProfileCache, MISS
+
+
+def test_lru_eviction_and_stats():
+    cache = ProfileCache(max_size=2, ttl=60)
+    cache.put(1, {"user_id": 1}, cache.epoch)
+    cache.put(2, {"user_id": 2}, cache.epoch)
+    assert cache.get(1) == {"user_id": 1}
+
+    # 2 использовался давнее всех - вытесняется
+    cache.put(3, {"user_id": 3}, cache.epoch)
+    assert cache.get(2) is MISS
+    assert cache.get(1) is not MISS and cache.get(3) is not MISS
+
+    stats = cache.stats()
+    assert stats["size"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_not_found_is_cached():
+    """Незарегистрированный пользователь тоже кэшируется до set_nickname"""
+    cache = ProfileCache(max_size=10, ttl=60)
+    cache.put(5, None, cache.epoch)
+    assert cache.get(5) is None
+
+    cache.invalidate(5)
+    assert cache.get(5) is MISS
+
+
+def test_stale_read_is_not_stored():
+    """Профиль, прочитанный до сброса, не попадает в кэш"""
+    cache = ProfileCache(max_size=10, ttl=60)
+    epoch = cache.epoch
+    cache.invalidate(7)
+    cache.put(7, {"user_id": 7, "is_blocked": False}, epoch)
+    assert cache.get(7) is MISS
+
+
+def test_ttl_and_disabled_cache():
+    cache = ProfileCache(max_size=10, ttl=0.01)
+    cache.put(1, {"user_id": 1}, cache.epoch)
+    time.sleep(0.02)
+    assert cache.get(1) is MISS
+
+    disabled = ProfileCache(max_size=0)
+    disabled.put(1, {"user_id": 1}, disabled.epoch)
+    assert disabled.get(1) is MISS
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Тест отложенной записи рейтинга
+"""
+
+import asyncio
+
+import asyncpg
+
+from db_pool import DatabasePool
+from migrations import run_migrations
+from rating_aggregator import RatingAggregator
+
+
+def test_batched_flush_and_shutdown(pg_schema):
+    """Приращения пишутся пакетом, неизвестные пользователи отбрасываются, close дописывает остаток"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        await pool.start()
+        aggregator = RatingAggregator(pool, flush_interval_ms=60_000, max_events=1000)
+        try:
+            await run_migrations(conn)
+            await conn.execute("""
+                INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b');
+                INSERT INTO ratings (user_id, rating) VALUES (1, 10);
+            """)
+
+            aggregator.start()
+            for user_id in (1, 1, 2, 99):
+                aggregator.add(user_id)
+            assert aggregator.unflushed(1) == 2
+
+            assert await aggregator.flush() == 2
+            ratings = dict(await conn.fetch("SELECT user_id, rating FROM ratings"))
+            assert ratings == {1: 12, 2: 1}
+            assert aggregator.unflushed(1) == 0
+
+            stats = aggregator.stats()
+            assert stats["flushes"] == 1 and stats["flushed_events"] == 4
+            assert stats["last_flush_rows"] == 2 and stats["dropped_users"] == 1
+
+            # Остаток записывается при остановке, хотя интервал еще не прошел
+            aggregator.add(2)
+            await aggregator.close()
+            assert await conn.fetchval("SELECT rating FROM ratings WHERE user_id = 2") == 2
+        finally:
+            await aggregator.close()
+            await pool.close()
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_flush_on_event_threshold(pg_schema):
+    """Накопив max_events приращений, запись происходит, не дожидаясь интервала"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        await pool.start()
+        aggregator = RatingAggregator(pool, flush_interval_ms=60_000, max_events=3)
+        try:
+            await run_migrations(conn)
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a')")
+
+            aggregator.start()
+            for _ in range(3):
+                aggregator.add(1)
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                if aggregator.flushes:
+                    break
+            assert await conn.fetchval("SELECT rating FROM ratings WHERE user_id = 1") == 3
+        finally:
+            await aggregator.close()
+            await pool.close()
+            await conn.close()
+
+    asyncio.run(run())
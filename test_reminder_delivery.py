@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Тест параллельной рассылки напоминаний с поддельными API и Telegram
+"""
+
+import asyncio
+from collections import Counter
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from backend_client import BackendClient
+import reminder_scheduler
+from reminder_scheduler import ReminderScheduler
+
+
+def test_deliver_fans_out_with_bounded_concurrency(monkeypatch):
+    monkeypatch.setattr(reminder_scheduler, "REMINDER_BULK_SIZE", 8)
+
+    async def run():
+        sent = []
+        in_flight = [0, 0]
+
+        async def telegram(request):
+            params = dict(await request.post())
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            await asyncio.sleep(0.02)
+            in_flight[0] -= 1
+            sent.append((request.match_info["method"], int(params["chat_id"])))
+            return web.json_response({"ok": True, "result": {
+                "message_id": len(sent), "date": 0, "chat": {"id": int(params["chat_id"]), "type": "private"}}})
+
+        bulk_sizes = []
+
+        async def backend(request):
+            users = (await request.json())["users"]
+            bulk_sizes.append(len(users))
+            return web.json_response({"status": "ok", "messages": [
+                {"for_user_id": user["user_id"], "message": {
+                    "id": 100 + user["user_id"], "text": "держись", "file_id": "f",
+                    "message_type": "video_note" if user["user_id"] == 7 else "text", "nickname": "n", "user_id": 1}}
+                # Для пользователя 13 сообщения нет
+                for user in users if user["user_id"] != 13
+            ]})
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", telegram)
+        app.router.add_post("/api/get_reminder_messages", backend)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        bot = Bot(token="42:test", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+        backend_client = BackendClient(f"{url}/api")
+        await backend_client.start()
+        try:
+            scheduler = ReminderScheduler(bot, backend_client, concurrency=5)
+            result = await scheduler.deliver(list(range(1, 21)))
+            assert bulk_sizes == [8, 8, 4]
+            assert result["sent"] == 19 and result["failed"] == 1
+            assert 1 < in_flight[1] <= 5
+            assert ("sendVideoNote", 7) in sent and len(sent) == 20
+            assert [u for u in range(1, 21) if scheduler.state.was_sent(u, 0)] == [u for u in range(1, 21) if u != 13]
+            assert scheduler.state.last_seen(5) == 105
+            assert result["outcomes"] == {"ok": 19, "no_message": 1} and result["disabled"] == 0
+        finally:
+            await backend_client.close()
+            await bot.session.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_delivery_outcomes_disable_unreachable():
+    """403 и "chat not found" выключают напоминания одним запросом, 429 и 5xx - нет"""
+    errors = {
+        3: (403, "Forbidden: bot was blocked by the user"),
+        4: (403, "Forbidden: user is deactivated"),
+        5: (400, "Bad Request: chat not found"),
+        6: (429, "Too Many Requests: retry after 5"),
+        7: (500, "Internal Server Error"),
+    }
+
+    async def run():
+        disabled_requests = []
+
+        async def telegram(request):
+            chat_id = int((await request.post())["chat_id"])
+            if chat_id in errors:
+                code, description = errors[chat_id]
+                parameters = {"retry_after": 5} if code == 429 else None
+                return web.json_response({"ok": False, "error_code": code, "description": description,
+                                          "parameters": parameters}, status=code)
+            return web.json_response({"ok": True, "result": {
+                "message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}}})
+
+        async def messages(request):
+            users = (await request.json())["users"]
+            return web.json_response({"status": "ok", "messages": [
+                {"for_user_id": user["user_id"], "message": {
+                    "id": 1, "text": "держись", "file_id": None,
+                    "message_type": "text", "nickname": "n", "user_id": 1}}
+                for user in users if user["user_id"] != 8
+            ]})
+
+        async def disable(request):
+            data = await request.json()
+            disabled_requests.append(sorted(zip(data["user_ids"], data["outcomes"])))
+            return web.json_response({"status": "success", "disabled": len(data["user_ids"])})
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", telegram)
+        app.router.add_post("/api/get_reminder_messages", messages)
+        app.router.add_post("/api/disable_reminders", disable)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        bot = Bot(token="42:test", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+        backend_client = BackendClient(f"{url}/api")
+        await backend_client.start()
+        try:
+            scheduler = ReminderScheduler(bot, backend_client)
+            result = await scheduler.deliver(list(range(1, 11)))
+            assert result["outcomes"] == {"ok": 4, "forbidden": 2, "chat_not_found": 1,
+                                          "rate_limited": 1, "transient": 1, "no_message": 1}
+            assert result["sent"] == 4 and result["failed"] == 6 and result["disabled"] == 3
+            assert disabled_requests == [[(3, "forbidden"), (4, "forbidden"), (5, "chat_not_found")]]
+
+            rows = scheduler.state.dirty_rows()
+            outcomes = dict(zip(rows["user_ids"], rows["last_outcomes"]))
+            assert outcomes[3] == "forbidden" and outcomes[5] == "chat_not_found" and outcomes[1] == "ok"
+
+            scheduler.record_cycle({"total": result["total"], "outcomes": Counter(result["outcomes"]),
+                                    "disabled": result["disabled"]})
+            stats = scheduler.stats()
+            assert stats["cycles"] == 1 and stats["disabled"] == 3 and stats["outcomes"]["forbidden"] == 2
+        finally:
+            await backend_client.close()
+            await bot.session.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Тест аренды корзин напоминаний: выравнивание между процессами и рассылка без повторов
+"""
+
+import asyncio
+import datetime
+import multiprocessing
+from collections import Counter
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import main
+from backend_client import BackendClient
+from db_pool import DatabasePool
+from migrations import run_migrations
+from reminder_leases import LeaseManager, bucket_of
+from reminder_scheduler import ReminderScheduler
+
+BUCKETS = 12
+LEASE_TTL = 1.0
+
+
+async def _claim(worker_id: str, ttl: float = 30) -> dict:
+    return await main.claim_reminder_leases(main.ClaimReminderLeases(
+        worker_id=worker_id, bucket_count=8, ttl_seconds=ttl
+    ))
+
+
+def test_leases_rebalance_and_expire(pg_schema, monkeypatch):
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+
+            assert await _claim("a") == {"status": "ok", "buckets": list(range(8)), "workers": 1}
+
+            # Второй процесс: первый отдает половину, но занять ее можно только после ttl
+            assert (await _claim("b"))["buckets"] == []
+            assert (await _claim("a"))["buckets"] == [0, 1, 2, 3]
+            assert (await _claim("b"))["buckets"] == []
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE reminder_leases SET expires_at = NOW() WHERE owner IS NULL")
+            assert await _claim("b") == {"status": "ok", "buckets": [4, 5, 6, 7], "workers": 2}
+
+            # Процесс b умер: его аренда истекла, корзины забирает a
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE reminder_workers SET expires_at = NOW() WHERE worker_id = 'b'")
+                await conn.execute("UPDATE reminder_leases SET expires_at = NOW() WHERE owner = 'b'")
+            assert await _claim("a") == {"status": "ok", "buckets": list(range(8)), "workers": 1}
+
+            # Остановка отдает корзины сразу
+            assert (await main.release_reminder_leases(main.ReleaseReminderLeases(worker_id="a")))["released"] == 8
+            assert (await _claim("c"))["buckets"] == list(range(8))
+            assert (await main.claim_reminder_leases(main.ClaimReminderLeases(
+                worker_id="d", bucket_count=0, ttl_seconds=1
+            )))["status"] == "error"
+
+            # Из /batch не вызываются: у них своя транзакция
+            result = await main.batch(main.BatchRequest(operations=[
+                {"endpoint": "profile", "data": {"user_id": 1}},
+                {"endpoint": "claim_reminder_leases", "data": {"worker_id": "e", "bucket_count": 8}},
+            ], transaction=True))
+            assert result["rolled_back"] and result["results"][1]["message"].startswith("Unknown endpoint")
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def _worker(url: str, worker_id: str, commands, results):
+    asyncio.run(_run_worker(url, worker_id, commands, results))
+
+
+async def _run_worker(url: str, worker_id: str, commands, results):
+    """Процесс планировщика: по команде отрабатывает раунд в заданный момент"""
+    bot = Bot(token=f"{worker_id[1:]}:test", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    backend = BackendClient(f"{url}/api")
+    await backend.start()
+    partition = LeaseManager(backend, worker_id=worker_id, bucket_count=BUCKETS, ttl=LEASE_TTL)
+    scheduler = ReminderScheduler(bot, backend, partition=partition)
+    await partition.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            now = await loop.run_in_executor(None, commands.get)
+            if now is None:
+                break
+            await scheduler.tick(now=now)
+            results.put((worker_id, sorted(partition.buckets)))
+    finally:
+        await partition.close()
+        await backend.close()
+        await bot.session.close()
+
+
+def test_workers_send_each_reminder_once(pg_schema, monkeypatch):
+    """Три процесса делят пользователей; после гибели одного его корзины переходят другим"""
+    users = list(range(1, 301))
+    day = datetime.date(2026, 10, 18)
+
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=4)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        async with pool.acquire() as conn:
+            await run_migrations(conn)
+            await conn.execute("INSERT INTO users (user_id, nickname, reminders_enabled) VALUES (1000, 'author', FALSE)")
+            await conn.execute("INSERT INTO users (user_id, nickname) SELECT g, 'u' || g FROM unnest($1::bigint[]) g", users)
+            await conn.execute("INSERT INTO messages (user_id, text, type) VALUES (1000, 'держись', 'support')")
+
+        sent = []
+
+        async def telegram(request):
+            params = dict(await request.post())
+            sent.append((int(request.match_info["token"].split(":")[0]), int(params["chat_id"])))
+            return web.json_response({"ok": True, "result": {
+                "message_id": len(sent), "date": 0, "chat": {"id": int(params["chat_id"]), "type": "private"}}})
+
+        async def backend(request):
+            # Настоящие эндпоинты API на временной схеме
+            result = await main.call_endpoint(request.match_info["endpoint"], await request.json())
+            if isinstance(result, dict):
+                return web.json_response(result)
+            response = web.StreamResponse(headers={"Content-Type": result.media_type})
+            await response.prepare(request)
+            async for chunk in result.body_iterator:
+                await response.write(chunk.encode())
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", telegram)
+        app.router.add_post("/api/{endpoint}", backend)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        # Тяжелые импорты (aiogram) - один раз в сервере, процессы от него форкаются
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["test_reminder_leases"])
+        # У каждого процесса свои очереди: убитый процесс может оставить общую очередь запертой
+        workers = {}
+        for n in (1, 2, 3):
+            commands, results = context.Queue(), context.Queue()
+            process = context.Process(target=_worker, args=(url, f"w{n}", commands, results))
+            process.start()
+            workers[n] = (process, commands, results)
+        loop = asyncio.get_running_loop()
+
+        async def wait_owners(count: int):
+            for _ in range(200):
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch("""
+                        SELECT owner, COUNT(*) AS buckets FROM reminder_leases
+                        WHERE owner IS NOT NULL AND expires_at > NOW() GROUP BY owner
+                    """)
+                if len(rows) == count and sum(row["buckets"] for row in rows) == BUCKETS:
+                    return
+                await asyncio.sleep(0.1)
+            raise AssertionError(f"leases did not settle: {rows}")
+
+        async def round_at(now: float) -> dict:
+            del sent[:]
+            for process, commands, results in workers.values():
+                commands.put(now)
+            owned = {}
+            for process, commands, results in workers.values():
+                worker_id, buckets = await loop.run_in_executor(None, results.get, True, 30)
+                owned[int(worker_id[1:])] = buckets
+            return owned
+
+        try:
+            await wait_owners(3)
+            scheduler = ReminderScheduler(bot=None, backend=None)
+            end_ts = scheduler.window(day, 180)[1]
+
+            owned = await round_at(end_ts - 1)
+            assert sorted(b for buckets in owned.values() for b in buckets) == list(range(BUCKETS))
+            assert Counter(chat_id for _, chat_id in sent) == Counter(users)
+            assert all(bucket_of(chat_id, BUCKETS) in owned[n] for n, chat_id in sent)
+            assert len({n for n, _ in sent}) == 3
+
+            process, _, _ = workers.pop(3)
+            process.terminate()
+            await loop.run_in_executor(None, process.join)
+            await wait_owners(2)
+
+            owned = await round_at(end_ts - 1 + 86400)
+            assert sorted(b for buckets in owned.values() for b in buckets) == list(range(BUCKETS))
+            assert Counter(chat_id for _, chat_id in sent) == Counter(users)
+        finally:
+            for process, commands, _ in workers.values():
+                commands.put(None)
+            for process, _, _ in workers.values():
+                # Процессы при остановке обращаются к API этого цикла - не блокируем его
+                await loop.run_in_executor(None, process.join, 10)
+                if process.is_alive():
+                    process.terminate()
+            await runner.cleanup()
+            await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Тест состояния планировщика напоминаний: упаковка в памяти и сохранение в базе
+"""
+
+import asyncio
+
+import main
+from db_pool import DatabasePool
+from migrations import run_migrations
+from reminder_state import ReminderState
+
+
+def test_packed_state_and_dirty_rows():
+    state = ReminderState()
+    state.load([10, 20, 30], [1, 2, 3], [None, 6000, 60])
+    assert state.last_seen(20) == 2 and state.was_sent(20, 6000) and not state.was_sent(10, 0)
+    # Отправка до начала окна не считается
+    assert not state.was_sent(30, 6000)
+
+    # Новые пользователи вставляются по порядку, данные соседей не сдвигаются
+    state.add_users([25, 5, 20])
+    state.set_last_seen(15, 7)
+    assert len(state) == 6
+    assert [state.last_seen(u) for u in (5, 10, 15, 20, 25, 30)] == [0, 1, 7, 2, 0, 3]
+    assert state.was_sent(20, 6000) and not state.was_sent(25, 0)
+
+    state.mark_sent(25, 7230)
+    state.set_outcome(25, "ok")
+    state.set_last_seen(30, 3)  # не изменилось - не грязное
+    assert state.dirty_rows() == {"user_ids": [15, 25], "last_seen_ids": [7, 0], "last_sent_at": [None, 7200],
+                                  "last_outcomes": [None, "ok"]}
+    state.mark_clean([15, 25])
+    assert state.dirty_rows()["user_ids"] == [] and not state._outcomes
+
+    assert state.sent_count(6000) == 2 and state.sent_count(7200) == 1
+    assert state.memory_bytes() == 6 * 16
+
+
+def test_state_survives_restart(pg_schema, monkeypatch):
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b'), (3, 'c')")
+
+            sent_at = 1_790_000_000
+            saved = await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1, 2, 404], last_seen_ids=[11, 12, 13], last_sent_at=[sent_at, None, sent_at]
+            ))
+            assert saved["status"] == "ok"
+            # Курсор обновляется, время отправки не стирается и не откатывается назад
+            await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1, 2], last_seen_ids=[21, 12], last_sent_at=[None, None]
+            ))
+            await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1], last_seen_ids=[21], last_sent_at=[sent_at - 86400]
+            ))
+
+            state = await main.get_reminder_state()
+            assert state == {"status": "ok", "user_ids": [1, 2], "last_seen_ids": [21, 12],
+                             "last_sent_at": [sent_at, None]}
+
+            restored = ReminderState()
+            restored.load(state["user_ids"], state["last_seen_ids"], state["last_sent_at"])
+            assert restored.last_seen(1) == 21 and restored.was_sent(1, sent_at - 60)
+            assert not restored.was_sent(1, sent_at + 86400) and not restored.was_sent(2, 0)
+
+            # Исход последней доставки: None его не стирает, неизвестный отклоняется
+            await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1, 2], last_seen_ids=[21, 12], last_sent_at=[None, None], last_outcomes=["forbidden", "ok"]
+            ))
+            await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1, 2], last_seen_ids=[21, 12], last_sent_at=[None, None], last_outcomes=[None, "transient"]
+            ))
+            assert (await main.save_reminder_state(main.ReminderStateUpdate(
+                user_ids=[1], last_seen_ids=[21], last_sent_at=[None], last_outcomes=["lost"]
+            )))["status"] == "error"
+            async with pool.acquire() as conn:
+                rows = await conn.fetch("SELECT user_id, last_outcome FROM reminder_state ORDER BY user_id")
+            assert [tuple(row) for row in rows] == [(1, "forbidden"), (2, "transient")]
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_user_timezone(pg_schema, monkeypatch):
+    """Пояс сохраняется с проверкой диапазона и отдается вместе с пользователями"""
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b')")
+
+            result = await main.set_timezone(main.SetTimezone(user_id=2, utc_offset_minutes=330))
+            assert result == {"status": "success", "utc_offset_minutes": 330}
+            assert (await main.set_timezone(main.SetTimezone(user_id=2, utc_offset_minutes=900)))["status"] == "error"
+            assert (await main.set_timezone(main.SetTimezone(user_id=2, utc_offset_minutes=100)))["status"] == "error"
+            assert (await main.set_timezone(main.SetTimezone(user_id=404, utc_offset_minutes=60)))["status"] == "error"
+
+            users = await main.get_users_with_reminders()
+            assert sorted(zip(users["user_ids"], users["utc_offsets"])) == [(1, 180), (2, 330)]
+            users = await main.get_users_with_reminders(main.ReminderUsersQuery(utc_offset_minutes=330))
+            assert users["user_ids"] == [2]
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_unreachable_users_disabled_and_restored(pg_schema, monkeypatch):
+    """Недоставимым напоминания выключаются пачкой и включаются, когда пользователь вернулся"""
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b'), (3, 'c')")
+            # Исход пишется тем же запросом: состояние планировщика могло не успеть сохраниться
+            result = await main.disable_reminders(main.DisableReminders(
+                user_ids=[1, 2, 404], outcomes=["forbidden", "chat_not_found", "forbidden"]
+            ))
+            assert result == {"status": "success", "disabled": 2}
+            async with pool.acquire() as conn:
+                rows = await conn.fetch("SELECT user_id, last_outcome FROM reminder_state ORDER BY user_id")
+            assert [tuple(row) for row in rows] == [(1, "forbidden"), (2, "chat_not_found")]
+            # Повтор ничего не меняет
+            assert (await main.disable_reminders(main.DisableReminders(
+                user_ids=[1, 2], outcomes=["forbidden", "forbidden"]
+            )))["disabled"] == 0
+            for outcomes in (["transient"], ["forbidden", "forbidden"]):
+                assert (await main.disable_reminders(main.DisableReminders(
+                    user_ids=[3], outcomes=outcomes
+                )))["status"] == "error"
+            users = await main.get_users_with_reminders()
+            assert users["user_ids"] == [3]
+
+            # Вернулся через /start - напоминания снова включены, один раз
+            assert await main.restore_reminders(main.ToggleReminders(user_id=1)) == {
+                "status": "success", "restored": True}
+            assert (await main.restore_reminders(main.ToggleReminders(user_id=1)))["restored"] is False
+            assert (await main.restore_reminders(main.ToggleReminders(user_id=3)))["restored"] is False
+
+            # Выключил сам после автоматического выключения - /start его выбор не отменяет
+            await main.toggle_reminders(main.ToggleReminders(user_id=2))
+            await main.toggle_reminders(main.ToggleReminders(user_id=2))
+            assert (await main.restore_reminders(main.ToggleReminders(user_id=2)))["restored"] is False
+            users = await main.get_users_with_reminders()
+            assert users["user_ids"] == [1, 3]
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Тест чтения получателей напоминаний: страницы по ключу, поток NDJSON, частичный индекс
+"""
+
+import asyncio
+import json
+
+import asyncpg
+
+import main
+from db_pool import DatabasePool
+from migrations import run_migrations
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def test_pages_and_stream_return_all_users(pg_schema, monkeypatch):
+    async def run():
+        pool = DatabasePool(**pg_schema, min_size=1, max_size=2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        monkeypatch.setattr(main, "REMINDER_USERS_PAGE_MAX", 10)
+        await pool.start()
+        try:
+            async with pool.acquire() as conn:
+                await run_migrations(conn)
+                await conn.execute("""
+                    INSERT INTO users (user_id, nickname, reminders_enabled, is_blocked, utc_offset_minutes)
+                    SELECT g, 'u' || g, g % 5 != 0, g % 7 = 0, CASE WHEN g % 2 = 0 THEN 180 ELSE 300 END
+                    FROM generate_series(1, 60) g
+                """)
+            expected = [u for u in range(1, 61) if u % 5 and u % 7]
+            everyone = await main.get_users_with_reminders()
+            assert everyone["user_ids"] == expected and "next_after_user_id" not in everyone
+
+            # Страницы по 7 (limit больше REMINDER_USERS_PAGE_MAX урезается)
+            pages, after = [], None
+            while True:
+                page = await main.get_users_with_reminders(main.ReminderUsersQuery(after_user_id=after, limit=7))
+                pages.append(page["user_ids"])
+                after = page["next_after_user_id"]
+                if after is None:
+                    break
+            assert [u for page in pages for u in page] == expected
+            assert all(len(page) == 7 for page in pages[:-1])
+            page = await main.get_users_with_reminders(main.ReminderUsersQuery(limit=1000))
+            assert len(page["user_ids"]) == 10 and page["next_after_user_id"] == expected[9]
+            assert (await main.get_users_with_reminders(main.ReminderUsersQuery(limit=0)))["status"] == "error"
+
+            # Поток: те же пользователи построчно, последняя строка - итог
+            response = await main.stream_users_with_reminders(main.ReminderUsersQuery(utc_offset_minutes=300))
+            assert response.media_type == "application/x-ndjson"
+            chunks = [chunk async for chunk in response.body_iterator]
+            records = [json.loads(line) for line in "".join(chunks).splitlines()]
+            odd = [u for u in expected if u % 2]
+            assert records[-1] == {"status": "ok", "count": len(odd)}
+            assert records[:-1] == [{"user_id": u, "utc_offset_minutes": 300} for u in odd]
+            # Страницы потока по REMINDER_USERS_PAGE_MAX
+            assert len(chunks) == -(-len(odd) // 10) + 1
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_users_query_uses_partial_index(pg_schema):
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            await run_migrations(conn)
+            await conn.execute("""
+                INSERT INTO users (user_id, nickname, reminders_enabled)
+                SELECT g, 'u' || g, g % 50 = 0 FROM generate_series(1, 50000) g
+            """)
+            await conn.execute("ANALYZE users")
+            for args in ((None, None, None, None, 1000), (None, None, None, 25_000, 1000), (180, [1, 3], 4, None, None)):
+                result = await conn.fetchval("EXPLAIN (FORMAT JSON) " + main.REMINDER_USERS_QUERY, *args)
+                plan = json.loads(result)[0]["Plan"]
+                scans = [n for n in _plan_nodes(plan) if n.get("Relation Name") == "users"]
+                assert [n.get("Index Name") for n in scans] == ["idx_users_reminders"], plan
+                assert not [n for n in _plan_nodes(plan) if n["Node Type"] == "Sort"], plan
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
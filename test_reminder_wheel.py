@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Тест колеса напоминаний: равномерность, изменения по уведомлениям, планирование окна
+"""
+
+import asyncio
+import datetime
+import json
+
+import asyncpg
+import pytz
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from backend_client import BackendClient
+from db_events import DatabaseEvents, CHANNEL_USER_REMINDERS, parse_user_reminders_event
+from migrations import run_migrations
+from reminder_scheduler import ReminderScheduler
+from reminder_wheel import ReminderWheel
+
+
+def test_slots_spread_evenly_and_deterministically():
+    wheel = ReminderWheel(start_ts=0, window_seconds=8 * 3600, day=740_000)
+    users = range(10**9, 10**9 + 96_000)
+    assert wheel.add_many(users) == 96_000
+    assert wheel.memory_bytes() == 96_000 * 8
+
+    # 480 слотов по ~200 пользователей
+    sizes = [len(slot) for slot in wheel._slots]
+    assert len(sizes) == 480 and min(sizes) > 140 and max(sizes) < 260
+
+    other_day = ReminderWheel(start_ts=0, window_seconds=8 * 3600, day=740_001)
+    assert wheel.slot_of(10**9) == wheel.slot_of(10**9)
+    assert sum(wheel.slot_of(u) != other_day.slot_of(u) for u in range(1000)) > 990
+
+
+def test_add_remove_and_pop_due():
+    wheel = ReminderWheel(start_ts=1000, window_seconds=600, day=1)
+    for user_id in range(1, 41):
+        assert wheel.add(user_id)
+    assert not wheel.add(5)
+    assert wheel.remove(5) and not wheel.remove(5)
+    assert len(wheel) == 39
+
+    first = wheel.next_due_ts()
+    assert first == 1000 + min(wheel.slot_of(u) for u in range(1, 41) if u != 5) * 60
+    assert wheel.pop_due(999) == []
+
+    due = wheel.pop_due(1000 + 5 * 60)
+    assert sorted(due) == sorted(u for u in range(1, 41) if u != 5 and wheel.slot_of(u) <= 5)
+    # Слот пользователя уже прошел - в этот день он не добавляется
+    late = next(u for u in range(100, 1000) if wheel.slot_of(u) <= 5)
+    assert not wheel.add(late)
+
+    rest = wheel.pop_due(wheel.end_ts)
+    assert len(due) + len(rest) == 39 and len(wheel) == 0
+    assert wheel.next_due_ts() is None
+
+
+def test_toggle_notifications(pg_schema):
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        events = DatabaseEvents(pg_schema)
+        received = []
+        events.subscribe(CHANNEL_USER_REMINDERS, lambda payload: received.append(parse_user_reminders_event(payload)))
+        try:
+            await run_migrations(conn)
+            await events.start()
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a')")
+            await conn.execute("UPDATE users SET reminders_enabled = FALSE WHERE user_id = 1")
+            await conn.execute("UPDATE users SET reminders_enabled = TRUE WHERE user_id = 1")
+            await conn.execute("UPDATE users SET is_blocked = TRUE WHERE user_id = 1")
+            await conn.execute("UPDATE users SET nickname = 'b' WHERE user_id = 1")
+            await conn.execute("UPDATE users SET utc_offset_minutes = 300 WHERE user_id = 1")
+            for _ in range(50):
+                if len(received) == 5:
+                    break
+                await asyncio.sleep(0.02)
+            assert received == [(1, True, 180), (1, False, 180), (1, True, 180), (1, False, 180), (1, False, 300)]
+        finally:
+            await events.close()
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_window_is_local_time():
+    scheduler = ReminderScheduler(bot=None, backend=None)
+    day = datetime.date(2026, 10, 18)
+    moscow = pytz.timezone("Europe/Moscow").localize(datetime.datetime(2026, 10, 18, 12))
+    start_ts, end_ts = scheduler.window(day, 180)
+    assert start_ts == moscow.timestamp() and end_ts - start_ts == 8 * 3600
+    # В Екатеринбурге (UTC+5) то же местное окно наступает на два часа раньше
+    assert scheduler.window(day, 300) == (start_ts - 7200, end_ts - 7200)
+
+
+def test_scheduler_sends_each_user_once_at_its_slot():
+    """Два пояса: нечетные пользователи - Москва, четные - UTC+5"""
+    day = datetime.date(2026, 10, 18)
+
+    def zone(user_id):
+        return 180 if user_id % 2 else 300
+
+    async def run():
+        sent = []
+        saved = []
+        scheduler = None
+
+        async def telegram(request):
+            params = dict(await request.post())
+            sent.append(int(params["chat_id"]))
+            return web.json_response({"ok": True, "result": {
+                "message_id": len(sent), "date": 0, "chat": {"id": int(params["chat_id"]), "type": "private"}}})
+
+        async def backend(request):
+            endpoint = request.match_info["endpoint"]
+            data = await request.json()
+            if endpoint == "get_reminder_state":
+                # Пользователь 1 уже получил напоминание в этом окне
+                return web.json_response({"status": "ok", "user_ids": [1], "last_seen_ids": [5],
+                                          "last_sent_at": [int(scheduler.window(day, 180)[0]) + 60]})
+            if endpoint == "stream_users_with_reminders":
+                users = [u for u in range(1, 201) if data.get("utc_offset_minutes") in (None, zone(u))]
+                lines = [json.dumps({"user_id": u, "utc_offset_minutes": zone(u)}) for u in users]
+                lines.append(json.dumps({"status": "ok", "count": len(users)}))
+                return web.Response(text="\n".join(lines) + "\n", content_type="application/x-ndjson")
+            if endpoint == "save_reminder_state":
+                saved.append(data)
+                return web.json_response({"status": "ok"})
+            return web.json_response({"status": "ok", "messages": [
+                {"for_user_id": user["user_id"], "message": {
+                    "id": user["last_seen_id"] + 1, "text": "держись", "file_id": None,
+                    "message_type": "text", "nickname": "n", "user_id": 1}}
+                for user in data["users"]
+            ]})
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", telegram)
+        app.router.add_post("/api/{endpoint}", backend)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        bot = Bot(token="42:test", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+        backend_client = BackendClient(f"{url}/api")
+        await backend_client.start()
+        try:
+            scheduler = ReminderScheduler(bot, backend_client)
+            start_ts, end_ts = scheduler.window(day, 180)
+
+            # Запуск через час после начала московского окна (три часа - в UTC+5):
+            # прошедшие слоты отрабатывают сразу
+            now = start_ts + 3600
+            delay = await scheduler.tick(now=now)
+            first = list(sent)
+            assert set(scheduler.wheels) == {180, 300}
+            assert 1 not in first and all(scheduler.wheels[zone(u)].due_ts(u) <= now for u in first)
+            moscow = [u for u in first if zone(u) == 180]
+            assert moscow and len(moscow) < len(first) - len(moscow)
+            assert 0 < delay <= end_ts - start_ts
+            assert saved and sorted(saved[0]["user_ids"]) == sorted(first)
+
+            # Выключил напоминания - не получит; включил новый - получит;
+            # сменивший пояс переезжает в другое колесо и получает одно напоминание
+            pending = [u for u in range(3, 201, 2) if u not in first]
+            newcomer = next(u for u in range(500, 10**6, 2) if scheduler.wheels[300].due_ts(u) > now)
+            mover = next(u for u in pending[1:] if scheduler.wheels[300].due_ts(u) > now)
+            scheduler.on_reminders_changed(f"{pending[0]}:0:180")
+            scheduler.on_reminders_changed(f"{newcomer}:1:300")
+            scheduler.on_reminders_changed(f"{mover}:1:300")
+            assert scheduler.wheels[300].remove(mover) and scheduler.wheels[300].add(mover)
+            assert not scheduler.wheels[180].remove(mover)
+
+            # Окно UTC+5 уже закончилось: его остаток выдается, пояс планируется на завтра
+            await scheduler.tick(now=end_ts - 1)
+            assert sorted(sent) == sorted(set(range(2, 201)) - {pending[0]} | {newcomer})
+            tomorrow = (day + datetime.timedelta(days=1)).toordinal()
+            assert scheduler.wheels[300].day == tomorrow and scheduler.wheels[180].day == day.toordinal()
+
+            await scheduler.tick(now=end_ts)
+            assert scheduler.wheels[180].day == tomorrow
+
+            # Первый пользователь нового пояса создает его колесо
+            scheduler.on_reminders_changed("1000:1:-300")
+            assert -300 in scheduler.wheels
+        finally:
+            await backend_client.close()
+            await bot.session.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
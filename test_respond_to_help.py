@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Тест ответа на запрос помощи одним запросом
+"""
+
+import asyncio
+
+import asyncpg
+
+from main import RESPOND_TO_HELP_QUERY
+from migrations import run_migrations
+
+
+async def _prepare(conn):
+    await run_migrations(conn)
+    await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'author'), (2, 'helper')")
+    return await conn.fetchval(
+        "INSERT INTO messages (user_id, text, type) VALUES (1, 'help me', 'request') RETURNING id"
+    )
+
+
+def test_response_saved_request_removed_rating_counted(pg_schema):
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            request_id = await _prepare(conn)
+
+            row = await conn.fetchrow(RESPOND_TO_HELP_QUERY, 2, "hug", None, "text", request_id, 1, True)
+            assert row["new_rating"] == 1 and row["request_deleted"]
+            support = await conn.fetchrow("SELECT user_id, text, type FROM messages WHERE id = $1", row["support_id"])
+            assert tuple(support) == (2, "hug", "support")
+            assert await conn.fetchval("SELECT COUNT(*) FROM messages WHERE type = 'request'") == 0
+
+            # Запрос уже удален - ответ все равно сохраняется
+            row = await conn.fetchrow(RESPOND_TO_HELP_QUERY, 2, "again", None, "text", request_id, 1, True)
+            assert row["new_rating"] == 2 and not row["request_deleted"]
+
+            # Отложенная запись рейтинга: ratings не трогаем
+            row = await conn.fetchrow(RESPOND_TO_HELP_QUERY, 2, "later", None, "text", request_id, 1, False)
+            assert row["new_rating"] is None
+            assert await conn.fetchval("SELECT rating FROM ratings WHERE user_id = 2") == 2
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_response_rolls_back_on_error(pg_schema):
+    """Если рейтинг нельзя записать, запрос остается в очереди и ответ не сохраняется"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        try:
+            request_id = await _prepare(conn)
+
+            # Отвечающего нет в users - нарушение внешнего ключа
+            try:
+                await conn.fetchrow(RESPOND_TO_HELP_QUERY, 404, "hug", None, "text", request_id, 1, True)
+            except asyncpg.ForeignKeyViolationError:
+                pass
+            else:
+                raise AssertionError("expected foreign key violation")
+
+            assert await conn.fetchval("SELECT COUNT(*) FROM messages") == 1
+            assert await conn.fetchval("SELECT COUNT(*) FROM messages WHERE id = $1", request_id) == 1
+            assert await conn.fetchval("SELECT COUNT(*) FROM ratings") == 0
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Тест случайного выбора сообщений поддержки
+"""
+
+import asyncio
+import random
+
+import asyncpg
+
+from db_events import DatabaseEvents, CHANNEL_SUPPORT_MESSAGE, CHANNEL_USER_BLOCK
+from db_events import parse_support_message_event, parse_user_block_event
+from migrations import run_migrations
+from support_sampler import SupportSampler, COMPACT_MIN_DELETED
+
+
+def make_sampler(messages):
+    sampler = SupportSampler(rng=random.Random(42))
+    for message_id, user_id in messages:
+        sampler.add(message_id, user_id)
+    return sampler
+
+
+def test_sample_excludes_own_and_blocked():
+    """Не выдаются свои сообщения, сообщения заблокированных и удаленные"""
+    sampler = make_sampler([(1, 10), (2, 20), (3, 30), (4, 30)])
+    sampler.set_blocked(20, True)
+    sampler.remove(3)
+
+    seen = {sampler.sample(exclude_user_id=10) for _ in range(200)}
+    assert seen == {4}
+
+    # Разблокировка возвращает автора в выдачу
+    sampler.set_blocked(20, False)
+    seen = {sampler.sample(exclude_user_id=10) for _ in range(200)}
+    assert seen == {2, 4}
+
+
+def test_sample_gives_up_when_only_own_messages():
+    """Если подходящих нет, sample возвращает None, а не крутится бесконечно"""
+    sampler = make_sampler([(1, 10), (2, 10)])
+    assert sampler.sample(exclude_user_id=10) is None
+    assert SupportSampler().sample(exclude_user_id=10) is None
+    assert sampler.stats()["misses"] == 1
+
+
+def test_compaction_drops_deleted():
+    """Удаленные записи вычищаются из массивов"""
+    count = COMPACT_MIN_DELETED * 2
+    sampler = make_sampler([(i, i) for i in range(count)])
+    for message_id in range(COMPACT_MIN_DELETED):
+        sampler.remove(message_id)
+
+    assert len(sampler) == count - COMPACT_MIN_DELETED
+    assert sampler.stats()["deleted_pending_compaction"] == 0
+    assert all(sampler.sample(exclude_user_id=-1) >= COMPACT_MIN_DELETED for _ in range(100))
+
+
+def test_load_and_notifications(pg_schema):
+    """Пул загружается из базы и догоняет изменения по уведомлениям"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        sampler = SupportSampler()
+        events = DatabaseEvents(pg_schema)
+
+        def on_message(payload):
+            added, message_id, user_id = parse_support_message_event(payload)
+            if added:
+                sampler.add(message_id, user_id)
+            else:
+                sampler.remove(message_id)
+
+        def on_block(payload):
+            sampler.set_blocked(*parse_user_block_event(payload))
+
+        events.subscribe(CHANNEL_SUPPORT_MESSAGE, on_message)
+        events.subscribe(CHANNEL_USER_BLOCK, on_block)
+        try:
+            await run_migrations(conn)
+            await conn.execute("""
+                INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b'), (3, 'c');
+                INSERT INTO messages (user_id, text, type) VALUES (1, 'x', 'support'), (2, 'y', 'request');
+            """)
+            await events.start()
+            await sampler.load(conn)
+            assert len(sampler) == 1
+
+            new_id = await conn.fetchval(
+                "INSERT INTO messages (user_id, text, type) VALUES (2, 'z', 'support') RETURNING id"
+            )
+            await conn.execute("UPDATE users SET is_blocked = TRUE WHERE user_id = 1")
+            await asyncio.sleep(0.2)
+
+            assert len(sampler) == 2
+            assert sampler.sample(exclude_user_id=3) == new_id
+
+            await conn.execute("DELETE FROM messages WHERE id = $1", new_id)
+            await asyncio.sleep(0.2)
+            assert sampler.sample(exclude_user_id=3) is None
+        finally:
+            await events.close()
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_load_skips_notifications_already_in_snapshot(pg_schema):
+    """Уведомление о сообщении из снимка, пришедшее во время загрузки, не удваивает его вес"""
+    async def run():
+        conn = await asyncpg.connect(**pg_schema)
+        sampler = SupportSampler(rng=random.Random(42))
+        try:
+            await run_migrations(conn)
+            await conn.execute("INSERT INTO users (user_id, nickname) VALUES (1, 'a'), (2, 'b')")
+            first, second = [row["id"] for row in await conn.fetch("""
+                INSERT INTO messages (user_id, text, type) VALUES (1, 'x', 'support'), (2, 'y', 'support')
+                RETURNING id
+            """)]
+
+            class NotifyingConnection:
+                """Уведомления приходят, пока читается снимок"""
+                def __getattr__(self, name):
+                    return getattr(conn, name)
+
+                async def fetch(self, *args):
+                    rows = await conn.fetch(*args)
+                    sampler.add(second, 2)
+                    sampler.add(second + 100, 2)
+                    return rows
+
+            await sampler.load(NotifyingConnection())
+            assert len(sampler) == 3
+            assert sorted(sampler._ids) == [first, second, second + 100]
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
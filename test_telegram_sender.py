@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Тест исходящей очереди Telegram: приоритеты, лимит чата, retry_after
+"""
+
+import time
+import asyncio
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from telegram_sender import (
+    TelegramSender, install_sender, background_sends, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+)
+
+
+def test_priority_lane_and_chat_limit():
+    async def run():
+        sender = TelegramSender(rate=50, burst=1, chat_rate=2, chat_burst=1)
+        order = []
+
+        async def send(name, chat_id, priority):
+            await sender.acquire(chat_id, priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(send(f"bg{i}", 100 + i, PRIORITY_BACKGROUND)) for i in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(send("reply", 1, PRIORITY_INTERACTIVE)))
+        # Второе сообщение в тот же чат ждет лимита чата, но не задерживает другие чаты
+        tasks.append(asyncio.create_task(send("reply2", 1, PRIORITY_INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+        assert order.index("reply") <= 1
+        assert order[-1] == "reply2"
+        assert sender.stats()["background"]["granted"] == 5
+        assert sender.stats()["queue_depth"] == 0
+        await sender.close()
+
+    asyncio.run(run())
+
+
+def test_retry_after_through_aiogram():
+    async def run():
+        calls = []
+
+        async def handler(request):
+            method = request.match_info["method"]
+            calls.append((method, time.monotonic()))
+            if len(calls) == 1:
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": "Too Many Requests: retry after 1",
+                                          "parameters": {"retry_after": 1}}, status=429)
+            return web.json_response({"ok": True, "result": {
+                "message_id": len(calls), "date": 0, "chat": {"id": 7, "type": "private"}, "text": "hi"}})
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        bot = Bot(token="42:test", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+        sender = install_sender(bot, TelegramSender())
+        try:
+            with background_sends():
+                message = await bot.send_message(7, "hi")
+            assert message.message_id == 2
+            # Повтор только после retry_after
+            assert calls[1][1] - calls[0][1] >= 0.9
+            stats = sender.stats()
+            assert stats["sent"] == 1 and stats["retry_after"] == 1 and stats["failed"] == 0
+            assert stats["background"]["granted"] == 2
+        finally:
+            await sender.close()
+            await bot.session.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тест планировщика обновлений: порядок по пользователю, параллельность, отказы
+"""
+
+import asyncio
+
+from update_scheduler import UpdateScheduler
+
+
+def test_per_user_order_and_cross_user_concurrency():
+    async def run():
+        scheduler = UpdateScheduler(max_concurrency=4, max_pending=100, max_per_user=10)
+        scheduler.start()
+        log = []
+        running = {}
+        peak = [0]
+
+        def job(user_id, n):
+            async def process():
+                running[user_id] = running.get(user_id, 0) + 1
+                # Одновременно обрабатывается не больше одного обновления пользователя
+                assert running[user_id] == 1
+                peak[0] = max(peak[0], sum(running.values()))
+                await asyncio.sleep(0.01)
+                log.append((user_id, n))
+                running[user_id] -= 1
+            return process
+
+        for n in range(5):
+            for user_id in (1, 2, 3):
+                assert scheduler.submit(user_id, job(user_id, n))
+        await scheduler.close()
+
+        for user_id in (1, 2, 3):
+            assert [n for uid, n in log if uid == user_id] == list(range(5))
+        assert peak[0] == 3
+        stats = scheduler.stats()
+        assert stats["processed"] == 15 and stats["pending"] == 0 and stats["users_waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_shedding_and_backpressure():
+    async def run():
+        scheduler = UpdateScheduler(max_concurrency=1, max_pending=3, max_per_user=2)
+        release = asyncio.Event()
+        done = []
+
+        def job(n):
+            async def process():
+                await release.wait()
+                done.append(n)
+            return process
+
+        # Флуд одного пользователя: сверх max_per_user ожидающих отбрасывается
+        assert scheduler.submit(1, job(1))
+        assert scheduler.submit(1, job(2))
+        assert not scheduler.submit(1, job(3))
+        # Общая очередь полна
+        assert scheduler.submit(2, job(4))
+        assert not scheduler.submit(3, job(5))
+        assert scheduler.stats()["shed_user"] == 1 and scheduler.stats()["shed_full"] == 1
+
+        # put ждет, пока воркер не заберет обновление из очереди
+        waiter = asyncio.create_task(scheduler.put(3, job(6)))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        scheduler.start()
+        assert await asyncio.wait_for(waiter, 1)
+
+        release.set()
+        await scheduler.close()
+        assert done[0] == 1 and sorted(done) == [1, 2, 4, 6]
+
+    asyncio.run(run())
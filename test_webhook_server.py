@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Тест webhook-сервера бота с локальным поддельным Telegram
+"""
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from webhook_server import WebhookServer, SECRET_HEADER
+from update_scheduler import UpdateScheduler
+
+WEBHOOK_PORT = 18094
+
+
+async def start_fake_telegram(calls):
+    async def handler(request):
+        calls.append((request.match_info["method"], dict(await request.post())))
+        return web.json_response({"ok": True, "result": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def make_update(update_id):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi",
+        "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "u"},
+    }}
+
+
+def test_secret_queue_and_fast_ack():
+    async def run():
+        calls = []
+        telegram, telegram_url = await start_fake_telegram(calls)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(telegram_url))
+        bot = Bot(token="42:test", session=session)
+
+        handled = []
+        release = asyncio.Event()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def on_message(message: types.Message):
+            await release.wait()
+            handled.append(message.message_id)
+
+        server = WebhookServer(dp, bot, base_url="https://bot.example", host="127.0.0.1",
+                               port=WEBHOOK_PORT, secret="s3cret",
+                               scheduler=UpdateScheduler(max_concurrency=1, max_pending=2))
+        await server.start()
+        url = f"http://127.0.0.1:{WEBHOOK_PORT}{server.path}"
+        try:
+            # Webhook зарегистрирован с секретом
+            method, params = calls[0]
+            assert method == "setWebhook"
+            assert params["url"] == "https://bot.example/telegram/webhook"
+            assert params["secret_token"] == "s3cret"
+            # Накопленные обновления не отбрасываются при каждом запуске
+            assert params["drop_pending_updates"] == "false"
+
+            async with aiohttp.ClientSession() as client:
+                async with client.post(url, json=make_update(1), headers={SECRET_HEADER: "wrong"}) as response:
+                    assert response.status == 401
+
+                # Обработчик занят: ответ 200 приходит сразу, очередь вмещает 2 обновления
+                statuses = []
+                for update_id in range(2, 6):
+                    async with client.post(url, json=make_update(update_id),
+                                           headers={SECRET_HEADER: "s3cret"}) as response:
+                        statuses.append(response.status)
+                        await asyncio.sleep(0.05)
+                assert statuses == [200, 200, 200, 503]
+
+            release.set()
+            await asyncio.sleep(0.1)
+            assert handled == [2, 3, 4]
+
+            stats = server.stats()
+            assert stats["rejected"] == 1 and stats["queue_full"] == 1
+            assert stats["scheduler"]["processed"] == 3 and stats["scheduler"]["pending"] == 0
+        finally:
+            release.set()
+            await server.close()
+            await session.close()
+            await telegram.cleanup()
+
+    asyncio.run(run())
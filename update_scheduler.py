@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик обработки обновлений бота
+
+Обновления одного пользователя обрабатываются строго по очереди (нет гонок
+за состояние FSM, например при двойном нажатии "➡️ Дальше"), обновления
+разных пользователей - параллельно, но не больше UPDATE_MAX_CONCURRENCY
+одновременно. Медленный запрос к API задерживает только своего пользователя.
+
+Очередь ограничена: при переполнении webhook получает отказ (Telegram
+повторит доставку), polling ждет освобождения места. Пользователь, у которого
+накопилось больше UPDATE_MAX_PER_USER обновлений, теряет новые (флуд).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from aiogram import BaseMiddleware, types
+
+from metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно
+UPDATE_MAX_CONCURRENCY = int(os.getenv("UPDATE_MAX_CONCURRENCY", "32"))
+# Максимум ожидающих обработки обновлений всех пользователей
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))
+# Максимум ожидающих обновлений одного пользователя
+UPDATE_MAX_PER_USER = int(os.getenv("UPDATE_MAX_PER_USER", "10"))
+
+Job = Callable[[], Awaitable[Any]]
+
+
+def update_user_key(update: types.Update) -> Hashable:
+    """Ключ очереди: id пользователя, иначе обновление обрабатывается само по себе"""
+    user = getattr(update.event, "from_user", None)
+    if user is not None:
+        return user.id
+    return ("update", update.update_id)
+
+
+class UpdateScheduler:
+    """Очереди по пользователям и общий предел параллельной обработки"""
+
+    def __init__(self, max_concurrency: int = UPDATE_MAX_CONCURRENCY,
+                 max_pending: int = UPDATE_MAX_PENDING,
+                 max_per_user: int = UPDATE_MAX_PER_USER):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+
+        # Ожидающие задачи по ключу; ключ есть, пока у пользователя есть работа
+        self._queues: Dict[Hashable, Deque[tuple]] = {}
+        # Ключи пользователей, чью следующую задачу можно начинать
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._space = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._active = 0
+
+        # Статистика
+        self.submitted = 0
+        self.processed = 0
+        self.errors = 0
+        self.shed_full = 0
+        self.shed_user = 0
+        self.queue_wait = LatencyStats()
+        self.processing = LatencyStats()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def close(self, drain_timeout: float = 10):
+        """Дождаться обработки принятых обновлений и остановить воркеры"""
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._active) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending or self._active:
+            logger.warning(f"⚠️ Update scheduler stopped with {self._pending} pending updates")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def submit(self, key: Hashable, job: Job) -> bool:
+        """Поставить задачу в очередь пользователя; False - отброшена"""
+        if self._pending >= self.max_pending:
+            self.shed_full += 1
+            return False
+        return self._enqueue(key, job)
+
+    async def put(self, key: Hashable, job: Job) -> bool:
+        """Как submit, но при полной очереди ждет места (для polling)"""
+        async with self._space:
+            await self._space.wait_for(lambda: self._pending < self.max_pending)
+            return self._enqueue(key, job)
+
+    def _enqueue(self, key: Hashable, job: Job) -> bool:
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        elif len(queue) >= self.max_per_user:
+            self.shed_user += 1
+            return False
+
+        queue.append((job, time.perf_counter()))
+        self._pending += 1
+        self.submitted += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            job, queued_at = queue.popleft()
+            self._pending -= 1
+            self._active += 1
+            await self._notify_space()
+
+            started = time.perf_counter()
+            self.queue_wait.observe(started - queued_at)
+            try:
+                await job()
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error processing update for {key}: {e}")
+            finally:
+                self.processing.observe(time.perf_counter() - started)
+                self._active -= 1
+                # Следующее обновление пользователя - в конец общей очереди,
+                # чтобы активный пользователь не занимал воркер подряд
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
+
+    async def _notify_space(self):
+        async with self._space:
+            self._space.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._pending,
+            "active": self._active,
+            "users_waiting": len(self._queues),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "errors": self.errors,
+            "shed_full": self.shed_full,
+            "shed_user": self.shed_user,
+            "queue_wait": self.queue_wait.snapshot(),
+            "processing": self.processing.snapshot(),
+        }
+
+
+class SchedulingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware dp.update для polling: обработка уходит в планировщик
+
+    Polling запускается с handle_as_tasks=False, поэтому при полной очереди
+    он не запрашивает новые обновления, пока место не освободится.
+    """
+
+    def __init__(self, scheduler: UpdateScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[types.User] = data.get("event_from_user")
+        key = user.id if user is not None else ("update", event.update_id)
+        await self.scheduler.put(key, lambda: handler(event, data))
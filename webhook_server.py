@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Прием обновлений Telegram через webhook (aiohttp) вместо long polling
+
+Telegram присылает обновление POST-запросом; сервер проверяет секретный
+токен, передает обновление планировщику (update_scheduler) и сразу отвечает 200.
+Если очередь планировщика полна, сервер отвечает 503 - Telegram повторит
+доставку позже, обновление не теряется.
+Несколько экземпляров бота могут стоять за одним адресом (балансировщик).
+"""
+
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+from update_scheduler import UpdateScheduler, update_user_key
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес, на который Telegram шлет обновления (https://example.com)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (по умолчанию - из токена бота)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Отбросить накопленные в Telegram обновления при регистрации webhook (только для первого
+# развертывания: при перезапуске или раскатке экземпляров сообщения пользователей потеряются)
+WEBHOOK_DROP_PENDING_UPDATES = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def default_secret(bot_token: str) -> str:
+    """Секрет, одинаковый у всех экземпляров бота с этим токеном"""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class WebhookServer:
+    """aiohttp-сервер webhook с проверкой секрета и очередью обновлений"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot,
+                 base_url: str = WEBHOOK_BASE_URL,
+                 path: str = WEBHOOK_PATH,
+                 host: str = WEBHOOK_HOST,
+                 port: int = WEBHOOK_PORT,
+                 secret: str = WEBHOOK_SECRET,
+                 drop_pending_updates: bool = WEBHOOK_DROP_PENDING_UPDATES,
+                 scheduler: Optional[UpdateScheduler] = None):
+        self.dp = dp
+        self.bot = bot
+        self.base_url = base_url.rstrip("/")
+        self.path = path
+        self.host = host
+        self.port = port
+        self.secret = secret or default_secret(bot.token)
+        self.drop_pending_updates = drop_pending_updates
+        self.scheduler = scheduler or UpdateScheduler()
+        self._runner: Optional[web.AppRunner] = None
+
+        # Статистика
+        self.received = 0
+        self.rejected = 0
+        self.queue_full = 0
+
+    @property
+    def webhook_url(self) -> str:
+        return f"{self.base_url}{self.path}"
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        return app
+
+    async def start(self, set_webhook: bool = True):
+        """Запустить планировщик и сервер, зарегистрировать webhook в Telegram"""
+        self.scheduler.start()
+
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+        if set_webhook:
+            if not self.base_url:
+                raise RuntimeError("WEBHOOK_BASE_URL is not set")
+            await self.bot.set_webhook(
+                self.webhook_url,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types(),
+                drop_pending_updates=self.drop_pending_updates
+            )
+        logger.info(f"🪝 Webhook server listening on {self.host}:{self.port}{self.path}, "
+                    f"queue={self.scheduler.max_pending}, concurrency={self.scheduler.max_concurrency}")
+
+    async def close(self, drain_timeout: float = 10):
+        """
+        Перестать принимать обновления и обработать уже принятые
+
+        Webhook в Telegram не удаляется: другие экземпляры продолжают работать.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.scheduler.close(drain_timeout)
+        logger.info(f"🔌 Webhook server stopped: {self.stats()}")
+
+    async def run(self):
+        """Работать до отмены (вместо dp.start_polling)"""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.close()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=401)
+
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"⚠️ Bad webhook payload: {e}")
+            self.rejected += 1
+            return web.Response(status=400)
+
+        if not self.scheduler.submit(update_user_key(update), lambda: self.dp.feed_update(self.bot, update)):
+            # Telegram повторит доставку - так очередь не растет без границ.
+            # Флуд одного пользователя тоже получает 503 и ждет своей очереди
+            self.queue_full += 1
+            return web.Response(status=503)
+
+        self.received += 1
+        return web.Response()
+
+    def stats(self) -> Dict:
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "queue_full": self.queue_full,
+            "scheduler": self.scheduler.stats(),
+        }